@@ -1,10 +1,24 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import BaseModel, Field
+from typing import Literal
 
 class MarkerSettings(BaseModel):
     """Настройки для движка Marker"""
     output_format: str = "json" # <-- Всегда используем JSON!
     force_ocr: bool = False
+    # Режим OCR: "auto" — решение принимается постранично по текстовому слою,
+    # "force" — OCR всех страниц, "off" — без принудительного OCR.
+    # force_ocr=True эквивалентен "force" и оставлен для совместимости
+    ocr_mode: Literal["auto", "force", "off"] = "auto"
+    # Пороги для режима "auto": страница без OCR должна иметь не меньше
+    # ocr_min_chars символов, плотность не ниже ocr_min_density
+    # (символов на 1000 pt²) и долю «нормальных» символов не ниже ocr_min_quality
+    ocr_min_chars: int = 50
+    ocr_min_density: float = 0.2
+    ocr_min_quality: float = 0.8
+    # Marker запускается кусками по столько страниц: между кусками
+    # проверяются отмена и дедлайн задачи
+    pages_per_run: int = 32
     use_llm: bool = False
     # Добавьте другие важные для вас флаги из документации Marker
     # Например, для подключения к Ollama или Gemini
@@ -13,20 +27,188 @@ class MarkerSettings(BaseModel):
     ollama_base_url: str | None = "http://localhost:11434"
 
 
+class PersistenceSettings(BaseModel):
+    """Настройки стадии SAVING: запись строк и загрузка изображений в MinIO"""
+    # Сколько изображений одновременно грузим в MinIO
+    upload_concurrency: int = 8
+    # Крупные объекты (больше порога) грузятся через отдельный, более узкий семафор,
+    # чтобы несколько тяжелых картинок не забивали все соединения
+    large_object_threshold: int = 5 * 1024 * 1024
+    large_upload_concurrency: int = 2
+    max_retries: int = 3
+    retry_backoff: float = 0.5
+    # Строки пишутся через COPY во временную таблицу и заменяются одной короткой транзакцией.
+    # false — одним вызовом DataClient.save_document_lines (один INSERT со всеми строками)
+    bulk_lines: bool = True
+    # Сколько строк уходит в PostgreSQL одной командой COPY
+    lines_batch_size: int = 5000
+    lines_table: str = "document_lines"
+    copy_pool_size: int = 4
+
+
+class SchedulerSettings(BaseModel):
+    """Настройки планировщика задач парсинга"""
+    # Число одновременно выполняемых задач в каждой полосе
+    # Несколько тяжелых задач одновременно позволяют объединять инференс Marker в общие батчи
+    heavy_workers: int = 2
+    light_workers: int = 4
+    # Задачи с оценкой стоимости выше порога уходят в тяжелую полосу,
+    # даже если формат «легкий» (например, txt на несколько ГБ)
+    heavy_cost_threshold: float = 60.0
+    # Старение очереди: задача уступает более дешевым не дольше cost * cost_wait_s секунд
+    # и не дольше starvation_s, после чего ее не обгоняет ни одна новая задача того же приоритета
+    cost_wait_s: float = 1.0
+    starvation_s: float = 120.0
+    # /probe скачивает файл целиком в процесс API (DataClient не читает диапазоны байт).
+    # Файлы крупнее лимита не скачиваются: оценка только по размеру и расширению
+    probe_max_mb: float = 100.0
+    # Сколько файлов /probe скачивает одновременно
+    probe_concurrency: int = 2
+
+
+class TextSettings(BaseModel):
+    """Настройки потокового чтения текстовых файлов"""
+    # Сколько байт читаем за раз при декодировании
+    chunk_size: int = 1024 * 1024
+    # По скольким первым байтам определяем кодировку
+    sniff_bytes: int = 64 * 1024
+    # Строки длиннее лимита режутся на части (None — без ограничения)
+    max_line_length: int | None = None
+    # Схлопывать подряд идущие пустые строки в одну
+    collapse_blank_lines: bool = False
+
+
+class InferenceSettings(BaseModel):
+    """Общий планировщик инференса моделей Marker для параллельных документов"""
+    enabled: bool = True
+    # Модели из create_model_dict(), вызовы которых объединяются в общие батчи
+    batched_models: list[str] = ["layout_model", "detection_model", "recognition_model", "table_rec_model"]
+    # Размер объединенного батча (страниц/фрагментов). None — по устройству: cpu 8, cuda 64
+    batch_size: int | None = None
+    # Сколько ждать вызовов от других документов, прежде чем запустить неполный батч
+    max_wait_ms: float = 25.0
+
+
+class ArtefactSettings(BaseModel):
+    """Колоночный артефакт результата (Arrow IPC) в MinIO"""
+    enabled: bool = True
+    # Без сжатия ("none") файл читается без копирования (memory map), но весит больше
+    compression: Literal["zstd", "lz4", "none"] = "zstd"
+
+
+class ArchiveSettings(BaseModel):
+    """Ограничения при разборе архивов (zip/tar/7z)"""
+    # Сколько файлов архива разбираются параллельно
+    max_parallel_members: int = 4
+    max_members: int = 10_000
+    # Защита от zip-бомб: лимиты на распакованный размер
+    max_member_size: int = 512 * 1024 * 1024
+    max_total_size: int = 4 * 1024 * 1024 * 1024
+
+
+class LimitsSettings(BaseModel):
+    """Дедлайны задач и лимиты ресурсов парсеров"""
+    # Дедлайн по умолчанию (секунды); ParseRequest.timeout_s может его переопределить
+    default_timeout_s: float | None = 3600.0
+    # Парсеры без моделей (docx, xlsx) запускаются в отдельном процессе с лимитами ниже
+    isolate_parsers: bool = True
+    worker_memory_mb: int | None = 4096
+    worker_cpu_seconds: int | None = 1800
+
+
+class WorkerSettings(BaseModel):
+    """Настройки отдельной роли воркера (python -m src.worker)"""
+    # Сколько ждать завершения текущих задач после SIGTERM, прежде чем вернуть их в очередь
+    drain_timeout_s: float = 600.0
+    # Пауза между опросами пустой очереди
+    poll_interval_s: float = 0.5
+    # Воркер без heartbeat дольше этого считается погибшим, его задачи возвращаются в очередь
+    heartbeat_ttl_s: int = 30
+
+
+class CheckpointSettings(BaseModel):
+    """Контрольные точки долгих задач: указатели и прогресс в Redis, данные в MinIO"""
+    enabled: bool = True
+    # Сколько хранится контрольная точка незавершенной задачи (ключи Redis)
+    ttl_s: int = 24 * 3600
+    # Куски Marker и результат парсинга крупнее лимита (в байтах JSON) не сохраняются
+    max_entry_bytes: int = 256 * 1024 * 1024
+    # Результат парсинга сохраняется в MinIO, только когда повтор обошелся бы дорого:
+    # формат разбирается Marker-ом, файл крупный или парсинг шел долго.
+    # Описания изображений и прогресс SAVING (ключи Redis) сохраняются для всех задач
+    formats: list[str] = [".pdf", ".pptx"]
+    min_file_mb: float = 20.0
+    min_parse_s: float = 30.0
+
+
+class AdmissionSettings(BaseModel):
+    """Допуск задач к парсингу по бюджету памяти пода"""
+    enabled: bool = True
+    # Бюджет памяти на задачи, МБ. None — доля лимита контейнера (cgroup)
+    # за вычетом памяти, уже занятой процессом (модели)
+    budget_mb: int | None = None
+    budget_fraction: float = 0.85
+    # Запас сверх оценки пиковой памяти
+    headroom: float = 1.2
+    # Вес нового наблюдения при уточнении оценки формата (EWMA)
+    ewma_alpha: float = 0.3
+    # На сколько (доля) оценка формата может уменьшиться за одно наблюдение
+    max_step_down: float = 0.1
+    # Как часто перечитываются поправки, выученные другими воркерами
+    model_reload_s: float = 60.0
+    # Задача, ждущая дольше, больше не пропускает вперед более мелкие
+    starvation_s: float = 30.0
+
+
+class PostgresSettings(BaseModel):
+    """Подключение DataClient к PostgreSQL (POSTGRES_HOST, POSTGRES_PORT, ...)"""
+    host: str = "postgres"
+    port: int = 5432
+    user: str = "postgres"
+    password: str = "postgres"
+    db: str = "documents"
+
+
+class MinioSettings(BaseModel):
+    """Подключение DataClient к MinIO (MINIO_ENDPOINT, MINIO_PARSER_BUCKET)"""
+    endpoint: str = "minio:9000"
+    # Не MINIO_BUCKET: в .env он задан для всего стенда (documents),
+    # а парсер пишет и читает файлы в бакете corporate
+    parser_bucket: str = "corporate"
+
+
 class Settings(BaseSettings):
     """Читает переменные окружения из .env файла."""
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
     redis_url: str = "redis://localhost:6379/0"
+    # Роль процесса: "all" — API и парсинг в одном процессе,
+    # "api" — только HTTP (задачи идут в очередь Redis), "worker" — см. src/worker.py
+    role: str = "all"
+    torch_device: str = "cpu"
     # Настройки для LLM-сервиса описания изображений
     llm_image_api_url: str | None = None
     llm_image_api_key: str | None = None
     marker: MarkerSettings = Field(default_factory=MarkerSettings)
+    persistence: PersistenceSettings = Field(default_factory=PersistenceSettings)
+    scheduler: SchedulerSettings = Field(default_factory=SchedulerSettings)
+    text: TextSettings = Field(default_factory=TextSettings)
+    inference: InferenceSettings = Field(default_factory=InferenceSettings)
+    artefact: ArtefactSettings = Field(default_factory=ArtefactSettings)
+    archive: ArchiveSettings = Field(default_factory=ArchiveSettings)
+    limits: LimitsSettings = Field(default_factory=LimitsSettings)
+    worker: WorkerSettings = Field(default_factory=WorkerSettings)
+    checkpoint: CheckpointSettings = Field(default_factory=CheckpointSettings)
+    admission: AdmissionSettings = Field(default_factory=AdmissionSettings)
+    postgres: PostgresSettings = Field(default_factory=PostgresSettings)
+    minio: MinioSettings = Field(default_factory=MinioSettings)
     model_config = SettingsConfigDict(
         env_file=".env", 
         extra="ignore",
         # Позволяет задавать вложенные переменные окружения, например:
-        # MARKER_FORCE_OCR=true
-        env_nested_delimiter='_'
+        # MARKER_FORCE_OCR=true, WORKER_DRAIN_TIMEOUT_S=900.
+        # Делим только по первому "_": остаток — имя поля, даже если в нем есть "_"
+        env_nested_delimiter='_',
+        env_nested_max_split=1,
     )
 
     
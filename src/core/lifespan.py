@@ -1,29 +1,50 @@
 # src/core/lifespan.py
+from __future__ import annotations
+
 from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING
 from fastapi import FastAPI
-from sensory_data_client import create_data_client, get_settings, DataClientConfig, PostgresConfig, MinioConfig
-from ..adapters.llm_image import ImageDescriber
-from ..services.orchestrator import OrchestratorService
+from ..services.job_queue import RedisJobQueue
+from ..services.probe import PreflightProbe
 from .config import settings
 import redis.asyncio as aioredis
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    print("Initializing services...")
-    redis_client = aioredis.from_url(settings.redis_url, encoding="utf-8", decode_responses=True)
-    app.state.redis = redis_client
+if TYPE_CHECKING:
+    from ..services.orchestrator import OrchestratorService
+
+
+def create_redis():
+    return aioredis.from_url(settings.redis_url, encoding="utf-8", decode_responses=True)
+
+
+def create_data_client():
+    """Один экземпляр DataClient на процесс: нужен и воркеру, и проверке файлов в API-роли."""
+    from sensory_data_client import create_data_client, get_settings, DataClientConfig, PostgresConfig, MinioConfig
+
     # Создаем один экземпляр DataClient на все приложение
-    # Он сам должен подхватить свои настройки из env
-    
-    
-    data_client = create_data_client(DataClientConfig(postgres = PostgresConfig(user = "postgres",
-                                                            password = "postgres",
-                                                            host = "postgres",
-                                                            port=5432), 
-                                                minio = MinioConfig(endpoint="minio:9000",  bucket = "corporate")))
+    data_client = create_data_client(DataClientConfig(
+        postgres=PostgresConfig(
+            user=settings.postgres.user,
+            password=settings.postgres.password,
+            host=settings.postgres.host,
+            port=settings.postgres.port,
+        ),
+        minio=MinioConfig(endpoint=settings.minio.endpoint, bucket=settings.minio.parser_bucket),
+    ))
 
     print(get_settings())
-    
+    return data_client
+
+
+def create_orchestrator(redis_client, data_client=None, preload_models: bool = True) -> OrchestratorService:
+    """
+    Собирает оркестратор со всеми зависимостями. Нужен только роли, которая парсит.
+    preload_models=False откладывает загрузку моделей Marker до первого PDF.
+    """
+    # Импорты здесь: API-роль не должна тянуть Marker и torch
+    from ..adapters.llm_image import ImageDescriber
+    from ..services.orchestrator import OrchestratorService
+
     # Инициализируем адаптер для LLM
     llm_adapter = ImageDescriber(
         api_url=settings.llm_image_api_url, 
@@ -31,13 +52,43 @@ async def lifespan(app: FastAPI):
     ) if settings.llm_image_api_url else None
     
     # Внедряем зависимости в сервис-оркестратор
-    app.state.orchestrator = OrchestratorService(
-        data_client=data_client,
+    return OrchestratorService(
+        data_client=data_client or create_data_client(),
         llm=llm_adapter,
-        redis_client=redis_client # <-- Передаем клиент в сервис
+        redis_client=redis_client, # <-- Передаем клиент в сервис
+        preload_models=preload_models,
     )
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    print(f"Initializing services (role={settings.role})...")
+    # Зависимости, заранее положенные в app.state, не пересоздаются:
+    # так нагрузочный стенд (src/loadtest) подменяет Redis и хранилище локальными заглушками
+    redis_client = getattr(app.state, "redis", None) or create_redis()
+    app.state.redis = redis_client
+
+    data_client = getattr(app.state, "data_client", None) or create_data_client()
+    app.state.data_client = data_client
+    # Предварительная проверка файлов доступна в любой роли: модели ей не нужны
+    app.state.probe = PreflightProbe(data_client, redis_client)
+
+    if settings.role == "api":
+        # Тонкая API-роль: задачи уходят в очередь Redis, их забирают воркеры
+        app.state.scheduler = RedisJobQueue(redis_client)
+    else:
+        from ..services.scheduler import JobScheduler
+
+        app.state.orchestrator = create_orchestrator(
+            redis_client, data_client, preload_models=getattr(app.state, "preload_models", True)
+        )
+        app.state.scheduler = JobScheduler(app.state.orchestrator)
+        app.state.scheduler.start()
+
     yield
 
     print("Cleaning up resources...")
-    await app.state.redis.close()
\ No newline at end of file
+    if settings.role != "api":
+        await app.state.scheduler.stop()
+        await app.state.orchestrator.close()
+    await app.state.redis.close()
@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import multiprocessing
+import resource
+import signal
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Iterator
+from uuid import UUID
+
+if TYPE_CHECKING:
+    from ..services.checkpoint import JobCheckpoint
+
+
+class JobCancelled(Exception):
+    """Задача отменена по запросу (DELETE /parse/{doc_id})."""
+
+
+class JobDeadlineExceeded(Exception):
+    """Задача не уложилась в отведенное время."""
+
+
+class ResourceLimitExceeded(Exception):
+    """Парсер превысил лимит памяти или процессорного времени."""
+
+
+@dataclass
+class JobContext:
+    """Состояние выполняющейся задачи: дедлайн, флаг отмены и контрольная точка."""
+    doc_id: UUID
+    deadline: float | None = None  # time.monotonic()
+    cancelled: threading.Event = field(default_factory=threading.Event)
+    task: asyncio.Task | None = None
+    # Выставляется таймером дедлайна перед отменой задачи
+    expired: bool = False
+    # Появляется после скачивания файла (ключ зависит от хеша содержимого)
+    checkpoint: JobCheckpoint | None = None
+    # Пиковый RSS изолированных процессов парсера (ru_maxrss), МБ, и сколько их было запущено
+    peak_child_rss_mb: float = 0.0
+    child_runs: int = 0
+    # Длительность стадий конвейера, секунды
+    stage_timings: dict[str, float] = field(default_factory=dict)
+    _stage: str | None = field(default=None, init=False, repr=False)
+    _stage_started: float = field(default=0.0, init=False, repr=False)
+
+    def enter_stage(self, stage: str | None) -> None:
+        """Закрывает текущую стадию и начинает новую (None — только закрыть)."""
+        if stage == self._stage:
+            return
+        now = time.monotonic()
+        if self._stage is not None:
+            self.stage_timings[self._stage] = self.stage_timings.get(self._stage, 0.0) + now - self._stage_started
+        self._stage, self._stage_started = stage, now
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+
+    def expire(self) -> None:
+        """Дедлайн истек: прерывает задачу так же, как отмена, но помечает ее как просроченную."""
+        self.expired = True
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+
+    def remaining(self) -> float | None:
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    def check(self) -> None:
+        """Точка кооперативной отмены: парсеры вызывают ее между крупными шагами."""
+        if self.cancelled.is_set():
+            raise JobCancelled(f"Job {self.doc_id} was cancelled")
+        remaining = self.remaining()
+        if self.expired or (remaining is not None and remaining <= 0):
+            raise JobDeadlineExceeded(f"Job {self.doc_id} exceeded its deadline")
+
+
+_current_job: contextvars.ContextVar[JobContext | None] = contextvars.ContextVar("current_job", default=None)
+
+
+def current_job() -> JobContext | None:
+    return _current_job.get()
+
+
+def check_current() -> None:
+    """Проверяет отмену/дедлайн текущей задачи, если она есть."""
+    ctx = _current_job.get()
+    if ctx is not None:
+        ctx.check()
+
+
+@contextmanager
+def job_scope(ctx: JobContext) -> Iterator[JobContext]:
+    token = _current_job.set(ctx)
+    try:
+        yield ctx
+    finally:
+        _current_job.reset(token)
+
+
+# ---------------------------------------------------------------------
+# Изолированный запуск парсера в отдельном процессе с лимитами ресурсов
+# ---------------------------------------------------------------------
+def _isolated_entry(conn, parser, kwargs: dict, memory_mb: int | None, cpu_seconds: int | None) -> None:
+    if memory_mb:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    if cpu_seconds:
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds))
+    try:
+        result = asyncio.run(parser.parse(**kwargs))
+        conn.send(("ok", result, _peak_rss_kb()))
+    except MemoryError:
+        conn.send(("limit", f"memory limit of {memory_mb} MB exceeded", _peak_rss_kb()))
+    except Exception as e:
+        conn.send(("error", f"{type(e).__name__}: {e}", _peak_rss_kb()))
+    finally:
+        conn.close()
+
+
+def _peak_rss_kb() -> int:
+    # В Linux ru_maxrss — в килобайтах
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+async def run_isolated(
+    parser: Any,
+    kwargs: dict,
+    *,
+    memory_mb: int | None,
+    cpu_seconds: int | None,
+) -> Any:
+    """
+    Выполняет `parser.parse(**kwargs)` в дочернем процессе с RLIMIT_AS/RLIMIT_CPU.
+    При отмене задачи или истечении дедлайна процесс убивается — работа действительно прекращается.
+    """
+    mp = multiprocessing.get_context("forkserver")
+    parent_conn, child_conn = mp.Pipe(duplex=False)
+    proc = mp.Process(
+        target=_isolated_entry,
+        args=(child_conn, parser, kwargs, memory_mb, cpu_seconds),
+        daemon=True,
+    )
+    proc.start()
+    child_conn.close()
+    ctx = current_job()
+    if ctx is not None:
+        ctx.child_runs += 1
+    loop = asyncio.get_running_loop()
+    try:
+        check_current()
+        try:
+            # Ответ ждем в потоке: отмена задачи (по запросу или дедлайну) прерывает await,
+            # а процесс убивается в finally. Когда процесс умирает, recv получает EOF
+            kind, payload, peak_kb = await loop.run_in_executor(None, parent_conn.recv)
+        except EOFError:
+            # Процесс умер, не успев ответить
+            pass
+        else:
+            ctx = current_job()
+            if ctx is not None:
+                ctx.peak_child_rss_mb = max(ctx.peak_child_rss_mb, peak_kb / 1024)
+            if kind == "ok":
+                return payload
+            if kind == "limit":
+                raise ResourceLimitExceeded(payload)
+            raise RuntimeError(payload)
+
+        proc.join(timeout=1)
+        ctx = current_job()
+        if ctx is not None and memory_mb and proc.exitcode == -signal.SIGKILL:
+            # Убит OOM killer: процесс дошел как минимум до лимита — это тоже наблюдение для модели памяти
+            ctx.peak_child_rss_mb = max(ctx.peak_child_rss_mb, float(memory_mb))
+        # SIGXCPU/SIGKILL — ядро остановило процесс по лимиту
+        raise ResourceLimitExceeded(
+            f"Parser process terminated (exit code {proc.exitcode}); "
+            f"limits: memory={memory_mb} MB, cpu={cpu_seconds} s"
+        )
+    finally:
+        if proc.is_alive():
+            proc.kill()
+            proc.join(timeout=1)
+        parent_conn.close()
@@ -0,0 +1,142 @@
+"""
+Нагрузочный стенд: весь сервис в одном процессе, вместо MinIO/PostgreSQL — хранилище в памяти,
+вместо Redis — fakeredis (или локальный Redis), вместо LLM — локальный HTTP-сервер с задержкой.
+Сеть не нужна. Модели Marker загружаются, только если в смеси есть PDF или PPTX, — тогда они должны
+быть в локальном кеше.
+
+Пример:
+    python -m src.loadtest --concurrency 1,2,4,8,16 --jobs 200 --mix txt=4,docx=2,xlsx=2,png=1 \
+        --llm-latency-ms 400 --output loadtest.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+from pathlib import Path
+
+from ..core.config import settings
+from ..main import app
+from .corpus import build_corpus
+from .driver import LevelReport, LoadDriver, find_saturation
+from .fakes import InMemoryDataClient, MockLlmServer, create_redis
+
+
+def _int_list(value: str) -> list[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def _mix(value: str) -> dict[str, float]:
+    weights: dict[str, float] = {}
+    for item in value.split(","):
+        kind, _, weight = item.partition("=")
+        weights[kind.strip()] = float(weight or 1)
+    return weights
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m src.loadtest", description="Load test of the parsing service")
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 2, 4, 8, 16],
+                        help="Comma-separated levels of concurrent clients")
+    parser.add_argument("--jobs", type=int, default=100, help="Documents per level")
+    parser.add_argument("--mix", type=_mix, default=_mix("txt=4,md=1,py=1,docx=2,xlsx=2,png=1"),
+                        help="Document kinds and weights, e.g. txt=4,docx=2,pdf=1")
+    parser.add_argument("--sizes-kb", type=_int_list, default=[4, 64, 512],
+                        help="Sizes of synthetic documents, KB")
+    parser.add_argument("--corpus", type=Path, default=None,
+                        help="Directory with real files (kind = extension, e.g. pdf)")
+    parser.add_argument("--no-images", action="store_true", help="Send parse_images=false")
+    parser.add_argument("--llm-latency-ms", type=float, default=500.0)
+    parser.add_argument("--llm-jitter-ms", type=float, default=100.0)
+    parser.add_argument("--llm-concurrency", type=int, default=None,
+                        help="Max requests the mock LLM serves at once")
+    parser.add_argument("--storage-latency-ms", type=float, default=5.0,
+                        help="Latency of each fake MinIO/PostgreSQL call")
+    parser.add_argument("--redis-url", default=None, help="Use a real local Redis instead of fakeredis")
+    parser.add_argument("--poll-ms", type=float, default=50.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=None, help="Write JSON report here")
+    return parser.parse_args()
+
+
+def _fmt(value: float | None) -> str:
+    return "-" if value is None else f"{value:.2f}"
+
+
+def print_report(levels: list[LevelReport], saturation: int | None) -> None:
+    print()
+    print(f"{'conc':>5} {'jobs':>5} {'fail':>5} {'docs/s':>8} {'MB/s':>7} "
+          f"{'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'wait95':>7} {'queue':>6} {'rss MB':>7} {'cpu':>5}")
+    for lvl in levels:
+        print(
+            f"{lvl.concurrency:>5} {lvl.jobs:>5} {lvl.failures:>5} {lvl.throughput_docs_s:>8.2f} "
+            f"{lvl.throughput_mb_s:>7.2f} {_fmt(lvl.latency_s['p50']):>7} {_fmt(lvl.latency_s['p95']):>7} "
+            f"{_fmt(lvl.latency_s['p99']):>7} {_fmt(lvl.queue_wait_s['p95']):>7} "
+            f"{max(lvl.peak_queue.values(), default=0):>6} {lvl.peak_rss_mb:>7.0f} {lvl.cpu_utilisation:>5.0%}"
+        )
+    print()
+    for lvl in levels:
+        stages = ", ".join(
+            f"{stage} p50={_fmt(s['p50'])} p95={_fmt(s['p95'])}" for stage, s in lvl.stages_s.items()
+        )
+        print(f"[conc={lvl.concurrency}] {stages}")
+        for error in lvl.errors:
+            print(f"    error: {error}")
+    print()
+    if saturation is None:
+        print("Saturation not reached: throughput still grows at the highest level")
+    else:
+        print(f"Saturation at concurrency={saturation}: higher levels add latency, not throughput")
+
+
+async def main() -> None:
+    args = parse_args()
+
+    # Весь сервис в одном процессе: API и планировщик
+    settings.role = "all"
+    # Строки пишет InMemoryDataClient: настоящего PostgreSQL для COPY у стенда нет
+    settings.persistence.bulk_lines = False
+    llm = MockLlmServer(
+        latency_s=args.llm_latency_ms / 1000,
+        jitter_s=args.llm_jitter_ms / 1000,
+        max_concurrency=args.llm_concurrency,
+    )
+    settings.llm_image_api_url = await llm.start()
+    settings.llm_image_api_key = None
+
+    corpus = build_corpus(
+        list(args.mix), [kb * 1024 for kb in args.sizes_kb], seed=args.seed, corpus_dir=args.corpus
+    )
+    data_client = InMemoryDataClient(latency_s=args.storage_latency_ms / 1000)
+    # Модели Marker нужны только PDF и PPTX: без них в смеси стенд работает без сети
+    app.state.preload_models = any(kind in args.mix for kind in ("pdf", "pptx"))
+    driver = LoadDriver(
+        app, data_client, lambda: create_redis(args.redis_url), corpus, args.mix,
+        parse_images=not args.no_images,
+        poll_interval_s=args.poll_ms / 1000,
+        seed=args.seed,
+    )
+
+    levels: list[LevelReport] = []
+    try:
+        for concurrency in args.concurrency:
+            print(f"[LoadTest] concurrency={concurrency}, jobs={args.jobs}...")
+            levels.append(await driver.run_level(concurrency, args.jobs))
+    finally:
+        await llm.stop()
+
+    saturation = find_saturation(levels)
+    print_report(levels, saturation)
+    if args.output:
+        report = {
+            "args": {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()},
+            "llm_requests": llm.requests,
+            "saturation_concurrency": saturation,
+            "levels": [lvl.to_dict() for lvl in levels],
+        }
+        args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import random
+import struct
+import zipfile
+import zlib
+from dataclasses import dataclass
+from io import BytesIO
+from pathlib import Path
+from typing import Callable
+
+
+_WORDS = (
+    "договор акт услуга оплата срок сторона работа исполнитель заказчик счет "
+    "report invoice amount total service period contract delivery payment item"
+).split()
+
+
+@dataclass
+class Sample:
+    file_name: str
+    data: bytes
+    kind: str
+
+
+def _text(rng: random.Random, size: int) -> str:
+    parts: list[str] = []
+    written = 0
+    while written < size:
+        line = " ".join(rng.choice(_WORDS) for _ in range(rng.randint(4, 16)))
+        parts.append(line)
+        written += len(line.encode("utf-8")) + 1
+    return "\n".join(parts) + "\n"
+
+
+def make_txt(rng: random.Random, size: int) -> bytes:
+    return _text(rng, size).encode("utf-8")
+
+
+def make_md(rng: random.Random, size: int) -> bytes:
+    body = _text(rng, size).splitlines()
+    lines = [f"## Раздел {i}\n{line}" if i % 20 == 0 else line for i, line in enumerate(body)]
+    return "\n".join(lines).encode("utf-8")
+
+
+def make_py(rng: random.Random, size: int) -> bytes:
+    out: list[str] = []
+    written = 0
+    while written < size:
+        name = "_".join(rng.choice(_WORDS[10:]) for _ in range(2))
+        chunk = f"def {name}_{len(out)}(value):\n    return value * {rng.randint(1, 99)}\n\n"
+        out.append(chunk)
+        written += len(chunk)
+    return "".join(out).encode("utf-8")
+
+
+def make_png(rng: random.Random, size: int) -> bytes:
+    """Несжимаемый шум — размер PNG близок к запрошенному."""
+    side = max(8, int((size / 3) ** 0.5))
+    raw = b"".join(b"\x00" + rng.randbytes(side * 3) for _ in range(side))
+
+    def chunk(tag: bytes, payload: bytes) -> bytes:
+        return struct.pack(">I", len(payload)) + tag + payload + struct.pack(">I", zlib.crc32(tag + payload))
+
+    header = struct.pack(">IIBBBBB", side, side, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b"")
+
+
+def make_docx(rng: random.Random, size: int) -> bytes:
+    from docx import Document
+
+    doc = Document()
+    for line in _text(rng, size).splitlines():
+        doc.add_paragraph(line)
+    buf = BytesIO()
+    doc.save(buf)
+    return buf.getvalue()
+
+
+def make_xlsx(rng: random.Random, size: int) -> bytes:
+    from openpyxl import Workbook
+
+    wb = Workbook()
+    ws = wb.active
+    # ~40 байт исходных данных на строку
+    for i in range(max(1, size // 40)):
+        ws.append([i, rng.choice(_WORDS), rng.randint(0, 10**6), rng.random()])
+    buf = BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+def make_zip(rng: random.Random, size: int) -> bytes:
+    buf = BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for i in range(4):
+            zf.writestr(f"part_{i}.txt", make_txt(rng, size // 4))
+    return buf.getvalue()
+
+
+GENERATORS: dict[str, tuple[str, Callable[[random.Random, int], bytes]]] = {
+    "txt": (".txt", make_txt),
+    "md": (".md", make_md),
+    "py": (".py", make_py),
+    "png": (".png", make_png),
+    "docx": (".docx", make_docx),
+    "xlsx": (".xlsx", make_xlsx),
+    "zip": (".zip", make_zip),
+}
+
+
+def build_corpus(
+    kinds: list[str],
+    sizes: list[int],
+    *,
+    seed: int = 0,
+    corpus_dir: Path | None = None,
+) -> dict[str, list[Sample]]:
+    """
+    Набор документов по видам: синтетические файлы заданных размеров и,
+    если указан corpus_dir, реальные файлы оттуда (вид — расширение, например "pdf").
+    """
+    rng = random.Random(seed)
+    corpus: dict[str, list[Sample]] = {}
+    for kind in kinds:
+        if kind not in GENERATORS:
+            continue
+        ext, generate = GENERATORS[kind]
+        try:
+            corpus[kind] = [Sample(f"{kind}_{size}{ext}", generate(rng, size), kind) for size in sizes]
+        except ImportError as e:
+            print(f"[LoadTest] Skipping '{kind}': {e}")
+
+    if corpus_dir is not None:
+        for path in sorted(p for p in corpus_dir.rglob("*") if p.is_file()):
+            kind = path.suffix.lower().lstrip(".") or "bin"
+            corpus.setdefault(kind, []).append(Sample(path.name, path.read_bytes(), kind))
+    return corpus
@@ -0,0 +1,250 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import os
+import random
+import time
+from dataclasses import asdict, dataclass, field
+from uuid import uuid4
+
+import httpx
+from fastapi import FastAPI
+
+from ..core.lifespan import lifespan
+from .corpus import Sample
+from .fakes import InMemoryDataClient
+
+
+_TERMINAL = {"SUCCESS", "FAILURE"}
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    """Перцентиль по ближайшему рангу (q от 0 до 100)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), math.ceil(q / 100 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def summarize(values: list[float]) -> dict[str, float | None]:
+    return {
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None,
+    }
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        return 0
+
+
+@dataclass
+class JobRecord:
+    kind: str
+    size: int
+    status: str
+    latency_s: float
+    queue_wait_s: float
+    timings: dict[str, float] = field(default_factory=dict)
+    error: str | None = None
+
+
+@dataclass
+class LevelReport:
+    concurrency: int
+    jobs: int
+    failures: int
+    wall_s: float
+    throughput_docs_s: float
+    throughput_mb_s: float
+    latency_s: dict
+    queue_wait_s: dict
+    stages_s: dict[str, dict]
+    by_kind_latency_s: dict[str, dict]
+    peak_queue: dict[str, int]
+    peak_rss_mb: float
+    cpu_utilisation: float
+    errors: list[str]
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class _Sampler:
+    """Фоновый сбор признаков насыщения: глубина очередей, RSS, загрузка CPU."""
+
+    def __init__(self, app: FastAPI, interval_s: float = 0.25):
+        self._app = app
+        self._interval_s = interval_s
+        self.peak_queue: dict[str, int] = {}
+        self.peak_rss = 0
+        self._task: asyncio.Task | None = None
+        self._cpu_start = 0.0
+        self._wall_start = 0.0
+
+    async def _run(self) -> None:
+        while True:
+            scheduler = self._app.state.scheduler
+            sizes = scheduler.queue_sizes() if hasattr(scheduler, "queue_sizes") else await scheduler.sizes()
+            for lane, size in sizes.items():
+                self.peak_queue[lane] = max(self.peak_queue.get(lane, 0), size)
+            self.peak_rss = max(self.peak_rss, _rss_bytes())
+            await asyncio.sleep(self._interval_s)
+
+    def start(self) -> None:
+        times = os.times()
+        self._cpu_start = times.user + times.system + times.children_user + times.children_system
+        self._wall_start = time.monotonic()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> float:
+        """Останавливает сбор и возвращает среднюю загрузку CPU (доля всех ядер)."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        times = os.times()
+        cpu = times.user + times.system + times.children_user + times.children_system - self._cpu_start
+        wall = max(time.monotonic() - self._wall_start, 1e-9)
+        return cpu / wall / (os.cpu_count() or 1)
+
+
+class LoadDriver:
+    """
+    Гоняет HTTP API сервиса в процессе (httpx + ASGITransport) с фиксированным числом
+    одновременных клиентов: каждый клиент отправляет документ и опрашивает статус до завершения.
+    """
+
+    def __init__(
+        self,
+        app: FastAPI,
+        data_client: InMemoryDataClient,
+        redis_factory,
+        corpus: dict[str, list[Sample]],
+        weights: dict[str, float],
+        *,
+        parse_images: bool = True,
+        poll_interval_s: float = 0.05,
+        job_timeout_s: float = 600.0,
+        seed: int = 0,
+    ):
+        self._app = app
+        self._data_client = data_client
+        self._redis_factory = redis_factory
+        self._corpus = corpus
+        self._kinds = [k for k in weights if corpus.get(k)]
+        self._weights = [weights[k] for k in self._kinds]
+        if not self._kinds:
+            raise ValueError("Corpus is empty for the requested mix")
+        self._parse_images = parse_images
+        self._poll_interval_s = poll_interval_s
+        self._job_timeout_s = job_timeout_s
+        self._rng = random.Random(seed)
+
+    def _pick(self) -> Sample:
+        kind = self._rng.choices(self._kinds, self._weights)[0]
+        return self._rng.choice(self._corpus[kind])
+
+    async def _run_job(self, client: httpx.AsyncClient, sample: Sample) -> JobRecord:
+        doc_id = uuid4()
+        self._data_client.add_document(doc_id, sample.data)
+        started = time.monotonic()
+        dequeued: float | None = None
+
+        response = await client.post(
+            f"/parse/{doc_id}", json={"file_name": sample.file_name, "parse_images": self._parse_images}
+        )
+        response.raise_for_status()
+        while True:
+            await asyncio.sleep(self._poll_interval_s)
+            status = (await client.get(f"/parse/status/{doc_id}")).json()
+            now = time.monotonic()
+            if dequeued is None and status.get("stage") != "QUEUED":
+                dequeued = now
+            if status["status"] in _TERMINAL:
+                break
+            if now - started > self._job_timeout_s:
+                status = {"status": "FAILURE", "error": "load test client timeout"}
+                break
+
+        result = status.get("result") or {}
+        # Документ больше не нужен — не раздуваем память стенда
+        self._data_client.documents.pop(doc_id, None)
+        return JobRecord(
+            kind=sample.kind,
+            size=len(sample.data),
+            status=status["status"],
+            latency_s=now - started,
+            queue_wait_s=(dequeued or now) - started,
+            timings=result.get("timings", {}),
+            error=status.get("error"),
+        )
+
+    async def run_level(self, concurrency: int, jobs: int) -> LevelReport:
+        """Один прогон: jobs документов, не больше concurrency одновременно в работе."""
+        # Каждый уровень — с чистым состоянием сервиса (свежий lifespan, пустые очереди)
+        self._app.state.redis = self._redis_factory()
+        self._app.state.data_client = self._data_client
+        self._data_client.reset()
+
+        records: list[JobRecord] = []
+        remaining = jobs
+
+        async with lifespan(self._app):
+            sampler = _Sampler(self._app)
+            transport = httpx.ASGITransport(app=self._app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=60) as client:
+
+                async def virtual_client() -> None:
+                    nonlocal remaining
+                    while remaining > 0:
+                        remaining -= 1
+                        records.append(await self._run_job(client, self._pick()))
+
+                sampler.start()
+                started = time.monotonic()
+                await asyncio.gather(*(virtual_client() for _ in range(concurrency)))
+                wall = time.monotonic() - started
+                cpu = await sampler.stop()
+
+        ok = [r for r in records if r.status == "SUCCESS"]
+        stages = sorted({stage for r in ok for stage in r.timings})
+        return LevelReport(
+            concurrency=concurrency,
+            jobs=len(records),
+            failures=len(records) - len(ok),
+            wall_s=round(wall, 3),
+            throughput_docs_s=len(ok) / wall if wall else 0.0,
+            throughput_mb_s=sum(r.size for r in ok) / wall / (1024 * 1024) if wall else 0.0,
+            latency_s=summarize([r.latency_s for r in ok]),
+            queue_wait_s=summarize([r.queue_wait_s for r in ok]),
+            stages_s={stage: summarize([r.timings[stage] for r in ok if stage in r.timings]) for stage in stages},
+            by_kind_latency_s={
+                kind: summarize([r.latency_s for r in ok if r.kind == kind]) for kind in sorted({r.kind for r in ok})
+            },
+            peak_queue=sampler.peak_queue,
+            peak_rss_mb=sampler.peak_rss / (1024 * 1024),
+            cpu_utilisation=cpu,
+            errors=sorted({r.error for r in records if r.error})[:20],
+        )
+
+
+def find_saturation(levels: list[LevelReport], min_gain: float = 0.1) -> int | None:
+    """
+    Уровень конкурентности, после которого пропускная способность почти не растет
+    (прирост меньше min_gain), а задержки — растут. None — насыщение не достигнуто.
+    """
+    for prev, cur in zip(levels, levels[1:]):
+        if prev.throughput_docs_s <= 0:
+            continue
+        gain = cur.throughput_docs_s / prev.throughput_docs_s - 1
+        if gain < min_gain:
+            return prev.concurrency
+    return None
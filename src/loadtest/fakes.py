@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import random
+from uuid import UUID
+
+from aiohttp import web
+
+
+class InMemoryDataClient:
+    """
+    Заглушка DataClient: документы, строки и объекты MinIO в памяти процесса.
+    Задержки имитируют сетевые обращения к PostgreSQL и MinIO.
+    """
+
+    def __init__(self, *, latency_s: float = 0.0, jitter_s: float = 0.0):
+        self._latency_s = latency_s
+        self._jitter_s = jitter_s
+        self.documents: dict[UUID, bytes] = {}
+        self.objects: dict[str, bytes] = {}
+        self.lines: dict[UUID, list] = {}
+        # Как DataClient.minio: удаление объектов есть только у репозитория MinIO
+        self.minio = self
+
+    async def _delay(self) -> None:
+        delay = self._latency_s + random.uniform(0, self._jitter_s)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def add_document(self, doc_id: UUID, data: bytes) -> None:
+        self.documents[doc_id] = data
+
+    async def get_file(self, doc_id: UUID) -> bytes:
+        await self._delay()
+        return self.documents[doc_id]
+
+    async def put_object(self, key: str, data: bytes, content_type: str) -> None:
+        await self._delay()
+        self.objects[key] = bytes(data)
+
+    async def get_object(self, key: str) -> bytes:
+        await self._delay()
+        return self.objects[key]
+
+    async def remove_object(self, key: str) -> None:
+        await self._delay()
+        self.objects.pop(key, None)
+
+    async def save_document_lines(self, doc_id: UUID, lines: list) -> None:
+        await self._delay()
+        # Как и настоящий DataClient: строки документа заменяются целиком
+        self.lines[doc_id] = list(lines)
+
+    def reset(self) -> None:
+        self.documents.clear()
+        self.objects.clear()
+        self.lines.clear()
+
+
+class MockLlmServer:
+    """
+    Локальный HTTP-сервер вместо LLM описания изображений (контракт ImageDescriber).
+    Отвечает с заданной задержкой; max_concurrency имитирует ограниченную пропускную способность модели.
+    """
+
+    def __init__(
+        self,
+        *,
+        latency_s: float = 0.5,
+        jitter_s: float = 0.0,
+        max_concurrency: int | None = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self._latency_s = latency_s
+        self._jitter_s = jitter_s
+        self._sem = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        self._host = host
+        self._port = port
+        self._runner: web.AppRunner | None = None
+        self.requests = 0
+        self.url = ""
+
+    async def _describe(self, request: web.Request) -> web.Response:
+        await request.post()
+        self.requests += 1
+        if self._sem is not None:
+            async with self._sem:
+                await asyncio.sleep(self._latency_s + random.uniform(0, self._jitter_s))
+        else:
+            await asyncio.sleep(self._latency_s + random.uniform(0, self._jitter_s))
+        return web.Response(text=json.dumps({"description": "Synthetic image"}), content_type="application/json")
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_post("/describe", self._describe)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self._host, self._port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{self._host}:{port}/describe"
+        return self.url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def create_redis(url: str | None = None):
+    """
+    Redis для стенда: настоящий по url или fakeredis в памяти процесса.
+    Для роли all хватает fakeredis; очередь воркеров (Lua-скрипт) требует fakeredis[lua].
+    """
+    if url:
+        import redis.asyncio as aioredis
+
+        return aioredis.from_url(url, encoding="utf-8", decode_responses=True)
+    try:
+        from fakeredis import aioredis as fake_aioredis
+    except ImportError as e:
+        raise RuntimeError("fakeredis is not installed: pip install -r loadtest-requirements.txt or pass --redis-url") from e
+    return fake_aioredis.FakeRedis(decode_responses=True)
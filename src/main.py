@@ -1,10 +1,13 @@
 # src/main.py
 import json
 from uuid import UUID
-from fastapi import FastAPI, BackgroundTasks, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request
 from pydantic import BaseModel
 from .core.lifespan import lifespan
-from .services.orchestrator import OrchestratorService
+from .models import ProbeResult
+from .services.job_queue import RedisJobQueue
+from .services.probe import PreflightProbe, load_probe
+from .services.scheduler import JobScheduler
 
 app = FastAPI(
     title="Document Parser Service",
@@ -15,7 +18,19 @@ app = FastAPI(
 class ParseRequest(BaseModel):
     file_name: str
     parse_images: bool = True
+    # Чем больше, тем раньше задача будет взята в работу
+    priority: int = 0
+    # Необязательные подсказки для оценки стоимости задачи
+    file_size: int | None = None
+    page_count: int | None = None
+    # Дедлайн задачи в секундах (по умолчанию — из настроек сервиса)
+    timeout_s: float | None = None
     
+class ProbeRequest(BaseModel):
+    file_name: str
+    # Размер файла, если известен: крупный файл проверяется без скачивания
+    file_size: int | None = None
+
 class StatusResponse(BaseModel):
     doc_id: UUID
     status: str  # PENDING, IN_PROGRESS, SUCCESS, FAILURE
@@ -23,29 +38,48 @@ class StatusResponse(BaseModel):
     progress: float | None = None # Число от 0.0 до 1.0
     error: str | None = None
     result: dict | None = None
+    details: dict | None = None  # Например, прогресс по файлам архива
 
 
 @app.post("/parse/{doc_id}", status_code=202, response_model=StatusResponse)
-async def start_parsing(doc_id: UUID, request_data: ParseRequest, r: Request, background_tasks: BackgroundTasks):
+async def start_parsing(doc_id: UUID, request_data: ParseRequest, r: Request):
     """
     Принимает запрос на парсинг, создает задачу и немедленно возвращает ее текущий статус.
     """
-    orchestrator: OrchestratorService = r.app.state.orchestrator
+    scheduler: JobScheduler | RedisJobQueue = r.app.state.scheduler
     redis_client = r.app.state.redis
 
     # Устанавливаем первоначальный статус PENDING
     initial_status = {"status": "PENDING", "stage": "QUEUED", "progress": 0.0}
     await redis_client.set(f"parsing_status:{doc_id}", json.dumps(initial_status), ex=3600)
 
-    background_tasks.add_task(
-        orchestrator.process_document,
+    # Если документ уже проверялся через /probe, стоимость и полоса считаются по результату проверки
+    probe = await load_probe(redis_client, doc_id)
+    if probe is not None and probe.file_name != request_data.file_name:
+        probe = None
+
+    await scheduler.submit(
         doc_id=doc_id,
         file_name=request_data.file_name,
-        parse_images=request_data.parse_images
+        parse_images=request_data.parse_images,
+        priority=request_data.priority,
+        file_size=request_data.file_size,
+        page_count=request_data.page_count,
+        timeout_s=request_data.timeout_s,
+        probe=probe,
     )
     
     return StatusResponse(doc_id=doc_id, status="PENDING", stage="QUEUED", progress=0.0)
 
+@app.post("/probe/{doc_id}", response_model=ProbeResult)
+async def probe_document(doc_id: UUID, request_data: ProbeRequest, r: Request):
+    """
+    Быстрая проверка документа без парсинга: настоящий формат, число страниц/листов/строк/изображений,
+    вероятность сканов и оценка стоимости. Результат учитывается при последующем POST /parse.
+    """
+    probe: PreflightProbe = r.app.state.probe
+    return await probe.probe(doc_id, request_data.file_name, request_data.file_size)
+
 @app.get("/parse/status/{doc_id}", response_model=StatusResponse)
 async def get_parsing_status(doc_id: UUID, r: Request):
     """Возвращает текущий статус задачи парсинга."""
@@ -58,6 +92,17 @@ async def get_parsing_status(doc_id: UUID, r: Request):
     status_data = json.loads(status_json)
     return StatusResponse(doc_id=doc_id, **status_data)
 
+@app.delete("/parse/{doc_id}", response_model=StatusResponse)
+async def cancel_parsing(doc_id: UUID, r: Request):
+    """Отменяет задачу парсинга: снимает с очереди или останавливает работу парсера."""
+    scheduler: JobScheduler | RedisJobQueue = r.app.state.scheduler
+    if not await scheduler.cancel(doc_id):
+        raise HTTPException(status_code=404, detail=f"No active parsing task for document {doc_id}.")
+
+    status_json = await r.app.state.redis.get(f"parsing_status:{doc_id}")
+    status_data = json.loads(status_json) if status_json else {"status": "IN_PROGRESS"}
+    return StatusResponse(doc_id=doc_id, **status_data)
+
 @app.get("/healthz", tags=["Monitoring"])
 def health_check():
     """Простая проверка работоспособности сервиса."""
@@ -1,4 +1,6 @@
+from typing import Iterator, Sequence, Union
 from pydantic import BaseModel, Field
+from pydantic_core import core_schema
 from uuid import UUID
 
 class ImageArtefact(BaseModel):
@@ -20,7 +22,90 @@ class Line(BaseModel):
     content: str
     block_id: str | None = None
 
+class TextLines(Sequence[Line]):
+    """
+    Строки большого текстового файла без объекта Line на каждую строку: текст хранится
+    блоками по BLOCK строк через "\n" (строки из splitlines его не содержат),
+    Line создается при обращении. Только для чтения: изменения полученных Line не сохраняются.
+    """
+    BLOCK = 4096
+
+    def __init__(self, block_type: str = "text"):
+        self.block_type = block_type
+        self._blocks: list[str] = []
+        self._pending: list[str] = []
+        self._size = 0
+
+    def append(self, content: str) -> None:
+        self._pending.append(content)
+        self._size += 1
+        if len(self._pending) == self.BLOCK:
+            self._blocks.append("\n".join(self._pending))
+            self._pending = []
+
+    def _block(self, idx: int) -> list[str]:
+        return self._blocks[idx].split("\n") if idx < len(self._blocks) else self._pending
+
+    def _line(self, line_no: int, content: str) -> Line:
+        return Line.model_construct(line_no=line_no, block_type=self.block_type, content=content)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(self._size))]
+        if idx < 0:
+            idx += self._size
+        if not 0 <= idx < self._size:
+            raise IndexError(idx)
+        return self._line(idx, self._block(idx // self.BLOCK)[idx % self.BLOCK])
+
+    def __iter__(self) -> Iterator[Line]:
+        for b in range(len(self._blocks) + 1):
+            for i, content in enumerate(self._block(b)):
+                yield self._line(b * self.BLOCK + i, content)
+
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source, handler):
+        # В модели хранится как есть; при сериализации (контрольные точки) — обычный список строк
+        return core_schema.is_instance_schema(
+            cls, serialization=core_schema.plain_serializer_function_ser_schema(
+                lambda lines: [line.model_dump() for line in lines]
+            ),
+        )
+
+class PageOcrReport(BaseModel):
+    # Решение об OCR для одной страницы PDF
+    page_idx: int
+    ocr: bool
+    reason: str
+    chars: int = 0
+    density: float = 0.0
+    quality: float = 0.0
+    # Доля времени конвертации, приходящаяся на страницу
+    seconds: float = 0.0
+
+class ProbeResult(BaseModel):
+    # Предварительная проверка файла: формат по содержимому и оценка объема работы
+    file_name: str
+    declared_format: str                 # расширение из имени файла
+    detected_format: str | None = None   # формат по сигнатуре (None — не распознан)
+    format: str                          # по какому формату будет выбран парсер
+    format_mismatch: bool = False
+    file_size: int
+    page_count: int | None = None        # страницы PDF/DOCX, слайды PPTX
+    sheet_count: int | None = None
+    row_count: int | None = None         # строки листов XLSX или текста
+    image_count: int | None = None
+    member_count: int | None = None      # файлы в zip-архиве
+    scanned_likely: bool = False         # вероятно, понадобится OCR
+    estimated_cost: float | None = None
+    lane: str | None = None
+    warnings: list[str] = []
+
 class ParseResult(BaseModel):
-    lines: list[Line]
+    lines: Union[list[Line], TextLines]
     images: list[ImageArtefact]
-    warnings: list[str] = []
\ No newline at end of file
+    warnings: list[str] = []
+    ocr_pages: list[PageOcrReport] = []
\ No newline at end of file
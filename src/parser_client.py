@@ -1,6 +1,7 @@
 # doc_parser_client.py
 import asyncio
 import httpx
+from typing import Awaitable, Callable
 from uuid import UUID, uuid4
 from pydantic import BaseModel, Field
 
@@ -8,6 +9,10 @@ from pydantic import BaseModel, Field
 class ParseRequest(BaseModel):
     file_name: str
     parse_images: bool = True
+    priority: int = 0
+    file_size: int | None = None
+    page_count: int | None = None
+    timeout_s: float | None = None
 
 class StatusResponse(BaseModel):
     doc_id: UUID
@@ -16,6 +21,7 @@ class StatusResponse(BaseModel):
     progress: float | None = None # Число от 0.0 до 1.0
     error: str | None = None
     result: dict | None = None
+    details: dict | None = None  # Например, прогресс по файлам архива
     
 class DocParserError(Exception):
     """Ошибка во время парсинга на удаленном сервисе."""
@@ -31,10 +37,26 @@ class DocParserClient:
         self.base_url = base_url
         self.timeout = timeout
 
-    async def start_parsing(self, doc_id: UUID, file_name: str, parse_images: bool = True) -> StatusResponse:
+    async def start_parsing(
+        self,
+        doc_id: UUID,
+        file_name: str,
+        parse_images: bool = True,
+        priority: int = 0,
+        file_size: int | None = None,
+        page_count: int | None = None,
+        timeout_s: float | None = None,
+    ) -> StatusResponse:
         """Отправляет задачу на парсинг и не ждет ее завершения."""
         async with httpx.AsyncClient() as client:
-            req = ParseRequest(file_name=file_name, parse_images=parse_images)
+            req = ParseRequest(
+                file_name=file_name,
+                parse_images=parse_images,
+                priority=priority,
+                file_size=file_size,
+                page_count=page_count,
+                timeout_s=timeout_s,
+            )
             response = await client.post(
                 f"{self.base_url}/parse/{doc_id}",
                 json=req.model_dump(),
@@ -43,6 +65,22 @@ class DocParserClient:
             response.raise_for_status()
             return StatusResponse.model_validate(response.json())
 
+    async def cancel(self, doc_id: UUID) -> StatusResponse:
+        """Отменяет задачу парсинга."""
+        async with httpx.AsyncClient() as client:
+            response = await client.delete(f"{self.base_url}/parse/{doc_id}", timeout=self.timeout)
+            response.raise_for_status()
+            return StatusResponse.model_validate(response.json())
+
+    async def probe(self, doc_id: UUID, file_name: str) -> dict:
+        """Быстрая проверка документа без парсинга: формат, размеры и оценка стоимости."""
+        async with httpx.AsyncClient() as client:
+            response = await client.post(
+                f"{self.base_url}/probe/{doc_id}", json={"file_name": file_name}, timeout=self.timeout
+            )
+            response.raise_for_status()
+            return response.json()
+
     async def get_status(self, doc_id: UUID) -> StatusResponse:
         """Получает текущий статус задачи."""
         async with httpx.AsyncClient() as client:
@@ -56,7 +94,8 @@ class DocParserClient:
         file_name: str,
         parse_images: bool = False,
         poll_interval: float = 2.0,
-        timeout: float = 300.0
+        timeout: float = 300.0,
+        priority: int = 0,
     ) -> dict:
         """
         Главный метод: отправляет задачу, ждет ее завершения и возвращает результат.
@@ -64,7 +103,7 @@ class DocParserClient:
         start_time = asyncio.get_event_loop().time()
         
         print(f"Client: Starting parsing for doc_id={doc_id}, file_name='{file_name}'...")
-        await self.start_parsing(doc_id, file_name, parse_images)
+        await self.start_parsing(doc_id, file_name, parse_images, priority=priority)
         
         while True:
             if asyncio.get_event_loop().time() - start_time > timeout:
@@ -85,6 +124,40 @@ class DocParserClient:
             if status_res.status == "FAILURE":
                 raise DocParserError(status_res.error, doc_id)
 
+    # --- Колоночные артефакты (Arrow IPC) ---
+    @staticmethod
+    def artefact_key(doc_id: UUID, kind: str = "lines") -> str:
+        """Ключ артефакта в MinIO. kind: "lines" или "images"."""
+        return f"{doc_id}/parsed/{kind}.arrow"
+
+    @staticmethod
+    def open_artefact(source: bytes | str):
+        """
+        Открывает артефакт как pyarrow.Table.
+        Путь к файлу читается через memory map, байты — через pa.py_buffer, без копирования
+        (если артефакт записан без сжатия; сжатые буферы распаковываются).
+        """
+        import pyarrow as pa  # нужен только потребителям артефактов
+
+        if isinstance(source, str):
+            reader = pa.ipc.open_file(pa.memory_map(source, "r"))
+        else:
+            reader = pa.ipc.open_file(pa.py_buffer(source))
+        return reader.read_all()
+
+    async def read_artefact(
+        self,
+        doc_id: UUID,
+        fetch: Callable[[str], Awaitable[bytes]],
+        kind: str = "lines",
+    ):
+        """
+        Скачивает артефакт через `fetch` (например, `data_client.get_object`)
+        и открывает его, не обращаясь к PostgreSQL.
+        """
+        data = await fetch(self.artefact_key(doc_id, kind))
+        return self.open_artefact(data)
+
 async def main():
     # Предполагается, что search-api загрузил файл в MinIO
     # и теперь запускает парсинг.
@@ -0,0 +1,334 @@
+from __future__ import annotations
+
+import asyncio
+import bz2
+import gzip
+import lzma
+import queue
+import tarfile
+import threading
+import zipfile
+from io import BytesIO
+from pathlib import PurePosixPath
+from uuid import UUID
+from typing import Awaitable, Callable, Iterator, List, Tuple
+
+from ..core.config import ArchiveSettings, settings
+from ..core.limits import check_current
+from ..models import ImageArtefact, Line, ParseResult
+from .base import BaseParser
+from .format_probe import detect_format, is_archive_member
+
+
+ARCHIVE_EXTENSIONS = {".zip", ".tar", ".tgz", ".gz", ".bz2", ".xz", ".7z"}
+
+# Сжатые потоки: внутри может быть tar, а может быть один файл (report.csv.gz)
+_COMPRESSED_STREAMS = [
+    (b"\x1f\x8b", gzip.open),
+    (b"BZh", bz2.open),
+    (b"\xfd7zXZ\x00", lzma.open),
+]
+
+RunParser = Callable[..., Awaitable[ParseResult]]
+
+# on_member(имя файла, сколько обработано, всего (None — пока неизвестно), ошибка или None)
+MemberCallback = Callable[[str, int, int | None, str | None], Awaitable[None]]
+
+
+class ArchiveLimitError(Exception):
+    """Архив превышает допустимые лимиты (число файлов, распакованный размер)."""
+
+
+class _ExtractionStopped(Exception):
+    """Разбор архива прерван — распаковку 7z больше не продолжаем."""
+
+
+class ArchiveParser(BaseParser):
+    """
+    Архивы zip/tar/7z. Файлы читаются по одному, без распаковки всего архива в память,
+    каждый разбирается парсером из общего реестра, результаты склеиваются в один документ.
+    """
+
+    def __init__(
+        self,
+        select_parser: Callable[[str, str | None], BaseParser],
+        config: ArchiveSettings | None = None,
+        run_parser: RunParser | None = None,
+    ):
+        self._select_parser = select_parser
+        # run_parser(parser, **kwargs) — как запускать парсер файла (например, в изолированном процессе)
+        self._run_parser = run_parser or (lambda parser, **kwargs: parser.parse(**kwargs))
+        self._cfg = config or settings.archive
+
+    async def parse(
+        self,
+        *,
+        doc_id: UUID,
+        file_content: BytesIO,
+        parse_images: bool = True,
+        on_member: MemberCallback | None = None,
+        file_name: str | None = None,
+    ) -> ParseResult:
+        members = self._iter_members(file_content, file_name)
+        total = self._count_members(file_content)
+        loop = asyncio.get_event_loop()
+        # Семафор ограничивает и число параллельных парсеров, и число прочитанных в память файлов
+        sem = asyncio.Semaphore(max(1, self._cfg.max_parallel_members))
+        results: dict[int, Tuple[str, ParseResult | None, str | None]] = {}
+        tasks: List[asyncio.Task] = []
+        done = 0
+        total_size = 0
+
+        async def parse_member(idx: int, name: str, data: bytes) -> None:
+            nonlocal done
+            error: str | None = None
+            result: ParseResult | None = None
+            try:
+                # Файлы внутри архивов тоже бывают с неверным расширением
+                parser = self._select_parser(name, detect_format(data))
+                if isinstance(parser, ArchiveParser):
+                    error = "nested archives are not supported"
+                else:
+                    result = await self._run_parser(
+                        parser, doc_id=doc_id, file_content=BytesIO(data), parse_images=parse_images
+                    )
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            finally:
+                sem.release()
+            results[idx] = (name, result, error)
+            done += 1
+            if on_member:
+                await on_member(name, done, total, error)
+
+        try:
+            idx = 0
+            while True:
+                await sem.acquire()
+                check_current()
+                item = await loop.run_in_executor(None, next, members, None)
+                if item is None:
+                    sem.release()
+                    break
+                name, data = item
+                total_size += len(data)
+                if idx >= self._cfg.max_members:
+                    raise ArchiveLimitError(f"Archive has more than {self._cfg.max_members} files")
+                if total_size > self._cfg.max_total_size:
+                    raise ArchiveLimitError(f"Archive unpacks to more than {self._cfg.max_total_size} bytes")
+                tasks.append(asyncio.create_task(parse_member(idx, name, data)))
+                idx += 1
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        finally:
+            try:
+                members.close()
+            except ValueError:
+                # Генератор еще выполняется в потоке executor-а (задачу отменили посреди чтения)
+                pass
+
+        return self._aggregate([results[i] for i in sorted(results)])
+
+    # -----------------------------------------------------------------
+    @staticmethod
+    def _aggregate(members: List[Tuple[str, ParseResult | None, str | None]]) -> ParseResult:
+        lines: List[Line] = []
+        images: List[ImageArtefact] = []
+        warnings: List[str] = []
+        for name, result, error in members:
+            lines.append(Line(line_no=len(lines), block_type="archive_member", content=f"## File: {name}"))
+            if error or result is None:
+                warnings.append(f"{name}: {error}")
+                continue
+            for line in result.lines:
+                lines.append(line.model_copy(update={"line_no": len(lines)}))
+            images.extend(result.images)
+            warnings.extend(f"{name}: {w}" for w in result.warnings)
+        return ParseResult(lines=lines, images=images, warnings=warnings)
+
+    # -----------------------------------------------------------------
+    def _count_members(self, file_content: BytesIO) -> int | None:
+        """Число файлов, если его можно узнать без чтения архива (оглавление zip)."""
+        file_content.seek(0)
+        if zipfile.is_zipfile(file_content):
+            with zipfile.ZipFile(file_content) as zf:
+                return sum(1 for info in zf.infolist() if is_archive_member(info.filename, info.is_dir()))
+        return None
+
+    def _iter_members(self, file_content: BytesIO, file_name: str | None = None) -> Iterator[Tuple[str, bytes]]:
+        file_content.seek(0)
+        if zipfile.is_zipfile(file_content):
+            return self._iter_zip(file_content)
+        file_content.seek(0)
+        head = file_content.read(6)
+        if head == b"7z\xbc\xaf\x27\x1c":
+            return self._iter_7z(file_content)
+        for magic, opener in _COMPRESSED_STREAMS:
+            if head.startswith(magic) and not self._is_compressed_tar(file_content, opener):
+                return self._iter_single(file_content, opener, file_name)
+        file_content.seek(0)
+        return self._iter_tar(file_content)
+
+    @staticmethod
+    def _is_compressed_tar(file_content: BytesIO, opener) -> bool:
+        """Распаковывает первый блок потока и проверяет, что это заголовок tar."""
+        file_content.seek(0)
+        with opener(file_content) as stream:
+            block = stream.read(tarfile.BLOCKSIZE)
+        try:
+            tarfile.TarInfo.frombuf(block, tarfile.ENCODING, "surrogateescape")
+        except tarfile.EOFHeaderError:
+            return True  # пустой tar: блок из нулей
+        except tarfile.HeaderError:
+            return False
+        return True
+
+    def _iter_single(self, file_content: BytesIO, opener, file_name: str | None) -> Iterator[Tuple[str, bytes]]:
+        # Имя файла внутри — имя архива без суффикса сжатия: report.csv.gz -> report.csv
+        name = PurePosixPath(file_name).stem if file_name else ""
+        name = name or "document"
+        file_content.seek(0)
+        with opener(file_content) as stream:
+            data = stream.read(self._cfg.max_member_size + 1)
+        self._check_size(name, len(data))
+        yield name, data
+
+    def _iter_zip(self, file_content: BytesIO) -> Iterator[Tuple[str, bytes]]:
+        file_content.seek(0)
+        with zipfile.ZipFile(file_content) as zf:
+            for info in zf.infolist():
+                name = self._zip_name(info)
+                if not is_archive_member(name, info.is_dir()):
+                    continue
+                self._check_size(name, info.file_size)
+                with zf.open(info) as member:
+                    # Размер в заголовке может врать — читаем не больше лимита
+                    data = member.read(self._cfg.max_member_size + 1)
+                self._check_size(name, len(data))
+                yield name, data
+
+    def _iter_tar(self, file_content: BytesIO) -> Iterator[Tuple[str, bytes]]:
+        file_content.seek(0)
+        # "r|*" — потоковый режим: архив (в т.ч. .tar.gz) читается последовательно
+        with tarfile.open(fileobj=file_content, mode="r|*") as tf:
+            for info in tf:
+                if not info.isfile() or not is_archive_member(info.name, False):
+                    continue
+                self._check_size(info.name, info.size)
+                member = tf.extractfile(info)
+                if member is None:
+                    continue
+                yield info.name, member.read()
+
+    def _iter_7z(self, file_content: BytesIO) -> Iterator[Tuple[str, bytes]]:
+        try:
+            import py7zr
+            from py7zr.io import Py7zIO, WriterFactory
+        except ImportError as e:
+            raise RuntimeError("7z archives require the 'py7zr' package (>= 1.0)") from e
+
+        cfg = self._cfg
+        # Распакованный файл передается разбору через очередь на одно место: py7zr ждет,
+        # пока его заберут, поэтому в памяти не больше файлов, чем пропускает семафор в parse()
+        handoff: queue.Queue = queue.Queue(maxsize=1)
+        stop = threading.Event()
+        finished = object()
+
+        def put(item) -> None:
+            while not stop.is_set():
+                try:
+                    handoff.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+            raise _ExtractionStopped()
+
+        class Member(Py7zIO):
+            def __init__(self, name: str):
+                self._name = name
+                self._buf = BytesIO()
+
+            def write(self, s: bytes | bytearray) -> int:
+                if stop.is_set():
+                    raise _ExtractionStopped()
+                if self._buf.tell() + len(s) > cfg.max_member_size:
+                    raise ArchiveLimitError(f"File '{self._name}' unpacks to more than {cfg.max_member_size} bytes")
+                return self._buf.write(s)
+
+            def read(self, size: int | None = None) -> bytes:
+                return self._buf.read(size)
+
+            def seek(self, offset: int, whence: int = 0) -> int:
+                return self._buf.seek(offset, whence)
+
+            def flush(self) -> None:
+                pass
+
+            def size(self) -> int:
+                return self._buf.getbuffer().nbytes
+
+            def close(self) -> None:
+                # py7zr закрывает файл после успешной распаковки — отдаем его на разбор
+                data, self._buf = self._buf.getvalue(), BytesIO()
+                put((self._name, data))
+
+        class Factory(WriterFactory):
+            def create(self, filename: str) -> Py7zIO:
+                return Member(filename)
+
+        def extract() -> None:
+            try:
+                file_content.seek(0)
+                with py7zr.SevenZipFile(file_content, mode="r") as archive:
+                    entries = [e for e in archive.list() if is_archive_member(e.filename, e.is_directory)]
+                    # Заголовкам не доверяем (write() проверяет настоящий размер), но явный
+                    # перебор лимитов видно по оглавлению — не распаковываем такой архив вовсе
+                    if len(entries) > cfg.max_members:
+                        raise ArchiveLimitError(f"Archive has more than {cfg.max_members} files")
+                    for entry in entries:
+                        self._check_size(entry.filename, entry.uncompressed)
+                    if sum(e.uncompressed for e in entries) > cfg.max_total_size:
+                        raise ArchiveLimitError(f"Archive unpacks to more than {cfg.max_total_size} bytes")
+                    if entries:
+                        archive.extract(targets=[e.filename for e in entries], factory=Factory())
+                put(finished)
+            except _ExtractionStopped:
+                pass
+            except BaseException as e:
+                try:
+                    put(e)
+                except _ExtractionStopped:
+                    pass
+
+        # Solid-архив распаковывается одним проходом: он идет в своем потоке, а генератор
+        # забирает готовые файлы по одному
+        threading.Thread(target=extract, name="7z-extract", daemon=True).start()
+        try:
+            while True:
+                item = handoff.get()
+                if item is finished:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            # Разбор прерван (ошибка, отмена, лимит) — останавливаем распаковку
+            stop.set()
+
+    # -----------------------------------------------------------------
+    @staticmethod
+    def _zip_name(info: zipfile.ZipInfo) -> str:
+        # Без флага UTF-8 имена в zip хранятся в cp437; архивы из русской Windows — на самом деле cp866
+        if info.flag_bits & 0x800:
+            return info.filename
+        try:
+            return info.filename.encode("cp437").decode("cp866")
+        except (UnicodeEncodeError, UnicodeDecodeError):
+            return info.filename
+
+    def _check_size(self, name: str, size: int) -> None:
+        if size > self._cfg.max_member_size:
+            raise ArchiveLimitError(f"File '{name}' unpacks to more than {self._cfg.max_member_size} bytes")
@@ -9,6 +9,10 @@ from ..models import ParseResult
 class BaseParser(ABC):
     """Абстрактный класс стратегии парсинга."""
 
+    # True — парсер не держит моделей и может выполняться в отдельном процессе
+    # с лимитами памяти/CPU (см. core.limits.run_isolated)
+    isolated: bool = False
+
     @abstractmethod
     async def parse(
         self,
@@ -18,6 +18,8 @@ _HEADING_RE = re.compile(r"heading\s*([0-9]+)", re.I)
 class DocxParser(BaseParser):
     """Парсер DOCX-файлов (абзацы, заголовки, таблицы, картинки)."""
 
+    isolated = True
+
     async def parse(
         self,
         *,
@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import re
+import zipfile
+from io import BytesIO
+from pathlib import Path, PurePosixPath
+
+from ..models import ProbeResult
+
+
+# Сколько байт начала файла достаточно для определения формата
+HEAD_BYTES = 4096
+TEXT_FORMAT = ".txt"
+
+# Сигнатуры в начале файла. PDF ищется отдельно: по спецификации "%PDF-"
+# может стоять не в самом начале, а в пределах первого килобайта
+_MAGIC: list[tuple[bytes, str]] = [
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+    (b"7z\xbc\xaf\x27\x1c", ".7z"),
+    (b"\x1f\x8b", ".gz"),
+    (b"BZh", ".bz2"),
+    (b"\xfd7zXZ\x00", ".xz"),
+]
+_ZIP_MAGIC = (b"PK\x03\x04", b"PK\x05\x06")
+
+# Разные расширения одного формата
+_ALIASES = {".jpeg": ".jpg", ".tgz": ".gz", ".xls": ".xlsx"}
+# Форматы, у которых есть сигнатура: если у такого файла ее нет — расширение врет
+BINARY_FORMATS = {
+    ".pdf", ".png", ".jpg", ".jpeg", ".gif", ".7z", ".gz", ".tgz", ".bz2", ".xz",
+    ".zip", ".tar", ".docx", ".xlsx", ".xls", ".pptx",
+}
+
+_SHEET_DIMENSION = re.compile(rb'<dimension ref="[A-Z]+\d+(?::[A-Z]+(\d+))?"')
+_APP_PAGES = re.compile(rb"<Pages>(\d+)</Pages>")
+_SLIDE_NAME = re.compile(r"ppt/slides/slide\d+\.xml$")
+_SHEET_NAME = re.compile(r"xl/worksheets/sheet\d+\.xml$")
+
+# Сколько первых страниц PDF проверяем на наличие текстового слоя
+_SCAN_SAMPLE_PAGES = 5
+
+
+def _zip_format(names: list[str]) -> str:
+    """OOXML — это zip с известной структурой каталогов."""
+    if "[Content_Types].xml" in names:
+        for prefix, fmt in (("word/", ".docx"), ("xl/", ".xlsx"), ("ppt/", ".pptx")):
+            if any(n.startswith(prefix) for n in names):
+                return fmt
+    return ".zip"
+
+
+def _looks_like_text(head: bytes) -> bool:
+    if not head or b"\x00" in head:
+        return False
+    try:
+        head.decode("utf-8")
+        return True
+    except UnicodeDecodeError as e:
+        # Обрезанный на границе буфера многобайтовый символ — все еще текст
+        if e.start >= len(head) - 3:
+            return True
+    # Однобайтовые кодировки: почти нет управляющих символов
+    control = sum(1 for b in head if b < 0x20 and b not in (0x09, 0x0A, 0x0D, 0x0C))
+    return control / len(head) < 0.01
+
+
+def detect_format(data: bytes) -> str | None:
+    """
+    Определяет настоящий формат по содержимому: сигнатура в первых байтах,
+    для zip — оглавление архива (central directory в конце файла).
+    Возвращает расширение (".pdf", ".docx", ...), TEXT_FORMAT для текста
+    или None, если формат не распознан.
+    """
+    head = data[:HEAD_BYTES]
+    pdf_at = head.find(b"%PDF-", 0, 1024)
+    if pdf_at >= 0:
+        prefix = head[:pdf_at]
+        # Двоичный мусор или пробелы перед заголовком допустимы,
+        # а текст, в котором просто упоминается "%PDF-", — это не PDF
+        if not prefix.strip() or not _looks_like_text(prefix):
+            return ".pdf"
+    for magic, fmt in _MAGIC:
+        if head.startswith(magic):
+            return fmt
+    if head.startswith(_ZIP_MAGIC):
+        try:
+            with zipfile.ZipFile(BytesIO(data)) as zf:
+                return _zip_format(zf.namelist())
+        except zipfile.BadZipFile:
+            return ".zip"
+    if head[257:262] == b"ustar":
+        return ".tar"
+    if _looks_like_text(head):
+        return TEXT_FORMAT
+    return None
+
+
+def resolve_format(file_name: str, detected: str | None) -> str:
+    """
+    Расширение, по которому выбирается парсер. Расширению верим, пока содержимое ему не противоречит:
+    исходники и markdown распознаются как текст, но парсер для них выбирается по расширению.
+    """
+    declared = Path(file_name).suffix.lower()
+    if detected is None:
+        return declared
+    if detected == TEXT_FORMAT and declared not in BINARY_FORMATS:
+        return declared
+    if _ALIASES.get(declared, declared) == detected:
+        return declared
+    return detected
+
+
+# ---------------------------------------------------------------------
+# Счетчики: страницы, листы, строки, изображения — без полного разбора
+# ---------------------------------------------------------------------
+def _probe_pdf(data: bytes, result: ProbeResult) -> None:
+    # pypdfium2 читает только xref и запрошенные страницы
+    from .ocr_probe import analyze_text_layer, count_pages, needs_ocr
+    from ..core.config import settings
+
+    result.page_count = count_pages(data)
+    sample = analyze_text_layer(data, max_pages=_SCAN_SAMPLE_PAGES)
+    if sample:
+        scanned = sum(1 for page in sample if needs_ocr(page, settings.marker)[0])
+        result.scanned_likely = scanned * 2 >= len(sample)
+
+
+def is_archive_member(name: str, is_dir: bool) -> bool:
+    """Файл архива, который будет разобран: каталоги, служебные файлы macOS и скрытые файлы пропускаются."""
+    if is_dir:
+        return False
+    return not any(p == "__MACOSX" or p.startswith(".") for p in PurePosixPath(name).parts)
+
+
+def _probe_zip(data: bytes, fmt: str, result: ProbeResult) -> None:
+    with zipfile.ZipFile(BytesIO(data)) as zf:
+        infos = zf.infolist()
+        names = [i.filename for i in infos]
+        media_prefix = {".docx": "word/media/", ".xlsx": "xl/media/", ".pptx": "ppt/media/"}.get(fmt)
+        if media_prefix:
+            result.image_count = sum(1 for n in names if n.startswith(media_prefix))
+
+        if fmt == ".zip":
+            result.member_count = sum(1 for i in infos if is_archive_member(i.filename, i.is_dir()))
+        elif fmt == ".pptx":
+            result.page_count = sum(1 for n in names if _SLIDE_NAME.match(n))
+        elif fmt == ".docx":
+            if "docProps/app.xml" in names:
+                # Число страниц, сохраненное Word; может быть неточным, но для оценки достаточно
+                match = _APP_PAGES.search(zf.read("docProps/app.xml"))
+                result.page_count = int(match.group(1)) if match else None
+            text_size = zf.getinfo("word/document.xml").file_size if "word/document.xml" in names else 0
+            # Документ из одних картинок — скорее всего, вставленные сканы
+            result.scanned_likely = bool(result.image_count) and text_size < 4096 * result.image_count
+        elif fmt == ".xlsx":
+            sheets = [n for n in names if _SHEET_NAME.match(n)]
+            result.sheet_count = len(sheets)
+            rows = 0
+            for name in sheets:
+                # <dimension> пишется в самом начале листа — читаем только первые байты
+                with zf.open(name) as sheet:
+                    match = _SHEET_DIMENSION.search(sheet.read(HEAD_BYTES))
+                if match:
+                    rows += int(match.group(1) or 1)
+            result.row_count = rows
+
+
+def probe_bytes(data: bytes, file_name: str) -> ProbeResult:
+    """
+    Быстрая предварительная проверка файла: настоящий формат и размеры содержимого.
+    Модели и парсеры не запускаются.
+    """
+    declared = Path(file_name).suffix.lower()
+    detected = detect_format(data)
+    effective = resolve_format(file_name, detected)
+    result = ProbeResult(
+        file_name=file_name,
+        declared_format=declared,
+        detected_format=detected,
+        format=effective,
+        format_mismatch=effective != declared,
+        file_size=len(data),
+    )
+    try:
+        if effective == ".pdf":
+            _probe_pdf(data, result)
+        elif effective in (".docx", ".xlsx", ".pptx", ".zip") and detected != TEXT_FORMAT:
+            _probe_zip(data, effective, result)
+        elif effective in (".png", ".jpg", ".jpeg", ".gif"):
+            result.image_count = 1
+            result.scanned_likely = True
+        elif effective == TEXT_FORMAT or detected == TEXT_FORMAT:
+            # Для текста считаем строки — это дешево и дает оценку объема
+            result.row_count = data.count(b"\n") + (0 if data.endswith(b"\n") or not data else 1)
+    except Exception as e:
+        # Битый файл — это тоже результат проверки: парсер, скорее всего, упадет
+        result.warnings.append(f"{type(e).__name__}: {e}")
+    return result
+
+
+def effective_file_name(file_name: str, fmt: str) -> str:
+    """Имя файла с расширением настоящего формата (для выбора парсера и полосы)."""
+    path = PurePosixPath(file_name)
+    if path.suffix.lower() == fmt:
+        return file_name
+    return str(path.with_suffix(fmt)) if path.suffix else f"{file_name}{fmt}"
@@ -1,23 +1,38 @@
 # В файле parsers/marker_parser.py
 
 import asyncio
+import contextvars
+import hashlib
+import logging
+import time
 from io import BytesIO
 from uuid import UUID, uuid4
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 
 from marker.converters.pdf import PdfConverter
-from marker.models import create_model_dict
 from marker.config.parser import ConfigParser as MarkerConfigParser
 
-from ..models import ParseResult, Line, ImageArtefact
+from ..models import ParseResult, Line, ImageArtefact, PageOcrReport
 from .base import BaseParser
-from ..core.config import MarkerSettings # Импортируем нашу модель настроек
+from .marker_pool import get_model_dict
+from .ocr_probe import analyze_text_layer, count_pages, needs_ocr, format_page_range
+from ..core.limits import check_current, current_job
+from ..core.config import MarkerSettings, settings # Импортируем нашу модель настроек
+
+logger = logging.getLogger(__name__)
+
+_LOCAL_FIELDS = {"ocr_mode", "ocr_min_chars", "ocr_min_density", "ocr_min_quality", "pages_per_run"}
+
 
 class UnifiedMarkerParser(BaseParser):
-    def __init__(self):
-        self.settings = MarkerSettings()
-        # Предварительно создаем модели один раз, это может быть ресурсоемко
-        self._model_dict = create_model_dict()
+    def __init__(self, config: MarkerSettings | None = None):
+        self.settings = config or settings.marker
+
+    @property
+    def _model_dict(self) -> Dict[str, Any]:
+        # Модели общие на процесс и грузятся при первом PDF (или заранее, см. preload_models):
+        # процессу, который PDF не разбирает, они не нужны
+        return get_model_dict()
 
     async def parse(
         self,
@@ -26,40 +41,121 @@ class UnifiedMarkerParser(BaseParser):
         file_content: BytesIO,
         parse_images: bool = True, # Этот флаг может управляться настройками
     ) -> ParseResult:
-        # 1. Создаем конфигурацию и конвертер для Marker
-        # MarkerConfigParser позволяет передать словарь настроек
-        config_parser = MarkerConfigParser(self.settings.model_dump())
-        
-        converter = PdfConverter(
-            config=config_parser.generate_config_dict(),
-            artifact_dict=self._model_dict,
-            # Сюда можно передать и другие объекты, если нужно (llm_service и т.д.)
-        )
-
-        # 2. Выполняем синхронный вызов в отдельном потоке
-        rendered_doc = await asyncio.get_event_loop().run_in_executor(
-            None, converter, file_content
-        )
-
-        # 3. Обрабатываем результат (это будет JSON-дерево)
+        pdf_bytes = file_content.getvalue()
+        warnings: List[str] = []
+
+        # 1. Решаем, какие страницы отправлять в OCR
+        # pdfium читает PDF синхронно — на больших файлах это секунды, поэтому вне event loop
+        loop = asyncio.get_event_loop()
+        ocr_reports: List[PageOcrReport] = []
+        if self.settings.force_ocr or self.settings.ocr_mode in ("force", "off"):
+            force = self.settings.force_ocr or self.settings.ocr_mode == "force"
+            try:
+                runs = [(list(range(await loop.run_in_executor(None, count_pages, pdf_bytes))), force)]
+            except Exception as e:
+                warnings.append(f"Page count failed, converting in one run: {type(e).__name__}: {e}")
+                runs = [(None, force)]
+        else:
+            try:
+                page_stats = await loop.run_in_executor(None, analyze_text_layer, pdf_bytes)
+            except Exception as e:
+                # Не смогли прочитать текстовый слой — отдаем решение самому Marker
+                warnings.append(f"OCR probe failed, falling back to Marker defaults: {type(e).__name__}: {e}")
+                page_stats = []
+            for page in page_stats:
+                ocr, reason = needs_ocr(page, self.settings)
+                ocr_reports.append(PageOcrReport(
+                    page_idx=page.page_idx, ocr=ocr, reason=reason,
+                    chars=page.chars, density=round(page.density, 3), quality=round(page.quality, 3),
+                ))
+            ocr_pages = [r.page_idx for r in ocr_reports if r.ocr]
+            text_pages = [r.page_idx for r in ocr_reports if not r.ocr]
+            runs = [(pages, force) for pages, force in ((text_pages, False), (ocr_pages, True)) if pages]
+            if not runs:
+                runs = [(None, False)]
+
+        # 2. Прогоняем Marker отдельно по «цифровым» и «сканированным» страницам
         lines: List[Line] = []
         images: List[ImageArtefact] = []
-        
-        # Рекурсивно обходим дерево блоков
-        print("*"*80)
-        print(rendered_doc)
-        self._process_marker_blocks(
-            doc_id=doc_id,
-            blocks=rendered_doc, 
-            lines=lines, 
-            images=images,
-            parse_images=parse_images
-        )
-        
-        # Сортируем строки, т.к. рекурсивный обход не гарантирует порядок
-        lines.sort(key=lambda line: line.line_no)
-
-        return ParseResult(lines=lines, images=images)
+        reports_by_page = {r.page_idx: r for r in ocr_reports}
+        # Готовые куски сохраняются в контрольную точку задачи: повторный запуск их пропустит.
+        # Хеш PDF в id куска различает файлы внутри одного архива
+        ctx = current_job()
+        checkpoint = ctx.checkpoint if ctx is not None else None
+        pdf_hash = hashlib.sha256(pdf_bytes).hexdigest()[:16] if checkpoint else ""
+        for pages, force_ocr in self._split_runs(runs):
+            # Между кусками проверяем отмену и дедлайн задачи
+            check_current()
+            chunk_id = f"{pdf_hash}:{format_page_range(pages) if pages else 'all'}:{'ocr' if force_ocr else 'text'}"
+            if checkpoint:
+                restored = await checkpoint.load_chunk(chunk_id)
+                if restored is not None:
+                    lines.extend(restored.lines)
+                    images.extend(restored.images)
+                    continue
+            lines_before, images_before = len(lines), len(images)
+            started = time.perf_counter()
+            rendered_doc = await self._convert(pdf_bytes, pages, force_ocr)
+            elapsed = time.perf_counter() - started
+            for page_idx in pages or []:
+                if page_idx in reports_by_page:
+                    reports_by_page[page_idx].seconds = round(elapsed / len(pages), 3)
+
+            # 3. Обрабатываем результат (это будет JSON-дерево)
+            # Рекурсивно обходим дерево блоков
+            logger.debug("Marker output for doc_id=%s, pages=%s: %r", doc_id, pages, rendered_doc)
+            self._process_marker_blocks(
+                doc_id=doc_id,
+                blocks=rendered_doc,
+                lines=lines,
+                images=images,
+                parse_images=parse_images
+            )
+            if checkpoint:
+                await checkpoint.save_chunk(
+                    chunk_id, ParseResult(lines=lines[lines_before:], images=images[images_before:])
+                )
+
+        # Сортируем строки: прогоны идут не по порядку страниц, а рекурсивный обход не гарантирует порядок
+        lines.sort(key=lambda line: (line.page_idx or 0, line.line_no))
+        for idx, line in enumerate(lines):
+            line.line_no = idx
+
+        return ParseResult(lines=lines, images=images, warnings=warnings, ocr_pages=ocr_reports)
+
+    def _split_runs(self, runs: List[Tuple[List[int] | None, bool]]) -> List[Tuple[List[int] | None, bool]]:
+        """Режет прогоны на куски по pages_per_run страниц."""
+        size = max(1, self.settings.pages_per_run)
+        chunks: List[Tuple[List[int] | None, bool]] = []
+        for pages, force_ocr in runs:
+            if pages is None:
+                chunks.append((None, force_ocr))
+                continue
+            chunks.extend((pages[i:i + size], force_ocr) for i in range(0, len(pages), size))
+        return chunks
+
+    async def _convert(self, pdf_bytes: bytes, pages: List[int] | None, force_ocr: bool) -> Any:
+        # MarkerConfigParser позволяет передать словарь настроек
+        # Наши собственные настройки (пороги OCR, размер куска) в Marker не передаем
+        options = self.settings.model_dump(exclude=_LOCAL_FIELDS)
+        options["force_ocr"] = force_ocr
+        if pages:
+            options["page_range"] = format_page_range(pages)
+        config_parser = MarkerConfigParser(options)
+
+        def run() -> Any:
+            # Конвертер создается в потоке: первое обращение к моделям может их загружать
+            converter = PdfConverter(
+                config=config_parser.generate_config_dict(),
+                artifact_dict=self._model_dict,
+                # Сюда можно передать и другие объекты, если нужно (llm_service и т.д.)
+            )
+            return converter(BytesIO(pdf_bytes))
+
+        # Выполняем синхронный вызов в отдельном потоке. Контекст копируем, чтобы модели
+        # видели текущую задачу и могли прервать прогон при отмене или дедлайне
+        ctx = contextvars.copy_context()
+        return await asyncio.get_event_loop().run_in_executor(None, ctx.run, run)
 
     def _process_marker_blocks(
         self, doc_id: UUID, blocks: List[Any], lines: List[Line], images: List[ImageArtefact], parse_images: bool
@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Dict, List
+
+from ..core.config import InferenceSettings, settings
+from ..core.limits import check_current
+
+
+_DEFAULT_BATCH_SIZE = {"cpu": 8, "cuda": 64, "mps": 16}
+
+_models_lock = threading.Lock()
+_model_dict: Dict[str, Any] | None = None
+
+
+def get_model_dict() -> Dict[str, Any]:
+    """
+    Единый на процесс набор моделей Marker.
+    Модели грузятся один раз; при включенном планировщике инференса
+    выбранные модели оборачиваются в BatchingPredictor.
+    """
+    global _model_dict
+    with _models_lock:
+        if _model_dict is None:
+            # Импорт здесь: BatchingPredictor должен импортироваться без Marker и torch
+            from marker.models import create_model_dict
+
+            models = create_model_dict(device=settings.torch_device)
+            _model_dict = wrap_models(models, settings.inference, settings.torch_device)
+        return _model_dict
+
+
+def wrap_models(models: Dict[str, Any], config: InferenceSettings, device: str) -> Dict[str, Any]:
+    # Каждый вызов модели — точка отмены: иначе отмена и дедлайн ждут конца всего прогона Marker
+    wrapped = {name: CheckedPredictor(model) if callable(model) else model for name, model in models.items()}
+    if not config.enabled:
+        return wrapped
+    batch_size = config.batch_size or _DEFAULT_BATCH_SIZE.get(device.split(":")[0], 8)
+    for name in config.batched_models:
+        if name in models:
+            wrapped[name] = BatchingPredictor(
+                models[name], name=name, batch_size=batch_size, max_wait_s=config.max_wait_ms / 1000
+            )
+    print(f"[Inference] device={device} batch_size={batch_size} batched={[n for n in config.batched_models if n in models]}")
+    return wrapped
+
+
+class CheckedPredictor:
+    """Прокси над предиктором (surya): перед каждым вызовом проверяет отмену и дедлайн задачи."""
+
+    def __init__(self, predictor: Any):
+        object.__setattr__(self, "_predictor", predictor)
+
+    # Атрибуты (device, model, disable_tqdm и т.п.) прозрачно проксируем
+    def __getattr__(self, item: str) -> Any:
+        return getattr(self._predictor, item)
+
+    def __setattr__(self, key: str, value: Any) -> None:
+        setattr(self._predictor, key, value)
+
+    def __call__(self, *args: Any, **kwargs: Any) -> Any:
+        # Контекст задачи есть в потоке, если конвертер запущен через contextvars.copy_context().run
+        check_current()
+        return self._predictor(*args, **kwargs)
+
+
+class _Call:
+    __slots__ = ("args", "kwargs", "size", "key", "result", "error", "done")
+
+    def __init__(self, args: tuple, kwargs: dict, size: int, key: tuple):
+        self.args = args
+        self.kwargs = kwargs
+        self.size = size
+        self.key = key
+        self.result: Any = None
+        self.error: BaseException | None = None
+        self.done = threading.Event()
+
+
+class BatchingPredictor(CheckedPredictor):
+    """
+    Прокси над предиктором (surya), который объединяет вызовы из разных потоков
+    (т.е. от разных документов) в один батч.
+
+    Вызов считается «батчуемым», если первый аргумент — список элементов (страниц/фрагментов).
+    Аргументы-списки той же длины считаются поэлементными и склеиваются,
+    остальные аргументы должны совпадать у всех вызовов группы.
+    Результат-список режется обратно по длинам исходных вызовов.
+    Все обращения к модели идут из одного потока, поэтому модель не используется конкурентно.
+    """
+
+    def __init__(self, predictor: Any, *, name: str, batch_size: int, max_wait_s: float):
+        super().__init__(predictor)
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_batch_size", batch_size)
+        object.__setattr__(self, "_max_wait_s", max_wait_s)
+        object.__setattr__(self, "_cond", threading.Condition())
+        object.__setattr__(self, "_model_lock", threading.Lock())
+        object.__setattr__(self, "_pending", [])
+        object.__setattr__(self, "_thread", None)
+
+    # -----------------------------------------------------------------
+    def __call__(self, *args: Any, **kwargs: Any) -> Any:
+        check_current()
+        items = args[0] if args else None
+        if not isinstance(items, list) or not items:
+            with self._model_lock:
+                return self._predictor(*args, **kwargs)
+
+        call = _Call(args, kwargs, len(items), self._call_key(args, kwargs, len(items)))
+        with self._cond:
+            self._ensure_thread()
+            self._pending.append(call)
+            self._cond.notify_all()
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    @staticmethod
+    def _call_key(args: tuple, kwargs: dict, size: int) -> tuple:
+        def part(value: Any) -> Any:
+            if isinstance(value, list) and len(value) == size:
+                return "items"
+            if isinstance(value, (int, float, str, bool, type(None))):
+                return ("v", value)
+            return ("id", id(value))
+
+        return (
+            tuple(part(a) for a in args[1:]),
+            tuple(sorted((k, part(v)) for k, v in kwargs.items() if k != "batch_size")),
+        )
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None:
+            thread = threading.Thread(target=self._loop, name=f"batcher-{self._name}", daemon=True)
+            object.__setattr__(self, "_thread", thread)
+            thread.start()
+
+    # -----------------------------------------------------------------
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                # Ждем вызовы от других документов, но не дольше max_wait
+                deadline = time.monotonic() + self._max_wait_s
+                while sum(c.size for c in self._pending) < self._batch_size:
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        break
+                    self._cond.wait(left)
+                group = self._take_group()
+            with self._model_lock:
+                self._run_group(group)
+
+    def _take_group(self) -> List[_Call]:
+        first = self._pending.pop(0)
+        group, total = [first], first.size
+        for call in list(self._pending):
+            if call.key == first.key and total + call.size <= self._batch_size:
+                group.append(call)
+                total += call.size
+                self._pending.remove(call)
+        return group
+
+    def _run_group(self, group: List[_Call]) -> None:
+        if len(group) == 1:
+            self._run_single(group[0])
+            return
+
+        first = group[0]
+        sizes = [c.size for c in group]
+        args = tuple(
+            [x for c in group for x in c.args[i]] if isinstance(a, list) and len(a) == first.size else a
+            for i, a in enumerate(first.args)
+        )
+        kwargs = {
+            k: [x for c in group for x in c.kwargs[k]] if isinstance(v, list) and len(v) == first.size else v
+            for k, v in first.kwargs.items()
+        }
+        if "batch_size" in kwargs:
+            kwargs["batch_size"] = max(kwargs["batch_size"] or 0, self._batch_size)
+
+        try:
+            result = self._predictor(*args, **kwargs)
+        except BaseException as e:
+            for call in group:
+                call.error = e
+                call.done.set()
+            return
+
+        if not isinstance(result, list) or len(result) != sum(sizes):
+            # Модель вернула не поэлементный результат — повторяем вызовы по отдельности
+            for call in group:
+                self._run_single(call)
+            return
+
+        offset = 0
+        for call in group:
+            call.result = result[offset:offset + call.size]
+            offset += call.size
+            call.done.set()
+
+    def _run_single(self, call: _Call) -> None:
+        try:
+            call.result = self._predictor(*call.args, **call.kwargs)
+        except BaseException as e:
+            call.error = e
+        finally:
+            call.done.set()
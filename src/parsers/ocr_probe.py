@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import string
+import unicodedata
+from dataclasses import dataclass
+
+import pypdfium2 as pdfium  # ставится вместе с marker-pdf
+
+from ..core.config import MarkerSettings
+
+
+_ALLOWED_PUNCT = set(string.punctuation) | set("«»—–№…•°")
+
+
+@dataclass
+class PageTextStats:
+    """Характеристики встроенного текстового слоя страницы."""
+    page_idx: int
+    chars: int
+    density: float   # символов на 1000 pt²
+    quality: float   # доля «нормальных» символов, 0..1
+
+
+def _text_quality(text: str) -> float:
+    """Доля букв, цифр, пробелов и обычной пунктуации. Мусор из битых шрифтов снижает оценку."""
+    if not text:
+        return 0.0
+    good = 0
+    for ch in text:
+        if ch == "�":
+            continue
+        if ch.isalnum() or ch.isspace() or ch in _ALLOWED_PUNCT:
+            good += 1
+        elif unicodedata.category(ch).startswith(("L", "N")):
+            good += 1
+    return good / len(text)
+
+
+def analyze_text_layer(pdf_bytes: bytes, max_pages: int | None = None) -> list[PageTextStats]:
+    """Быстро читает текстовый слой страниц (всех или первых max_pages) без запуска моделей."""
+    stats: list[PageTextStats] = []
+    pdf = pdfium.PdfDocument(pdf_bytes)
+    try:
+        total = len(pdf) if max_pages is None else min(len(pdf), max_pages)
+        for idx in range(total):
+            page = pdf[idx]
+            textpage = page.get_textpage()
+            try:
+                text = textpage.get_text_range()
+                width, height = page.get_size()
+            finally:
+                textpage.close()
+                page.close()
+            visible = "".join(text.split())
+            area_k = max(width * height / 1000.0, 1.0)
+            stats.append(PageTextStats(
+                page_idx=idx,
+                chars=len(visible),
+                density=len(visible) / area_k,
+                quality=_text_quality(visible),
+            ))
+    finally:
+        pdf.close()
+    return stats
+
+
+def count_pages(pdf_bytes: bytes) -> int:
+    pdf = pdfium.PdfDocument(pdf_bytes)
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+def needs_ocr(page: PageTextStats, settings: MarkerSettings) -> tuple[bool, str]:
+    """Решает, нужен ли странице OCR. Возвращает (решение, причина)."""
+    if page.chars < settings.ocr_min_chars:
+        return True, "no_text_layer"
+    if page.density < settings.ocr_min_density:
+        return True, "low_density"
+    if page.quality < settings.ocr_min_quality:
+        return True, "low_quality"
+    return False, "text_layer_ok"
+
+
+def format_page_range(pages: list[int]) -> str:
+    """[0, 1, 2, 5, 7, 8] -> "0-2,5,7-8" (формат page_range у Marker)."""
+    parts: list[str] = []
+    pages = sorted(pages)
+    start = prev = pages[0]
+    for p in pages[1:]:
+        if p == prev + 1:
+            prev = p
+            continue
+        parts.append(f"{start}-{prev}" if start != prev else str(start))
+        start = prev = p
+    parts.append(f"{start}-{prev}" if start != prev else str(start))
+    return ",".join(parts)
@@ -6,11 +6,11 @@ from uuid import UUID, uuid4
 from typing import Dict, Any, List
 
 from marker.converters.pdf import PdfConverter
-from marker.models import create_model_dict
 from marker.output import text_from_rendered
 
 from ..models import ParseResult, Line, ImageArtefact
 from .base import BaseParser
+from .marker_pool import get_model_dict
 
 
 def _build_block_map(meta: Dict[str, Any]) -> Dict[int, Dict[str, Any]]:
@@ -44,7 +44,7 @@ class PdfMarkerParser(BaseParser):
         file_content: BytesIO,
         parse_images: bool = True,
     ) -> ParseResult:
-        converter = PdfConverter(artifact_dict=create_model_dict())
+        converter = PdfConverter(artifact_dict=get_model_dict())
         # Marker – синхронный, поэтому вне главного цикла
         rendered = await asyncio.get_event_loop().run_in_executor(
             None, converter, file_content  # type: ignore[arg-type]
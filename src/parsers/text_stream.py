@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import codecs
+import re
+import unicodedata
+from typing import BinaryIO, Iterator
+
+
+_BOMS = [
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+_WORD = re.compile(r"[^\W\d_]+")
+
+
+def _mojibake_share(text: str, encoding: str) -> float:
+    """
+    Доля не-ASCII символов, которые выглядят как мусор для языков этой кодировки.
+    cp1251: кириллица стоит целыми словами, буква вперемешку с латиницей в одном слове — мусор.
+    latin-1: диакритика — редкие буквы среди латиницы; слово почти из одних
+    не-ASCII букв (так выглядит русский текст, прочитанный как latin-1) — мусор.
+    Управляющие символы C1 (0x80–0x9F в latin-1) — мусор в обоих случаях.
+    """
+    non_ascii = sum(1 for ch in text if ord(ch) >= 0x80)
+    if not non_ascii:
+        return 0.0
+    bad = sum(1 for ch in text if ord(ch) >= 0x80 and unicodedata.category(ch) == "Cc")
+    for word in _WORD.findall(text):
+        high = sum(1 for ch in word if ord(ch) >= 0x80)
+        if not high:
+            continue
+        if encoding == "cp1251":
+            if high < len(word):
+                bad += high
+        elif len(word) >= 4 and high * 2 > len(word):
+            bad += high
+    return bad / non_ascii
+
+
+def sniff_encoding(prefix: bytes, *, final: bool = False) -> str:
+    """
+    Определяет кодировку по началу файла.
+    Порядок: BOM → валидный UTF-8 → cp1251 или latin-1, смотря какое из декодирований
+    больше похоже на естественный текст.
+    final=True означает, что prefix — это весь файл.
+    """
+    for bom, encoding in _BOMS:
+        if prefix.startswith(bom):
+            return encoding
+
+    try:
+        # Если это не весь файл, префикс может обрываться посреди многобайтного символа
+        codecs.getincrementaldecoder("utf-8")().decode(prefix, final=final)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+
+    # Оцениваем только не-ASCII символы: латинские заголовки CSV с кириллическими
+    # значениями не должны перевешивать саму кириллицу
+    cp1251 = _mojibake_share(prefix.decode("cp1251", errors="replace"), "cp1251")
+    latin1 = _mojibake_share(prefix.decode("latin-1"), "latin-1")
+    if cp1251 != latin1:
+        return "cp1251" if cp1251 < latin1 else "latin-1"
+    # Ничья — например, только короткие слова («ООО ТД РФ»): решает, куда попадают
+    # старшие байты. 0xC0–0xFF в cp1251 — буквы кириллицы
+    high = [b for b in prefix if b >= 0x80]
+    return "cp1251" if sum(1 for b in high if b >= 0xC0) * 2 > len(high) else "latin-1"
+
+
+def iter_text_lines(
+    stream: BinaryIO,
+    encoding: str,
+    *,
+    chunk_size: int = 1024 * 1024,
+    max_line_length: int | None = None,
+    collapse_blank_lines: bool = False,
+) -> Iterator[str]:
+    """
+    Лениво отдает строки файла, декодируя его кусками фиксированного размера.
+    Память ограничена размером куска (и max_line_length, если он задан).
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    pending = ""
+    prev_blank = False
+
+    def emit(line: str) -> Iterator[str]:
+        nonlocal prev_blank
+        is_blank = not line.strip()
+        if collapse_blank_lines and is_blank and prev_blank:
+            return
+        prev_blank = is_blank
+        if max_line_length and len(line) > max_line_length:
+            for start in range(0, len(line), max_line_length):
+                yield line[start:start + max_line_length]
+        else:
+            yield line
+
+    while True:
+        chunk = stream.read(chunk_size)
+        final = not chunk
+        pending += decoder.decode(chunk, final=final)
+
+        parts = pending.splitlines(keepends=True)
+        pending = ""
+        if parts and not final and _is_incomplete(parts[-1]):
+            # Незавершенная строка (или одиночный \r, за которым может прийти \n) ждет следующий кусок
+            pending = parts.pop()
+
+        for part in parts:
+            yield from emit(part.splitlines()[0])
+
+        body_len = len(pending) - pending.endswith("\r")
+        if max_line_length and body_len > max_line_length:
+            # Очень длинная строка без переводов — отдаем готовые части, не копя ее целиком
+            cut = (body_len - 1) // max_line_length * max_line_length
+            prev_blank = False
+            for start in range(0, cut, max_line_length):
+                yield pending[start:start + max_line_length]
+            pending = pending[cut:]
+
+        if final:
+            return
+
+
+def _is_incomplete(part: str) -> bool:
+    return part.endswith("\r") or part.splitlines()[0] == part
@@ -1,15 +1,34 @@
 from __future__ import annotations
 
+import asyncio
+import contextvars
 from io import BytesIO
 from uuid import UUID
-from typing import List
+from typing import BinaryIO
 
-from ..models import Line, ParseResult
+from ..core.config import TextSettings, settings
+from ..core.limits import check_current
+from ..models import ParseResult, TextLines
 from .base import BaseParser
+from .text_stream import iter_text_lines, sniff_encoding
+
+
+# Как часто (в строках) проверяем отмену и дедлайн задачи при чтении
+_CHECK_EVERY = 10_000
 
 
 class TxtParser(BaseParser):
-    """Самый простой: каждая строка – текст."""
+    """Самый простой: каждая строка – текст. Кодировка определяется по началу файла."""
+
+    def __init__(self, config: TextSettings | None = None):
+        self._cfg = config or settings.text
+
+    def detect_encoding(self, stream: BinaryIO) -> str:
+        """Читает префикс потока, определяет кодировку и возвращает позицию на место."""
+        pos = stream.tell()
+        prefix = stream.read(self._cfg.sniff_bytes)
+        stream.seek(pos)
+        return sniff_encoding(prefix, final=len(prefix) < self._cfg.sniff_bytes)
 
     async def parse(
         self,
@@ -18,11 +37,28 @@ class TxtParser(BaseParser):
         file_content: BytesIO,
         parse_images: bool = True,  # нет изображений
     ) -> ParseResult:
-        content = file_content.read().decode("utf-8", errors="replace")
-        lines_raw = content.splitlines()
-
-        lines: List[Line] = [
-            Line(line_no=i, block_type="text", content=txt)
-            for i, txt in enumerate(lines_raw)
-        ]
-        return ParseResult(lines=lines, images=[])
\ No newline at end of file
+        encoding = self.detect_encoding(file_content)
+        # Декодирование многогигабайтных файлов не должно блокировать event loop.
+        # Контекст копируем, чтобы поток видел текущую задачу и мог прерваться по отмене
+        ctx = contextvars.copy_context()
+        lines = await asyncio.get_event_loop().run_in_executor(
+            None, ctx.run, self._collect_lines, file_content, encoding
+        )
+        warnings = [] if encoding in ("utf-8", "utf-8-sig") else [f"Decoded as {encoding}"]
+        return ParseResult(lines=lines, images=[], warnings=warnings)
+
+    def _collect_lines(self, stream: BinaryIO, encoding: str) -> TextLines:
+        # Файл декодируется кусками, а строки копятся компактно (TextLines), без объекта Line на строку
+        lines = TextLines()
+        texts = iter_text_lines(
+            stream,
+            encoding,
+            chunk_size=self._cfg.chunk_size,
+            max_line_length=self._cfg.max_line_length,
+            collapse_blank_lines=self._cfg.collapse_blank_lines,
+        )
+        for txt in texts:
+            lines.append(txt)
+            if len(lines) % _CHECK_EVERY == 0:
+                check_current()
+        return lines
@@ -13,6 +13,8 @@ from .base import BaseParser
 class XlsxParser(BaseParser):
     """Парсер Excel (лист/строки)."""
 
+    isolated = True
+
     async def parse(
         self,
         *,
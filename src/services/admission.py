@@ -0,0 +1,299 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from redis.asyncio import Redis
+
+from ..core.config import AdmissionSettings, settings
+
+
+# Выученные поправки к модели памяти, общие для всех воркеров: формат -> множитель
+MEMORY_MODEL_KEY = "parsing_memory_model"
+
+# Шаг EWMA атомарно в Redis: наблюдения всех воркеров сливаются, а не перезаписывают друг друга.
+# ARGV: формат, наблюденное отношение, alpha, max_step_down, нижняя и верхняя граница множителя
+_LEARN_SCRIPT = """
+local current = tonumber(redis.call('HGET', KEYS[1], ARGV[1])) or 1.0
+local alpha = tonumber(ARGV[3])
+local updated = (1 - alpha) * current + alpha * tonumber(ARGV[2])
+updated = math.max(updated, current * (1 - tonumber(ARGV[4])))
+updated = math.min(math.max(updated, tonumber(ARGV[5])), tonumber(ARGV[6]))
+local value = string.format('%.4f', updated)
+redis.call('HSET', KEYS[1], ARGV[1], value)
+return value
+"""
+_MIN_MULTIPLIER = 0.1
+_MAX_MULTIPLIER = 20.0
+
+# Пиковая память парсера: base МБ + per_mb МБ на каждый МБ входного файла.
+# Стартовые значения; по наблюдениям они уточняются множителем на формат
+_BASE_MB = {
+    ".pdf": 500.0, ".pptx": 500.0,   # активации моделей Marker
+    ".xlsx": 50.0, ".xls": 50.0, ".docx": 50.0,
+    ".zip": 100.0, ".7z": 100.0, ".tar": 100.0, ".tgz": 100.0, ".gz": 100.0, ".bz2": 100.0, ".xz": 100.0,
+}
+_PER_MB = {
+    ".pdf": 20.0, ".pptx": 20.0,
+    # openpyxl без read_only держит каждую ячейку объектом
+    ".xlsx": 60.0, ".xls": 60.0,
+    ".docx": 10.0,
+    ".png": 10.0, ".jpg": 10.0, ".jpeg": 10.0, ".gif": 10.0,
+    ".zip": 15.0, ".7z": 15.0, ".tar": 15.0, ".tgz": 15.0, ".gz": 15.0, ".bz2": 15.0, ".xz": 15.0,
+}
+_DEFAULT_BASE_MB = 20.0
+_DEFAULT_PER_MB = 6.0  # txt, md, код: строки в памяти в несколько раз больше файла
+_MB = 1024 * 1024
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def process_rss_mb() -> float:
+    """Текущий RSS процесса по /proc/self/statm."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / _MB
+    except OSError:
+        return 0.0
+
+
+def memory_limit_mb() -> float | None:
+    """Лимит памяти контейнера (cgroup v2/v1) или объем физической памяти."""
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                raw = f.read().strip()
+        except OSError:
+            continue
+        # "max" в v2 и огромное число в v1 означают «без лимита»
+        if raw.isdigit() and int(raw) < 1 << 60:
+            return int(raw) / _MB
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * _PAGE_SIZE / _MB
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+@dataclass(eq=False)
+class Reservation:
+    fmt: str
+    size_mb: float
+    estimate_mb: float
+    waited_s: float = 0.0
+    # Пик ru_maxrss изолированного процесса парсера; только по нему уточняется модель
+    observed_mb: float | None = None
+    # Задача заняла слот и начала работу. Резерв еще не начатой задачи может быть отозван
+    started: bool = False
+
+
+class MemoryAdmission:
+    """
+    Допуск задач по бюджету памяти пода. До того как занять слот полосы, задача резервирует
+    оценку своей пиковой памяти (вместе с самим файлом) и ждет, пока она не поместится в бюджет.
+    Свободный процесс принимает задачу всегда, даже если оценка больше бюджета, иначе она не выполнится никогда.
+    Начатые задачи (занявшие слот) имеют приоритет: если им не хватает памяти, резервы задач,
+    еще ждущих слота, отзываются — иначе они ждали бы друг друга вечно.
+    Оценка формата уточняется по пику изолированных процессов парсера (EWMA).
+    """
+
+    def __init__(self, redis_client: Redis | None = None, config: AdmissionSettings | None = None):
+        self._redis = redis_client
+        self._cfg = config or settings.admission
+        self._cond = asyncio.Condition()
+        self._in_use_mb = 0.0
+        self._active: list[Reservation] = []
+        # Ожидающие задачи в порядке прихода: ticket -> время начала ожидания
+        self._waiters: OrderedDict[int, float] = OrderedDict()
+        self._started_waiting = 0
+        self._tickets = itertools.count()
+        self._multipliers: dict[str, float] = {}
+        self._model_loaded_at: float | None = None
+        self._learn_script = redis_client.register_script(_LEARN_SCRIPT) if redis_client is not None else None
+        self.budget_mb = self._resolve_budget()
+        print(f"[Admission] Memory budget for jobs: {self.budget_mb:.0f} MB")
+
+    def _resolve_budget(self) -> float:
+        if self._cfg.budget_mb:
+            return float(self._cfg.budget_mb)
+        limit = memory_limit_mb()
+        if limit is None:
+            return float("inf")
+        # Модели и сам процесс уже загружены — в бюджет задач они не входят
+        return max(limit * self._cfg.budget_fraction - process_rss_mb(), 0.0)
+
+    # -----------------------------------------------------------------
+    @staticmethod
+    def _static_mb(fmt: str, size_mb: float) -> float:
+        return _BASE_MB.get(fmt, _DEFAULT_BASE_MB) + _PER_MB.get(fmt, _DEFAULT_PER_MB) * size_mb
+
+    def estimate_mb(self, fmt: str, size_bytes: int) -> float:
+        """
+        Оценка пиковой памяти задачи: статическая модель формата с выученной поправкой
+        плюс сам файл, который держится в памяти все время задачи.
+        """
+        size_mb = size_bytes / _MB
+        return self._static_mb(fmt, size_mb) * self._multipliers.get(fmt, 1.0) * self._cfg.headroom + size_mb
+
+    async def _load_model(self) -> None:
+        """Перечитывает поправки из Redis не чаще model_reload_s: их уточняют и другие воркеры."""
+        if self._redis is None:
+            return
+        now = time.monotonic()
+        if self._model_loaded_at is not None and now - self._model_loaded_at < self._cfg.model_reload_s:
+            return
+        self._model_loaded_at = now
+        try:
+            stored = await self._redis.hgetall(MEMORY_MODEL_KEY)
+            self._multipliers.update({fmt: float(value) for fmt, value in stored.items()})
+        except Exception as e:
+            print(f"[Admission] Failed to load memory model: {type(e).__name__}: {e}")
+
+    def _ewma_step(self, current: float, ratio: float) -> float:
+        alpha = self._cfg.ewma_alpha
+        updated = (1 - alpha) * current + alpha * ratio
+        # Оценка падает не быстрее max_step_down за шаг: заниженная оценка ведет к OOM
+        updated = max(updated, current * (1 - self._cfg.max_step_down))
+        return min(max(updated, _MIN_MULTIPLIER), _MAX_MULTIPLIER)
+
+    async def _learn(self, res: Reservation) -> None:
+        ratio = res.observed_mb / max(self._static_mb(res.fmt, res.size_mb), 1.0)
+        if self._learn_script is None:
+            self._multipliers[res.fmt] = self._ewma_step(self._multipliers.get(res.fmt, 1.0), ratio)
+            return
+        try:
+            value = await self._learn_script(
+                keys=[MEMORY_MODEL_KEY],
+                args=[res.fmt, ratio, self._cfg.ewma_alpha, self._cfg.max_step_down, _MIN_MULTIPLIER, _MAX_MULTIPLIER],
+            )
+            self._multipliers[res.fmt] = float(value)
+        except Exception as e:
+            print(f"[Admission] Failed to save memory model: {type(e).__name__}: {e}")
+
+    # -----------------------------------------------------------------
+    def _fits(self, res: Reservation) -> bool:
+        if res.started:
+            # Начатой задаче мешают только начатые: резервы задач, ждущих слота, будут отозваны
+            started = [r for r in self._active if r.started]
+            return not started or sum(r.estimate_mb for r in started) + res.estimate_mb <= self.budget_mb
+        if self._started_waiting:
+            return False
+        if not self._active:
+            return True
+        return self._in_use_mb + res.estimate_mb <= self.budget_mb
+
+    def _can_admit(self, ticket: int, res: Reservation) -> bool:
+        oldest = next(iter(self._waiters))
+        if not res.started and oldest != ticket and time.monotonic() - self._waiters[oldest] > self._cfg.starvation_s:
+            # Крупная задача ждет слишком долго — мелкие больше не обгоняют ее
+            return False
+        return self._fits(res)
+
+    def _add(self, res: Reservation) -> None:
+        if res.started:
+            # Отзываем резервы еще не начатых задач, новые первыми, пока начатой не хватит бюджета
+            for other in reversed(list(self._active)):
+                if self._in_use_mb + res.estimate_mb <= self.budget_mb:
+                    break
+                if not other.started:
+                    self._remove(other)
+        self._in_use_mb += res.estimate_mb
+        self._active.append(res)
+
+    def _remove(self, res: Reservation) -> None:
+        self._active.remove(res)
+        self._in_use_mb = max(self._in_use_mb - res.estimate_mb, 0.0)
+
+    async def _admit(self, res: Reservation, on_wait: Callable[[Reservation], Awaitable[None]] | None) -> None:
+        if on_wait is not None and not self._fits(res):
+            await on_wait(res)
+        ticket = next(self._tickets)
+        started = time.monotonic()
+        async with self._cond:
+            self._waiters[ticket] = started
+            self._started_waiting += res.started
+            try:
+                await self._cond.wait_for(lambda: self._can_admit(ticket, res))
+            finally:
+                del self._waiters[ticket]
+                self._started_waiting -= res.started
+                # Ушедший (в т.ч. отмененный) ожидающий мог блокировать очередь — будим остальных
+                self._cond.notify_all()
+            res.waited_s += time.monotonic() - started
+            self._add(res)
+
+    async def acquire(
+        self,
+        fmt: str,
+        size_bytes: int,
+        on_wait: Callable[[Reservation], Awaitable[None]] | None = None,
+        started: bool = False,
+    ) -> Reservation:
+        """
+        Резервирует память под задачу; резерв обязательно вернуть через release().
+        started — задача уже заняла слот. on_wait вызывается, если задаче придется ждать освобождения памяти.
+        """
+        res = Reservation(fmt=fmt, size_mb=size_bytes / _MB, estimate_mb=0.0, started=started)
+        if not self._cfg.enabled:
+            return res
+        await self._load_model()
+        res.estimate_mb = self.estimate_mb(fmt, size_bytes)
+        await self._admit(res, on_wait)
+        return res
+
+    async def start(
+        self, res: Reservation, on_wait: Callable[[Reservation], Awaitable[None]] | None = None
+    ) -> None:
+        """Задача заняла слот. Если ее резерв отозвали, пока она ждала слота, память резервируется заново."""
+        res.started = True
+        if self._cfg.enabled and res not in self._active:
+            await self._admit(res, on_wait)
+
+    async def resize(
+        self,
+        res: Reservation,
+        fmt: str,
+        size_bytes: int,
+        on_wait: Callable[[Reservation], Awaitable[None]] | None = None,
+    ) -> None:
+        """
+        Уточняет резерв начатой задачи, когда известны настоящие формат и размер файла (после скачивания).
+        Если новая оценка не помещается в бюджет, задача ждет памяти заново: размер,
+        заявленный клиентом, не позволяет обойти бюджет.
+        """
+        res.started = True
+        if not self._cfg.enabled:
+            return
+        estimate = self.estimate_mb(fmt, size_bytes)
+        async with self._cond:
+            if res in self._active:
+                self._remove(res)
+            res.fmt, res.size_mb, res.estimate_mb = fmt, size_bytes / _MB, estimate
+            if self._fits(res):
+                self._add(res)
+            self._cond.notify_all()
+        if res not in self._active:
+            await self._admit(res, on_wait)
+
+    async def release(self, res: Reservation) -> None:
+        """Возвращает резерв и, если есть наблюдение (observed_mb), уточняет оценку формата."""
+        async with self._cond:
+            if res not in self._active:
+                # Резерв отозван или допуск выключен
+                return
+            self._remove(res)
+            self._cond.notify_all()
+        if res.observed_mb:
+            await self._learn(res)
+
+    def snapshot(self) -> dict:
+        return {
+            "budget_mb": round(self.budget_mb, 1),
+            "in_use_mb": round(self._in_use_mb, 1),
+            "active": len(self._active),
+            "waiting": len(self._waiters),
+            "multipliers": {fmt: round(m, 3) for fmt, m in self._multipliers.items()},
+        }
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import asyncio
+from uuid import UUID
+
+import pyarrow as pa
+
+from ..core.config import ArtefactSettings, settings
+from ..models import ParseResult
+from .persistence import ResultPersister
+
+
+ARTEFACT_VERSION = "1"
+ARTEFACT_CONTENT_TYPE = "application/vnd.apache.arrow.file"
+
+LINES_SCHEMA = pa.schema([
+    ("line_no", pa.int32()),
+    ("page_idx", pa.int32()),
+    ("sheet_name", pa.string()),
+    # Типов блоков немного — словарное кодирование сильно сжимает колонку
+    ("block_type", pa.dictionary(pa.int16(), pa.string())),
+    ("content", pa.large_string()),
+    ("block_id", pa.string()),
+])
+
+IMAGES_SCHEMA = pa.schema([
+    ("key", pa.string()),
+    ("source_block_id", pa.string()),
+    ("alt_text", pa.string()),
+    ("size_bytes", pa.int64()),
+])
+
+
+def artefact_key(doc_id: UUID, kind: str) -> str:
+    """Ключ артефакта в MinIO. kind: "lines" или "images"."""
+    return f"{doc_id}/parsed/{kind}.arrow"
+
+
+def lines_table(doc_id: UUID, result: ParseResult) -> pa.Table:
+    lines = result.lines
+    table = pa.table(
+        {
+            "line_no": [l.line_no for l in lines],
+            "page_idx": [l.page_idx for l in lines],
+            "sheet_name": [l.sheet_name for l in lines],
+            "block_type": pa.array([l.block_type for l in lines], type=pa.string())
+                            .dictionary_encode()
+                            .cast(LINES_SCHEMA.field("block_type").type),
+            "content": [l.content for l in lines],
+            "block_id": [l.block_id for l in lines],
+        },
+        schema=LINES_SCHEMA,
+    )
+    return table.replace_schema_metadata({"doc_id": str(doc_id), "version": ARTEFACT_VERSION})
+
+
+def images_table(doc_id: UUID, result: ParseResult) -> pa.Table:
+    images = result.images
+    table = pa.table(
+        {
+            "key": [i.key for i in images],
+            "source_block_id": [i.source_block_id for i in images],
+            "alt_text": [i.alt_text for i in images],
+            "size_bytes": [len(i.data) for i in images],
+        },
+        schema=IMAGES_SCHEMA,
+    )
+    return table.replace_schema_metadata({"doc_id": str(doc_id), "version": ARTEFACT_VERSION})
+
+
+def serialize_table(table: pa.Table, compression: str) -> bytes:
+    """Пишет таблицу в формате Arrow IPC (file). compression: "zstd", "lz4" или "none"."""
+    sink = pa.BufferOutputStream()
+    options = pa.ipc.IpcWriteOptions(compression=None if compression == "none" else compression)
+    with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+async def write_artefacts(
+    persister: ResultPersister,
+    doc_id: UUID,
+    result: ParseResult,
+    config: ArtefactSettings | None = None,
+) -> dict[str, str]:
+    """Сохраняет строки и метаданные изображений как колоночные артефакты. Возвращает их ключи."""
+    cfg = config or settings.artefact
+    # Сборка таблиц и сжатие — CPU-работа на весь документ, не держим ею event loop
+    loop = asyncio.get_running_loop()
+    blobs = await loop.run_in_executor(None, _serialize_result, doc_id, result, cfg.compression)
+    keys: dict[str, str] = {}
+    for kind, blob in blobs.items():
+        key = artefact_key(doc_id, kind)
+        await persister.put_object(key, blob, ARTEFACT_CONTENT_TYPE)
+        keys[kind] = key
+    return keys
+
+
+def _serialize_result(doc_id: UUID, result: ParseResult, compression: str) -> dict[str, bytes]:
+    return {
+        "lines": serialize_table(lines_table(doc_id, result), compression),
+        "images": serialize_table(images_table(doc_id, result), compression),
+    }
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+from typing import Iterable
+from uuid import UUID
+
+from ..core.config import PersistenceSettings, PostgresSettings, settings
+from ..models import Line
+
+
+# Колонки таблицы строк DataClient (DocumentLineORM), которые заполняет парсер
+_COLUMNS = ("doc_id", "position", "page_idx", "block_id", "block_type", "content", "sheet_name")
+# Временная таблица живет в сессии соединения пула и переиспользуется задачами
+_STAGING = "parser_lines_staging"
+
+
+def _record(doc_id: UUID, line: Line) -> tuple:
+    return (doc_id, line.line_no, line.page_idx, line.block_id, line.block_type, line.content, line.sheet_name)
+
+
+class BulkLineWriter:
+    """
+    Запись строк документа через COPY вместо одного INSERT со всеми строками в DataClient.
+
+    Строки идут порциями по `lines_batch_size` командой COPY во временную таблицу:
+    клиенту не нужно собирать параметры всех строк, и пока они передаются, таблица строк
+    не заблокирована. Затем одна короткая транзакция заменяет строки документа
+    (DELETE + INSERT ... SELECT на стороне сервера), поэтому повтор после ошибки безопасен.
+    """
+
+    def __init__(self, config: PersistenceSettings | None = None, postgres: PostgresSettings | None = None):
+        self._cfg = config or settings.persistence
+        self._pg = postgres or settings.postgres
+        self._pool = None
+        self._pool_lock = asyncio.Lock()
+
+    async def _get_pool(self):
+        async with self._pool_lock:
+            if self._pool is None:
+                # asyncpg нужен только роли, которая сохраняет результаты
+                import asyncpg
+
+                self._pool = await asyncpg.create_pool(
+                    user=self._pg.user, password=self._pg.password,
+                    host=self._pg.host, port=self._pg.port, database=self._pg.db,
+                    min_size=1, max_size=self._cfg.copy_pool_size,
+                )
+            return self._pool
+
+    async def replace_lines(self, doc_id: UUID, lines: Iterable[Line]) -> int:
+        """Заменяет строки документа; возвращает число записанных строк."""
+        table = self._cfg.lines_table
+        columns = ", ".join(_COLUMNS)
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            await conn.execute(
+                f"CREATE TEMP TABLE IF NOT EXISTS {_STAGING} "
+                "(doc_id uuid, position integer, page_idx integer, block_id text, "
+                "block_type text, content text, sheet_name text)"
+            )
+            # TRUNCATE и в начале: после ошибки в таблице могли остаться строки прошлой задачи
+            await conn.execute(f"TRUNCATE {_STAGING}")
+            records = (_record(doc_id, line) for line in lines)
+            copied = 0
+            while batch := list(itertools.islice(records, self._cfg.lines_batch_size)):
+                await conn.copy_records_to_table(_STAGING, records=batch, columns=_COLUMNS)
+                copied += len(batch)
+
+            async with conn.transaction():
+                await conn.execute(f"DELETE FROM {table} WHERE doc_id = $1", doc_id)
+                # id у DocumentLineORM генерирует Python-сторона SQLAlchemy — здесь его задает сервер
+                await conn.execute(
+                    f"INSERT INTO {table} (id, {columns}) "
+                    f"SELECT gen_random_uuid(), {columns} FROM {_STAGING} ORDER BY position"
+                )
+            await conn.execute(f"TRUNCATE {_STAGING}")
+        return copied
+
+    async def close(self) -> None:
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
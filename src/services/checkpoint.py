@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+from uuid import UUID
+
+from redis.asyncio import Redis
+
+from ..core.config import CheckpointSettings, settings
+from ..models import ImageArtefact, ParseResult
+from .persistence import ResultPersister, SaveState
+
+
+# HASH с указателями на части результата задачи. Хеш содержимого в ключе: если файл документа
+# заменили, старая контрольная точка просто не найдется и истечет по TTL
+CHECKPOINT_KEY = "parsing_checkpoint:{doc_id}:{content_hash}"
+# Сами части (куски Marker, результат без байтов изображений) — объекты в MinIO, не в общем Redis.
+# clear() удаляет их после успеха; брошенные задачами объекты удаляет правило жизненного цикла
+# бакета на префикс checkpoints/
+CHECKPOINT_OBJECT = "checkpoints/{doc_id}/{content_hash}/{name}.json"
+
+_RESULT_FIELD = "result"
+_CHUNK_FIELD = "chunk:{chunk_id}"
+_LINES_SAVED_FIELD = "lines_saved"
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _dump_result(result: ParseResult) -> bytes:
+    # Байты изображений не дублируем: они уже загружены под своими ключами, в JSON — только ключи
+    payload = result.model_dump(exclude={"images"})
+    payload["images"] = [img.model_dump(exclude={"data"}) for img in result.images]
+    return json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+
+class JobCheckpoint:
+    """
+    Контрольная точка одной задачи: готовые куски Marker, результат парсинга,
+    описания изображений от LLM и состояние стадии SAVING.
+    Повторный запуск той же задачи (после падения или передачи другому воркеру)
+    пропускает уже выполненную работу.
+    """
+
+    def __init__(
+        self,
+        redis_client: Redis,
+        persister: ResultPersister,
+        doc_id: UUID,
+        digest: str,
+        config: CheckpointSettings,
+    ):
+        self._redis = redis_client
+        self._persister = persister
+        self._cfg = config
+        self.doc_id = doc_id
+        self._digest = digest
+        self.key = CHECKPOINT_KEY.format(doc_id=doc_id, content_hash=digest)
+        # Описания изображений — отдельный HASH: image_hash -> alt-текст
+        self._alt_key = f"{self.key}:alt"
+        # Ключи уже загруженных изображений — SET, пополняется по одному
+        self._uploaded_key = f"{self.key}:uploaded"
+
+    async def _touch(self, pipe) -> None:
+        for key in (self.key, self._alt_key, self._uploaded_key):
+            pipe.expire(key, self._cfg.ttl_s)
+        await pipe.execute()
+
+    async def _save_blob(self, field: str, name: str, result: ParseResult) -> bool:
+        """Пишет часть результата в MinIO и указатель на нее в Redis. Ошибка не прерывает задачу."""
+        loop = asyncio.get_event_loop()
+        # Сериализация результата — секунды CPU на больших документах
+        data = await loop.run_in_executor(None, _dump_result, result)
+        if len(data) > self._cfg.max_entry_bytes:
+            print(f"[Checkpoint] doc_id={self.doc_id}: '{field}' is {len(data)} bytes, not saved")
+            return False
+        object_key = CHECKPOINT_OBJECT.format(doc_id=self.doc_id, content_hash=self._digest, name=name)
+        try:
+            # Изображения грузим сразу под окончательными ключами и отмечаем как загруженные:
+            # стадия SAVING их пропустит, и байты не хранятся в MinIO дважды
+            await self._upload_images(result.images)
+            await self._persister.put_object(object_key, data, "application/json")
+        except Exception as e:
+            print(f"[Checkpoint] doc_id={self.doc_id}: '{field}' not saved: {type(e).__name__}: {e}")
+            return False
+        pipe = self._redis.pipeline()
+        pipe.hset(self.key, field, object_key)
+        await self._touch(pipe)
+        return True
+
+    async def _upload_images(self, images: list[ImageArtefact]) -> None:
+        uploaded = await self._redis.smembers(self._uploaded_key)
+
+        async def upload(img: ImageArtefact) -> None:
+            await self._persister.put_image(img)
+            await self.record_saved(img.key)
+
+        await asyncio.gather(*(upload(img) for img in images if img.key not in uploaded))
+
+    async def _load_blob(self, field: str) -> ParseResult | None:
+        object_key = await self._redis.hget(self.key, field)
+        if not object_key:
+            return None
+        loop = asyncio.get_event_loop()
+        try:
+            payload = await loop.run_in_executor(None, json.loads, await self._persister.get_object(object_key))
+            blobs = await asyncio.gather(*(self._persister.get_object(img["key"]) for img in payload["images"]))
+        except Exception as e:
+            # Объект мог уже удалить lifecycle-правило — просто выполняем работу заново
+            print(f"[Checkpoint] doc_id={self.doc_id}: '{field}' not restored: {type(e).__name__}: {e}")
+            return None
+        payload["images"] = [ImageArtefact(**img, data=blob) for img, blob in zip(payload["images"], blobs)]
+        return await loop.run_in_executor(None, lambda: ParseResult(**payload))
+
+    # --- Куски Marker ---
+    async def load_chunk(self, chunk_id: str) -> ParseResult | None:
+        return await self._load_blob(_CHUNK_FIELD.format(chunk_id=chunk_id))
+
+    async def save_chunk(self, chunk_id: str, result: ParseResult) -> None:
+        # В id куска есть ":" и "," — имя объекта берем по хешу
+        name = f"chunk-{hashlib.sha256(chunk_id.encode()).hexdigest()[:16]}"
+        await self._save_blob(_CHUNK_FIELD.format(chunk_id=chunk_id), name, result)
+
+    # --- Результат стадии PARSING целиком ---
+    def pays_off(self, fmt: str, file_size: int, parse_s: float) -> bool:
+        """Стоит ли сохранять результат: повтор однострочного .txt дешевле записи в MinIO."""
+        return (
+            fmt in self._cfg.formats
+            or file_size >= self._cfg.min_file_mb * 1024 * 1024
+            or parse_s >= self._cfg.min_parse_s
+        )
+
+    async def load_result(self) -> ParseResult | None:
+        return await self._load_blob(_RESULT_FIELD)
+
+    async def save_result(self, result: ParseResult) -> None:
+        if await self._save_blob(_RESULT_FIELD, _RESULT_FIELD, result):
+            # Куски больше не нужны: при повторе парсинг пропускается целиком.
+            # Отметка о строках относится к прежнему результату; загруженные изображения
+            # (ключи уникальны) остаются в силе
+            chunks = {f: k for f, k in (await self._redis.hgetall(self.key)).items() if f.startswith("chunk:")}
+            await self._redis.hdel(self.key, _LINES_SAVED_FIELD, *chunks)
+            await self._remove_objects(chunks.values())
+
+    # --- Описания изображений ---
+    @staticmethod
+    def image_hash(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    async def load_alt_texts(self) -> dict[str, str]:
+        return await self._redis.hgetall(self._alt_key)
+
+    async def save_alt_text(self, image_hash: str, alt_text: str) -> None:
+        pipe = self._redis.pipeline()
+        pipe.hset(self._alt_key, image_hash, alt_text)
+        await self._touch(pipe)
+
+    # --- Стадия SAVING ---
+    async def load_save_state(self) -> SaveState | None:
+        pipe = self._redis.pipeline()
+        pipe.hget(self.key, _LINES_SAVED_FIELD)
+        pipe.smembers(self._uploaded_key)
+        lines_saved, uploaded = await pipe.execute()
+        if not lines_saved and not uploaded:
+            return None
+        return SaveState(lines_saved=bool(lines_saved), uploaded_keys=set(uploaded))
+
+    async def record_saved(self, image_key: str | None) -> None:
+        """Отмечает один шаг SAVING: None — строки записаны, иначе — загружено изображение image_key."""
+        pipe = self._redis.pipeline()
+        if image_key is None:
+            pipe.hset(self.key, _LINES_SAVED_FIELD, "1")
+        else:
+            pipe.sadd(self._uploaded_key, image_key)
+        await self._touch(pipe)
+
+    async def clear(self) -> None:
+        object_keys = [k for f, k in (await self._redis.hgetall(self.key)).items() if f != _LINES_SAVED_FIELD]
+        await self._redis.delete(self.key, self._alt_key, self._uploaded_key)
+        await self._remove_objects(object_keys)
+
+    async def _remove_objects(self, object_keys) -> None:
+        for object_key in object_keys:
+            try:
+                await self._persister.remove_object(object_key)
+            except Exception as e:
+                # Не удалось — объект удалит правило жизненного цикла на префикс checkpoints/
+                print(f"[Checkpoint] doc_id={self.doc_id}: '{object_key}' not removed: {type(e).__name__}: {e}")
+
+
+class CheckpointStore:
+    """Создает контрольные точки задач, ключ — doc_id и SHA-256 содержимого файла."""
+
+    def __init__(self, redis_client: Redis, persister: ResultPersister, config: CheckpointSettings | None = None):
+        self._redis = redis_client
+        self._persister = persister
+        self._cfg = config or settings.checkpoint
+
+    async def open(self, doc_id: UUID, raw_bytes: bytes, parse_images: bool = False) -> JobCheckpoint:
+        # Хеш многогигабайтного файла не должен блокировать event loop
+        digest = await asyncio.get_event_loop().run_in_executor(None, content_hash, raw_bytes)
+        # Результат без изображений не годится для задачи, которой они нужны
+        if parse_images:
+            digest = f"{digest}-img"
+        return JobCheckpoint(self._redis, self._persister, doc_id, digest, self._cfg)
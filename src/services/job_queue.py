@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import json
+import time
+from uuid import UUID
+
+from redis.asyncio import Redis
+
+from ..core.config import SchedulerSettings, settings
+from ..models import ProbeResult
+from .scheduler import HEAVY_LANE, LIGHT_LANE, ParseJob, estimate_job
+
+
+QUEUE_KEY = "parsing_queue:{lane}"          # ZSET: задачи полосы, score — приоритет и срок (ParseJob.due_at)
+JOB_KEY = "parsing_job:{doc_id}"            # payload задачи в очереди (нужен для ZREM при отмене)
+INFLIGHT_KEY = "parsing_inflight:{worker}"  # HASH doc_id -> payload: задачи, взятые воркером
+WORKER_KEY = "parsing_worker:{worker}"      # heartbeat воркера с TTL
+CANCEL_KEY = "parsing_cancelled:{doc_id}"   # отмена задачи, уже взятой воркером (pub/sub не хранит сообщения)
+CANCEL_CHANNEL = "parsing_cancel"
+
+# Атомарно забираем задачу с наименьшим score и записываем ее во inflight воркера,
+# чтобы она не потерялась, если воркер упадет сразу после извлечения
+_CLAIM_SCRIPT = """
+local item = redis.call('ZPOPMIN', KEYS[1])
+if #item == 0 then return false end
+local job = cjson.decode(item[1])
+redis.call('HSET', KEYS[2], job['doc_id'], item[1])
+return item[1]
+"""
+
+# Одна задача на doc_id: повторная постановка вытесняет из очереди прежний payload.
+# KEYS: JOB_KEY, очередь полосы, обе очереди, CANCEL_KEY; ARGV: payload, score, TTL, "1" — сбросить отмену
+_PUSH_SCRIPT = """
+local old = redis.call('GET', KEYS[1])
+local removed = 0
+if old then
+  removed = redis.call('ZREM', KEYS[3], old) + redis.call('ZREM', KEYS[4], old)
+end
+redis.call('ZADD', KEYS[2], ARGV[2], ARGV[1])
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3])
+if ARGV[4] == '1' then redis.call('DEL', KEYS[5]) end
+return removed
+"""
+
+# Задача завершена. JOB_KEY удаляем, только если за это время doc_id не поставили в очередь заново,
+# иначе новую задачу нельзя будет отменить.
+# KEYS: inflight воркера, JOB_KEY, обе очереди, CANCEL_KEY; ARGV: doc_id
+_ACK_SCRIPT = """
+redis.call('HDEL', KEYS[1], ARGV[1])
+local payload = redis.call('GET', KEYS[2])
+if payload and (redis.call('ZSCORE', KEYS[3], payload) or redis.call('ZSCORE', KEYS[4], payload)) then
+  return 0
+end
+redis.call('DEL', KEYS[2], KEYS[5])
+return 1
+"""
+
+_JOB_TTL = 7 * 24 * 3600
+_LANE_KEYS = [QUEUE_KEY.format(lane=HEAVY_LANE), QUEUE_KEY.format(lane=LIGHT_LANE)]
+
+
+def _score(job: ParseJob, config: SchedulerSettings) -> float:
+    # Приоритет важнее срока (due_at — секунды Unix, меньше 1e11); при равенстве score
+    # Redis сортирует по payload, а он начинается с enqueued_at — получаем FIFO
+    return -job.priority * 1e11 + job.due_at(config)
+
+
+class RedisJobQueue:
+    """
+    Очередь задач в Redis между API-ролью и воркерами.
+    Интерфейс submit/cancel совпадает с JobScheduler, поэтому эндпоинты не зависят от роли.
+    """
+
+    def __init__(self, redis_client: Redis, config: SchedulerSettings | None = None):
+        self._redis = redis_client
+        self._cfg = config or settings.scheduler
+        self._claim = self._redis.register_script(_CLAIM_SCRIPT)
+        self._push_script = self._redis.register_script(_PUSH_SCRIPT)
+        self._ack = self._redis.register_script(_ACK_SCRIPT)
+
+    # -----------------------------------------------------------------
+    @staticmethod
+    def _payload(job: ParseJob) -> str:
+        return json.dumps({"enqueued_at": f"{time.time():017.6f}", **job.to_dict()})
+
+    async def _push(self, job: ParseJob, reset_cancel: bool = False) -> bool:
+        """Ставит задачу в очередь. True — из очереди вытеснена прежняя задача того же doc_id."""
+        replaced = await self._push_script(
+            keys=[
+                JOB_KEY.format(doc_id=job.doc_id), QUEUE_KEY.format(lane=job.lane),
+                *_LANE_KEYS, CANCEL_KEY.format(doc_id=job.doc_id),
+            ],
+            args=[self._payload(job), repr(_score(job, self._cfg)), _JOB_TTL, "1" if reset_cancel else "0"],
+        )
+        return bool(replaced)
+
+    async def submit(
+        self,
+        doc_id: UUID,
+        file_name: str,
+        parse_images: bool = False,
+        priority: int = 0,
+        file_size: int | None = None,
+        page_count: int | None = None,
+        timeout_s: float | None = None,
+        probe: ProbeResult | None = None,
+    ) -> ParseJob:
+        cost, lane = estimate_job(file_name, file_size, page_count, probe, self._cfg)
+        job = ParseJob(
+            doc_id=doc_id,
+            file_name=file_name,
+            parse_images=parse_images,
+            priority=priority,
+            cost=cost,
+            lane=lane,
+            timeout_s=timeout_s,
+            file_size=probe.file_size if probe is not None else file_size,
+            submitted_at=time.time(),
+        )
+        # Новая постановка снимает отмену предыдущей задачи этого документа
+        replaced = await self._push(job, reset_cancel=True)
+        print(
+            f"[JobQueue] Queued doc_id={doc_id} lane={job.lane} priority={priority} cost={cost:.1f}"
+            + (" (replaced queued job)" if replaced else "")
+        )
+        return job
+
+    async def cancel(self, doc_id: UUID) -> bool:
+        """Снимает задачу с очереди или просит воркер, который ее выполняет, остановиться."""
+        payload = await self._redis.get(JOB_KEY.format(doc_id=doc_id))
+        if payload is None:
+            return False
+        lane = json.loads(payload)["lane"]
+        removed = await self._redis.zrem(QUEUE_KEY.format(lane=lane), payload)
+        await self._redis.delete(JOB_KEY.format(doc_id=doc_id))
+        if removed:
+            status = {
+                "status": "FAILURE", "stage": "QUEUED", "progress": 0.0,
+                "error": "JobCancelled: Cancelled before start",
+            }
+            await self._redis.set(f"parsing_status:{doc_id}", json.dumps(status), ex=3600)
+        # Документ мог одновременно выполняться у воркера и ждать повторного запуска в очереди
+        # (как в JobScheduler.cancel), поэтому выполняющуюся копию останавливаем всегда.
+        # Флаг нужен, если воркер взял задачу, но еще не запустил, и сообщение из канала
+        # пришло раньше, чем задача появилась в оркестраторе
+        await self._redis.set(CANCEL_KEY.format(doc_id=doc_id), "1", ex=_JOB_TTL)
+        await self._redis.publish(CANCEL_CHANNEL, str(doc_id))
+        return True
+
+    async def is_cancelled(self, doc_id: UUID) -> bool:
+        return bool(await self._redis.exists(CANCEL_KEY.format(doc_id=doc_id)))
+
+    # --- Сторона воркера ---
+    async def claim(self, lane: str, worker_id: str) -> ParseJob | None:
+        payload = await self._claim(keys=[QUEUE_KEY.format(lane=lane), INFLIGHT_KEY.format(worker=worker_id)])
+        if not payload:
+            return None
+        data = json.loads(payload)
+        data.pop("enqueued_at", None)
+        return ParseJob.from_dict(data)
+
+    async def ack(self, worker_id: str, doc_id: UUID) -> None:
+        await self._ack(
+            keys=[
+                INFLIGHT_KEY.format(worker=worker_id), JOB_KEY.format(doc_id=doc_id),
+                *_LANE_KEYS, CANCEL_KEY.format(doc_id=doc_id),
+            ],
+            args=[str(doc_id)],
+        )
+
+    async def requeue(self, job: ParseJob, worker_id: str | None = None) -> None:
+        """Возвращает незавершенную задачу в очередь (передача другому воркеру)."""
+        await self._push(job)
+        if worker_id:
+            await self._redis.hdel(INFLIGHT_KEY.format(worker=worker_id), str(job.doc_id))
+        status = {"status": "PENDING", "stage": "QUEUED", "progress": 0.0}
+        await self._redis.set(f"parsing_status:{job.doc_id}", json.dumps(status), ex=3600)
+        print(f"[JobQueue] Requeued doc_id={job.doc_id}")
+
+    async def heartbeat(self, worker_id: str, ttl: int) -> None:
+        await self._redis.set(WORKER_KEY.format(worker=worker_id), str(time.time()), ex=ttl)
+
+    async def recover_orphans(self) -> int:
+        """Возвращает в очередь задачи воркеров, переставших слать heartbeat."""
+        recovered = 0
+        async for key in self._redis.scan_iter(match=INFLIGHT_KEY.format(worker="*")):
+            worker_id = key.split(":", 1)[1]
+            if await self._redis.exists(WORKER_KEY.format(worker=worker_id)):
+                continue
+            for payload in (await self._redis.hgetall(key)).values():
+                data = json.loads(payload)
+                data.pop("enqueued_at", None)
+                await self.requeue(ParseJob.from_dict(data))
+                recovered += 1
+            await self._redis.delete(key)
+        return recovered
+
+    async def sizes(self) -> dict[str, int]:
+        return {lane: await self._redis.zcard(QUEUE_KEY.format(lane=lane)) for lane in (HEAVY_LANE, LIGHT_LANE)}
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import asyncio
+import time
 from io import BytesIO
 from pathlib import Path
 from uuid import UUID
@@ -10,15 +11,26 @@ import traceback
 
 from sensory_data_client import DataClient 
 from ..adapters.llm_image import ImageDescriber
-from ..models import Line
+from ..core.limits import (
+    JobCancelled, JobContext, JobDeadlineExceeded, check_current, current_job, job_scope, run_isolated,
+)
+from ..models import ImageArtefact, Line, ParseResult
 from ..parsers.base import BaseParser
 from ..parsers.pdf_marker import PdfMarkerParser
 from ..parsers.marker_parser import UnifiedMarkerParser
+from ..parsers.marker_pool import get_model_dict
 from ..parsers.docx_parser import DocxParser
 from ..parsers.xlsx_parser import XlsxParser
 from ..parsers.txt_parser import TxtParser
 from ..parsers.img_parser import ImgParser
 from ..parsers.code_parser import CodeParser
+from ..parsers.archive_parser import ArchiveParser, ARCHIVE_EXTENSIONS
+from ..parsers.format_probe import detect_format, resolve_format
+from ..core.config import settings
+from .admission import MemoryAdmission, Reservation
+from .artefact import write_artefacts
+from .checkpoint import CheckpointStore, JobCheckpoint
+from .persistence import PersistenceError, ResultPersister
 
 
 class OrchestratorService:
@@ -31,11 +43,21 @@ class OrchestratorService:
         data_client: DataClient, # <-- Принимаем DataClient
         redis_client: Redis,
         llm: ImageDescriber | None = None,
+        preload_models: bool = True,
     ):
         self._data_client = data_client # <-- Сохраняем его
         self._redis = redis_client
         self._llm = llm
+        self._persister = ResultPersister(data_client)
+        self._checkpoints = CheckpointStore(redis_client, self._persister)
+        self._jobs: dict[UUID, JobContext] = {}
         self._parsers = self._register_parsers()
+        if preload_models:
+            # Модели Marker грузим при старте, а не на первом PDF. Без них (например, в нагрузочном
+            # стенде без PDF) сервис работает без сети: модели загрузятся, только если придет PDF
+            get_model_dict()
+        # Бюджет считается после загрузки моделей — их память в него не входит
+        self._admission = MemoryAdmission(redis_client)
 
     async def _set_status(
         self,
@@ -43,10 +65,14 @@ class OrchestratorService:
         status: str,
         stage: str | None = None,
         error_message: str | None = None,
-        result_data: dict | None = None
+        result_data: dict | None = None,
+        details: dict | None = None,
     ):
         """Устанавливает расширенный статус задачи в Redis."""
         key = f"parsing_status:{doc_id}"
+        ctx = current_job()
+        if ctx is not None and status == "IN_PROGRESS" and stage:
+            ctx.enter_stage(stage)
         
         progress = 0.0
         if stage and status == "IN_PROGRESS":
@@ -65,6 +91,7 @@ class OrchestratorService:
             "progress": round(progress, 2), # Округляем до 2 знаков
             "error": error_message,
             "result": result_data,
+            "details": details,
         }
         # Удаляем ключи с None, чтобы не засорять Redis
         payload_cleaned = {k: v for k, v in payload.items() if v is not None}
@@ -73,8 +100,8 @@ class OrchestratorService:
     # -----------------------------------------------------------------
     def _register_parsers(self) -> dict[str, BaseParser]:
         """Регистрирует все доступные парсеры по расширениям файлов."""
-        return {
-            ".pdf": UnifiedMarkerParser(), ".pptx": PdfMarkerParser(),
+        parsers: dict[str, BaseParser] = {
+            ".pdf": UnifiedMarkerParser(settings.marker), ".pptx": PdfMarkerParser(),
             ".docx": DocxParser(),
             ".xlsx": XlsxParser(), ".xls": XlsxParser(),
             ".txt": TxtParser(), ".md": TxtParser(),
@@ -82,72 +109,324 @@ class OrchestratorService:
             ".py": CodeParser(), ".js": CodeParser(), ".ts": CodeParser(),
             ".c": CodeParser(), ".cpp": CodeParser(), ".go": CodeParser(), ".rs": CodeParser(),
         }
+        archive_parser = ArchiveParser(self._select_parser, run_parser=self._run_parser)
+        parsers.update({ext: archive_parser for ext in ARCHIVE_EXTENSIONS})
+        return parsers
 
     # -----------------------------------------------------------------
-    def _select_parser(self, file_name: str) -> BaseParser:
-        ext = Path(file_name).suffix.lower()
+    def _select_parser(self, file_name: str, detected_format: str | None = None) -> BaseParser:
+        # Формат по содержимому (если известен) важнее расширения
+        ext = resolve_format(file_name, detected_format)
         return self._parsers.get(ext, TxtParser())
 
+    def _archive_progress(self, doc_id: UUID):
+        """Колбэк для ArchiveParser: пишет прогресс по файлам архива в статус задачи."""
+        failed: list[str] = []
+
+        async def on_member(name: str, done: int, total: int | None, error: str | None) -> None:
+            if error:
+                failed.append(name)
+            await self._set_status(
+                doc_id, "IN_PROGRESS", stage="PARSING",
+                details={
+                    "members_done": done,
+                    "members_total": total,
+                    "last_member": name,
+                    "failed_members": failed[-20:],
+                },
+            )
+
+        return on_member
+
+    # -----------------------------------------------------------------
+    async def _run_parser(self, parser: BaseParser, **kwargs) -> ParseResult:
+        """Запускает парсер: изолируемые — в отдельном процессе с лимитами ресурсов."""
+        if parser.isolated and settings.limits.isolate_parsers:
+            return await run_isolated(
+                parser, kwargs,
+                memory_mb=settings.limits.worker_memory_mb,
+                cpu_seconds=settings.limits.worker_cpu_seconds,
+            )
+        return await parser.parse(**kwargs)
+
+    async def close(self) -> None:
+        """Закрывает соединения стадии SAVING (пул COPY в PostgreSQL)."""
+        await self._persister.close()
+
+    def cancel(self, doc_id: UUID) -> bool:
+        """Отменяет выполняющуюся задачу. Возвращает False, если такой задачи нет."""
+        ctx = self._jobs.get(doc_id)
+        if ctx is None:
+            return False
+        print(f"[Orchestrator] Cancelling doc_id={doc_id}")
+        ctx.cancel()
+        return True
+
     # -----------------------------------------------------------------
     async def process_document(
-        self, doc_id: UUID, file_name: str, parse_images: bool = False
+        self,
+        doc_id: UUID,
+        file_name: str,
+        parse_images: bool = False,
+        timeout_s: float | None = None,
+        reservation: Reservation | None = None,
     ) -> None:
-        """Полный конвейер обработки одного документа."""
+        """
+        Полный конвейер обработки одного документа с дедлайном и возможностью отмены.
+        reservation — память, заранее зарезервированная планировщиком (reserve_memory);
+        освобождает ее вызывающий. Без нее память резервируется после скачивания файла.
+        """
+        timeout_s = timeout_s if timeout_s is not None else settings.limits.default_timeout_s
+        ctx = JobContext(
+            doc_id=doc_id,
+            deadline=time.monotonic() + timeout_s if timeout_s else None,
+            task=asyncio.current_task(),
+        )
+        if reservation is not None and reservation.waited_s:
+            ctx.stage_timings["WAITING_FOR_MEMORY"] = reservation.waited_s
+        self._jobs[doc_id] = ctx
+        # Дедлайн отменяет задачу таймером. TimeoutError не ловим: так внутри конвейера
+        # падают и сетевые таймауты, их нельзя выдавать за истекший дедлайн
+        timer = asyncio.get_running_loop().call_later(timeout_s, ctx.expire) if timeout_s else None
         try:
-            await self._set_status(doc_id, "IN_PROGRESS")
-            print(f"[Orchestrator] Starting processing for doc_id={doc_id}, file_name='{file_name}'")
-
-            # СТАДИЯ 1: DOWNLOADING
-            await self._set_status(doc_id, "IN_PROGRESS", stage="DOWNLOADING")
-            raw_bytes = await self._data_client.get_file(doc_id)
-            
-            # СТАДИЯ 2: PARSING
-            await self._set_status(doc_id, "IN_PROGRESS", stage="PARSING")
-            parser = self._select_parser(file_name)
-            parse_result = await parser.parse(
-                doc_id=doc_id, file_content=BytesIO(raw_bytes), parse_images=parse_images
-            )
-            
-            # СТАДИЯ 3: ANALYZING_IMAGES
-            if parse_images and parse_result.images and self._llm:
-                await self._set_status(doc_id, "IN_PROGRESS", stage="ANALYZING_IMAGES")
-                describe_tasks = [self._llm.describe(img.data) for img in parse_result.images]
-                descriptions = await asyncio.gather(*describe_tasks, return_exceptions=True)
-                
-                for img, desc_or_exc in zip(parse_result.images, descriptions):
-                    if isinstance(desc_or_exc, Exception):
-                        print(f"Warning: Failed to get LLM description for image {img.key}: {desc_or_exc}")
-                        continue
-                    img.alt_text = desc_or_exc
-                    # Обновляем MD-строку с alt-текстом
-                    for line in parse_result.lines:
-                        if line.block_id and line.block_id == img.source_block_id:
-                            img_path_in_md = f"../images/{Path(img.key).name}"
-                            line.content = f"![{img.alt_text}]({img_path_in_md})"
-                            break
-
-             # СТАДИЯ 4: SAVING
-            await self._set_status(doc_id, "IN_PROGRESS", stage="SAVING")
-            upload_tasks = [
-                self._data_client.put_object(img.key, img.data, "image/png")
-                for img in parse_result.images
-            ]
-            db_task = self._data_client.save_document_lines(doc_id, parse_result.lines)
-            await asyncio.gather(db_task, *upload_tasks)
-
-            # ФИНАЛ: SUCCESS
-            result_summary = {
-                "lines_count": len(parse_result.lines),
-                "images_count": len(parse_result.images),
-            }
-            await self._set_status(doc_id, "SUCCESS", stage="SUCCESS", result_data=result_summary)
-            print(f"[Orchestrator] Finished. Doc ID: {doc_id}. Success.")
+            with job_scope(ctx):
+                try:
+                    await self._run_pipeline(doc_id, file_name, parse_images, reservation)
+                finally:
+                    if timer is not None:
+                        timer.cancel()
 
+        except asyncio.CancelledError:
+            if not (ctx.cancelled.is_set() or ctx.expired):
+                # Отмена не по запросу пользователя (например, остановка сервиса)
+                raise
+            # Воркер планировщика продолжает работу со следующей задачей
+            task = asyncio.current_task()
+            if task is not None and hasattr(task, "uncancel"):
+                task.uncancel()
+            if ctx.cancelled.is_set():
+                await self.fail_job(doc_id, JobCancelled("Cancelled by request"))
+            else:
+                await self.fail_job(doc_id, JobDeadlineExceeded(f"Job exceeded its deadline of {timeout_s} s"))
+        except PersistenceError as e:
+            # Показываем, что успело сохраниться: повтор задачи дозапишет остальное
+            await self.fail_job(doc_id, e, details={
+                "lines_saved": e.state.lines_saved,
+                "images_uploaded": len(e.state.uploaded_keys),
+            })
         except Exception as e:
-            # ФИНАЛ: FAILURE
-            error_msg = f"{type(e).__name__}: {e}"
             traceback.print_exc()
-            current_status_json = await self._redis.get(f"parsing_status:{doc_id}")
-            current_stage = json.loads(current_status_json).get("stage") if current_status_json else "UNKNOWN"
-            await self._set_status(doc_id, "FAILURE", stage=current_stage, error_message=error_msg)
-            print(f"[Orchestrator] Finished. Doc ID: {doc_id}. Failure at stage {current_stage}.")
\ No newline at end of file
+            await self.fail_job(doc_id, e)
+        finally:
+            self._jobs.pop(doc_id, None)
+
+    async def fail_job(self, doc_id: UUID, e: BaseException, details: dict | None = None) -> None:
+        """Переводит задачу в FAILURE, сохраняя стадию, на которой она остановилась."""
+        # ФИНАЛ: FAILURE
+        error_msg = f"{type(e).__name__}: {e}"
+        current_status_json = await self._redis.get(f"parsing_status:{doc_id}")
+        current_stage = json.loads(current_status_json).get("stage") if current_status_json else "UNKNOWN"
+        await self._set_status(doc_id, "FAILURE", stage=current_stage, error_message=error_msg, details=details)
+        print(f"[Orchestrator] Finished. Doc ID: {doc_id}. Failure at stage {current_stage}: {error_msg}")
+
+    async def reserve_memory(self, doc_id: UUID, file_name: str, file_size: int | None) -> Reservation:
+        """
+        Резервирует память под задачу до того, как она займет слот полосы. Формат берется
+        по имени файла, после скачивания резерв уточняется. Вернуть — release_memory().
+        """
+        fmt = Path(file_name).suffix.lower()
+        return await self._admission.acquire(fmt, file_size or 0, on_wait=self._memory_wait(doc_id))
+
+    async def release_memory(self, reservation: Reservation) -> None:
+        await self._admission.release(reservation)
+
+    async def _run_pipeline(
+        self, doc_id: UUID, file_name: str, parse_images: bool, reservation: Reservation | None = None
+    ) -> None:
+        await self._set_status(doc_id, "IN_PROGRESS")
+        print(f"[Orchestrator] Starting processing for doc_id={doc_id}, file_name='{file_name}'")
+        if reservation is not None:
+            # Пока задача ждала слота, ее резерв могли отозвать в пользу начатых задач
+            await self._admission.start(reservation, on_wait=self._memory_wait(doc_id))
+
+        # СТАДИЯ 1: DOWNLOADING
+        await self._set_status(doc_id, "IN_PROGRESS", stage="DOWNLOADING")
+        raw_bytes = await self._data_client.get_file(doc_id)
+        
+        ctx = current_job()
+        checkpoint: JobCheckpoint | None = None
+        if settings.checkpoint.enabled:
+            # Контрольная точка привязана к содержимому: повтор той же задачи продолжит с места остановки
+            checkpoint = await self._checkpoints.open(doc_id, raw_bytes, parse_images)
+            if ctx is not None:
+                ctx.checkpoint = checkpoint
+
+        # Парсинг и сохранение — только когда оценка пиковой памяти задачи помещается в бюджет пода
+        detected = detect_format(raw_bytes)
+        fmt = resolve_format(file_name, detected)
+        owned = reservation is None
+        if owned:
+            reservation = await self._admission.acquire(
+                fmt, len(raw_bytes), on_wait=self._memory_wait(doc_id), started=True
+            )
+        else:
+            # Теперь известны настоящие формат и размер файла; не помещается — ждем памяти заново
+            await self._admission.resize(reservation, fmt, len(raw_bytes), on_wait=self._memory_wait(doc_id))
+        try:
+            parse_result, artefacts, resumed = await self._parse_and_save(
+                doc_id, file_name, raw_bytes, parse_images, detected, checkpoint
+            )
+            # Модель памяти учится только на точном замере: ru_maxrss единственного изолированного
+            # процесса (файлы архива разбираются параллельно, их пики не складываются).
+            # Восстановленная из контрольной точки задача парсинг пропустила — это не наблюдение
+            if not resumed and ctx is not None and ctx.child_runs == 1 and ctx.peak_child_rss_mb:
+                reservation.observed_mb = ctx.peak_child_rss_mb
+        finally:
+            if owned:
+                await self._admission.release(reservation)
+
+        # ФИНАЛ: SUCCESS
+        result_summary = {
+            "lines_count": len(parse_result.lines),
+            "images_count": len(parse_result.images),
+        }
+        if ctx is not None:
+            ctx.enter_stage(None)
+            result_summary["timings"] = {stage: round(sec, 3) for stage, sec in ctx.stage_timings.items()}
+        result_summary["memory_mb"] = self._memory_summary(reservation)
+        if parse_result.warnings:
+            result_summary["warnings"] = parse_result.warnings[:50]
+        if artefacts:
+            result_summary["artefacts"] = artefacts
+        if parse_result.ocr_pages:
+            result_summary["ocr_pages_count"] = sum(1 for p in parse_result.ocr_pages if p.ocr)
+            result_summary["text_pages_count"] = sum(1 for p in parse_result.ocr_pages if not p.ocr)
+            result_summary["ocr_pages"] = [p.model_dump() for p in parse_result.ocr_pages]
+        await self._set_status(doc_id, "SUCCESS", stage="SUCCESS", result_data=result_summary)
+        if checkpoint:
+            await checkpoint.clear()
+        print(f"[Orchestrator] Finished. Doc ID: {doc_id}. Success.")
+
+    async def _parse_and_save(
+        self,
+        doc_id: UUID,
+        file_name: str,
+        raw_bytes: bytes,
+        parse_images: bool,
+        detected: str | None,
+        checkpoint: JobCheckpoint | None,
+    ) -> tuple[ParseResult, dict, bool]:
+        # СТАДИЯ 2: PARSING
+        await self._set_status(doc_id, "IN_PROGRESS", stage="PARSING")
+        parse_result = await checkpoint.load_result() if checkpoint else None
+        resumed = parse_result is not None
+        if resumed:
+            print(f"[Orchestrator] doc_id={doc_id}: resumed parse result from checkpoint")
+        else:
+            started = time.perf_counter()
+            parse_result = await self._parse(doc_id, file_name, raw_bytes, parse_images, detected)
+            parse_s = time.perf_counter() - started
+            if checkpoint and checkpoint.pays_off(resolve_format(file_name, detected), len(raw_bytes), parse_s):
+                await checkpoint.save_result(parse_result)
+
+        check_current()
+
+        # СТАДИЯ 3: ANALYZING_IMAGES
+        if parse_images and parse_result.images and self._llm:
+            await self._set_status(doc_id, "IN_PROGRESS", stage="ANALYZING_IMAGES")
+            await self._describe_images(parse_result, checkpoint)
+
+        check_current()
+
+        # СТАДИЯ 4: SAVING
+        await self._set_status(doc_id, "IN_PROGRESS", stage="SAVING")
+        # Загруженные изображения (в том числе контрольной точкой) SAVING пропускает: ключи уникальны.
+        # Отметка о строках годится только для того же результата, а не для повторного парсинга
+        save_state = await checkpoint.load_save_state() if checkpoint else None
+        if save_state is not None and not resumed:
+            save_state.lines_saved = False
+        await self._persister.save(
+            doc_id, parse_result, save_state,
+            on_progress=checkpoint.record_saved if checkpoint else None,
+        )
+        artefacts = (
+            await write_artefacts(self._persister, doc_id, parse_result)
+            if settings.artefact.enabled else {}
+        )
+        return parse_result, artefacts, resumed
+
+    def _memory_wait(self, doc_id: UUID):
+        """Колбэк для MemoryAdmission: показывает в статусе, что задача ждет памяти."""
+
+        async def on_wait(reservation: Reservation) -> None:
+            details = {"waiting_for_memory_mb": round(reservation.estimate_mb), **self._admission.snapshot()}
+            if not reservation.started:
+                # Задача еще не начала работу: она в очереди, пока для нее не найдется память
+                await self._set_status(doc_id, "PENDING", stage="QUEUED", details=details)
+                return
+            # Ожидание памяти начатой задачей — отдельная строка в timings, а не часть PARSING
+            await self._set_status(doc_id, "IN_PROGRESS", stage="WAITING_FOR_MEMORY", details=details)
+
+        return on_wait
+
+    @staticmethod
+    def _memory_summary(reservation: Reservation) -> dict:
+        summary = {"estimated": round(reservation.estimate_mb, 1), "waited_s": round(reservation.waited_s, 3)}
+        if reservation.observed_mb is not None:
+            summary["observed"] = round(reservation.observed_mb, 1)
+        return summary
+
+    async def _parse(
+        self, doc_id: UUID, file_name: str, raw_bytes: bytes, parse_images: bool, detected: str | None
+    ) -> ParseResult:
+        fmt = resolve_format(file_name, detected)
+        if fmt != Path(file_name).suffix.lower():
+            print(f"[Orchestrator] doc_id={doc_id}: content is {fmt}, not {Path(file_name).suffix or 'no extension'}")
+        parser = self._select_parser(file_name, detected)
+        if isinstance(parser, ArchiveParser):
+            parse_result = await parser.parse(
+                doc_id=doc_id, file_content=BytesIO(raw_bytes), parse_images=parse_images,
+                on_member=self._archive_progress(doc_id), file_name=file_name,
+            )
+        else:
+            parse_result = await self._run_parser(
+                parser, doc_id=doc_id, file_content=BytesIO(raw_bytes), parse_images=parse_images
+            )
+
+        if fmt != Path(file_name).suffix.lower():
+            parse_result.warnings.append(f"Parsed as {fmt}: file extension does not match its content")
+        return parse_result
+
+    async def _describe_images(self, parse_result: ParseResult, checkpoint: JobCheckpoint | None) -> None:
+        """Описывает изображения через LLM. Готовые описания берутся из контрольной точки и сохраняются в нее."""
+        cached = await checkpoint.load_alt_texts() if checkpoint else {}
+        pending: list[tuple[ImageArtefact, str]] = []
+        for img in parse_result.images:
+            image_hash = JobCheckpoint.image_hash(img.data)
+            if image_hash in cached:
+                self._apply_alt_text(parse_result, img, cached[image_hash])
+            else:
+                pending.append((img, image_hash))
+
+        async def describe(img: ImageArtefact, image_hash: str) -> str:
+            alt_text = await self._llm.describe(img.data)
+            if checkpoint:
+                await checkpoint.save_alt_text(image_hash, alt_text)
+            return alt_text
+
+        descriptions = await asyncio.gather(*(describe(img, h) for img, h in pending), return_exceptions=True)
+        for (img, _), desc_or_exc in zip(pending, descriptions):
+            if isinstance(desc_or_exc, Exception):
+                print(f"Warning: Failed to get LLM description for image {img.key}: {desc_or_exc}")
+                continue
+            self._apply_alt_text(parse_result, img, desc_or_exc)
+
+    @staticmethod
+    def _apply_alt_text(parse_result: ParseResult, img: ImageArtefact, alt_text: str) -> None:
+        img.alt_text = alt_text
+        # Обновляем MD-строку с alt-текстом
+        for line in parse_result.lines:
+            if line.block_id and line.block_id == img.source_block_id:
+                img_path_in_md = f"../images/{Path(img.key).name}"
+                line.content = f"![{img.alt_text}]({img_path_in_md})"
+                break
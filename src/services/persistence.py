@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import asyncio
+import mimetypes
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, TypeVar
+from uuid import UUID
+
+from sensory_data_client import DataClient
+from ..core.config import PersistenceSettings, settings
+from ..models import ImageArtefact, Line, ParseResult
+from .bulk_lines import BulkLineWriter
+
+
+T = TypeVar("T")
+
+
+@dataclass
+class SaveState:
+    """
+    Что уже успешно сохранено для документа.
+    Повторный вызов `ResultPersister.save` с тем же состоянием
+    дозаписывает только то, что не удалось: строки и незагруженные изображения.
+    """
+    lines_saved: bool = False
+    uploaded_keys: set[str] = field(default_factory=set)
+
+
+class PersistenceError(Exception):
+    """Часть данных не удалось сохранить даже после повторов."""
+
+    def __init__(self, message: str, state: SaveState):
+        self.state = state
+        super().__init__(message)
+
+
+class ResultPersister:
+    """
+    Стадия SAVING: пишет строки в PostgreSQL и грузит изображения в MinIO
+    с ограниченной конкурентностью.
+
+    Строки пишет BulkLineWriter (COPY порциями, затем замена строк документа одной транзакцией).
+    Без него (bulk_lines=false) — `DataClient.save_document_lines`, который заменяет все строки
+    документа одним INSERT; вызывать его частями нельзя — осталась бы только последняя часть.
+    """
+
+    def __init__(self, data_client: DataClient, config: PersistenceSettings | None = None):
+        self._data_client = data_client
+        self._cfg = config or settings.persistence
+        self._upload_sem = asyncio.Semaphore(self._cfg.upload_concurrency)
+        self._large_upload_sem = asyncio.Semaphore(self._cfg.large_upload_concurrency)
+        self._line_writer = BulkLineWriter(self._cfg) if self._cfg.bulk_lines else None
+
+    async def close(self) -> None:
+        if self._line_writer is not None:
+            await self._line_writer.close()
+
+    # -----------------------------------------------------------------
+    async def save(
+        self,
+        doc_id: UUID,
+        result: ParseResult,
+        state: SaveState | None = None,
+        on_progress: Callable[[str | None], Awaitable[None]] | None = None,
+    ) -> SaveState:
+        """
+        Сохраняет результат парсинга. При частичной ошибке бросает PersistenceError с состоянием.
+        on_progress (для контрольных точек) вызывается на каждый шаг: с None после записи строк
+        и с ключом изображения после его загрузки.
+        """
+        state = state or SaveState()
+
+        lines_task = self._save_lines(doc_id, result.lines, state, on_progress)
+        upload_tasks = [
+            self._upload_image(img, state, on_progress)
+            for img in result.images
+            if img.key not in state.uploaded_keys
+        ]
+        outcomes = await asyncio.gather(lines_task, *upload_tasks, return_exceptions=True)
+
+        errors = [o for o in outcomes if isinstance(o, Exception)]
+        if errors:
+            raise PersistenceError(
+                f"{len(errors)} persistence step(s) failed, first: {type(errors[0]).__name__}: {errors[0]}",
+                state,
+            )
+        return state
+
+    # -----------------------------------------------------------------
+    async def _save_lines(
+        self,
+        doc_id: UUID,
+        lines: list[Line],
+        state: SaveState,
+        on_progress: Callable[[str | None], Awaitable[None]] | None = None,
+    ) -> None:
+        if state.lines_saved:
+            return
+        if self._line_writer is not None:
+            await self._with_retries(lambda: self._line_writer.replace_lines(doc_id, lines))
+        else:
+            await self._with_retries(lambda: self._data_client.save_document_lines(doc_id, lines))
+        state.lines_saved = True
+        if on_progress:
+            await on_progress(None)
+
+    async def _upload_image(
+        self,
+        img: ImageArtefact,
+        state: SaveState,
+        on_progress: Callable[[str | None], Awaitable[None]] | None = None,
+    ) -> None:
+        await self.put_image(img)
+        state.uploaded_keys.add(img.key)
+        if on_progress:
+            await on_progress(img.key)
+
+    async def put_image(self, img: ImageArtefact) -> None:
+        content_type = mimetypes.guess_type(img.key)[0] or "image/png"
+        await self.put_object(img.key, img.data, content_type)
+
+    async def put_object(self, key: str, data: bytes, content_type: str) -> None:
+        """Загружает произвольный объект в MinIO с теми же лимитами и повторами, что и изображения."""
+        # minio-py сам переходит на multipart upload для объектов больше 5 MiB,
+        # здесь мы лишь ограничиваем число одновременных крупных загрузок
+        sem = self._large_upload_sem if len(data) > self._cfg.large_object_threshold else self._upload_sem
+        async with sem:
+            await self._with_retries(lambda: self._data_client.put_object(key, data, content_type))
+
+    async def get_object(self, key: str) -> bytes:
+        """Скачивает объект из MinIO с повторами и тем же лимитом одновременных запросов."""
+        async with self._upload_sem:
+            return await self._with_retries(lambda: self._data_client.get_object(key))
+
+    async def remove_object(self, key: str) -> None:
+        # У DataClient нет удаления произвольного объекта — идем в его MinIO-репозиторий
+        await self._with_retries(lambda: self._data_client.minio.remove_object(key))
+
+    async def _with_retries(self, op: Callable[[], Awaitable[T]]) -> T:
+        attempt = 0
+        while True:
+            try:
+                return await op()
+            except Exception as e:
+                attempt += 1
+                if attempt > self._cfg.max_retries:
+                    raise
+                delay = self._cfg.retry_backoff * 2 ** (attempt - 1)
+                print(f"[Persistence] {type(e).__name__}: {e}. Retry {attempt}/{self._cfg.max_retries} in {delay:.1f}s")
+                await asyncio.sleep(delay)
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+from uuid import UUID
+
+import aiohttp
+from redis.asyncio import Redis
+
+from ..core.config import SchedulerSettings, settings
+from ..models import ProbeResult
+from ..parsers.format_probe import detect_format, probe_bytes, resolve_format
+from .scheduler import estimate_job
+
+
+PROBE_KEY = "parsing_probe:{doc_id}"
+_PROBE_TTL = 3600
+
+
+async def load_probe(redis_client: Redis, doc_id: UUID) -> ProbeResult | None:
+    """Результат последней проверки документа, если она была."""
+    payload = await redis_client.get(PROBE_KEY.format(doc_id=doc_id))
+    return ProbeResult.model_validate_json(payload) if payload else None
+
+
+class PreflightProbe:
+    """
+    Предварительная проверка документа до постановки в очередь: формат по содержимому,
+    число страниц/листов/строк/изображений, вероятность сканов и оценка стоимости.
+    Результат кешируется в Redis и используется планировщиком при POST /parse.
+    """
+
+    def __init__(self, data_client, redis_client: Redis, config: SchedulerSettings | None = None):
+        self._data_client = data_client
+        self._redis = redis_client
+        self._cfg = config or settings.scheduler
+        self._download_sem = asyncio.Semaphore(max(1, self._cfg.probe_concurrency))
+
+    async def probe(self, doc_id: UUID, file_name: str, file_size: int | None = None) -> ProbeResult:
+        if file_size is None:
+            file_size = await self._object_size(doc_id)
+        if file_size is not None and file_size > self._max_bytes:
+            # Крупный файл в процесс API не скачиваем: формат — по расширению, стоимость — по размеру
+            result = self._unprobed(file_name, file_size, None)
+        else:
+            # DataClient не умеет читать диапазоны байт, поэтому файл скачивается целиком.
+            # Сама проверка читает только начало файла, оглавление zip и первые страницы PDF
+            async with self._download_sem:
+                raw_bytes = await self._data_client.get_file(doc_id)
+                if len(raw_bytes) > self._max_bytes:
+                    # Клиент занизил размер — pypdfium2 и разбор оглавления не запускаем
+                    result = self._unprobed(file_name, len(raw_bytes), detect_format(raw_bytes))
+                else:
+                    result = await asyncio.get_event_loop().run_in_executor(None, probe_bytes, raw_bytes, file_name)
+        result.estimated_cost, result.lane = estimate_job(file_name, probe=result, config=self._cfg)
+
+        await self._redis.set(PROBE_KEY.format(doc_id=doc_id), result.model_dump_json(), ex=_PROBE_TTL)
+        print(
+            f"[Probe] doc_id={doc_id} format={result.format} (declared {result.declared_format}) "
+            f"cost={result.estimated_cost:.1f} lane={result.lane}"
+        )
+        return result
+
+    @property
+    def _max_bytes(self) -> float:
+        return self._cfg.probe_max_mb * 1024 * 1024
+
+    def _unprobed(self, file_name: str, file_size: int, detected: str | None) -> ProbeResult:
+        declared = Path(file_name).suffix.lower()
+        fmt = resolve_format(file_name, detected)
+        return ProbeResult(
+            file_name=file_name, declared_format=declared, detected_format=detected,
+            format=fmt, format_mismatch=fmt != declared, file_size=file_size,
+            warnings=[f"Not probed: file is larger than {self._cfg.probe_max_mb:g} MB"],
+        )
+
+    async def _object_size(self, doc_id: UUID) -> int | None:
+        """Размер файла без скачивания: DataClient его не отдает, поэтому спрашиваем MinIO про один байт."""
+        try:
+            url = await self._data_client.generate_download_url(doc_id, expires_in=60)
+            async with aiohttp.ClientSession() as session:
+                async with session.get(url, headers={"Range": "bytes=0-0"}) as resp:
+                    # Content-Range: bytes 0-0/<размер>
+                    total = resp.headers.get("Content-Range", "").rpartition("/")[2]
+                    return int(total) if total.isdigit() else None
+        except Exception as e:
+            print(f"[Probe] doc_id={doc_id}: size unknown ({type(e).__name__}: {e}), downloading")
+            return None
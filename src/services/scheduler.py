@@ -0,0 +1,271 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING
+from uuid import UUID
+
+from ..core.config import SchedulerSettings, settings
+from ..core.limits import JobCancelled
+from ..models import ProbeResult
+from ..parsers.format_probe import effective_file_name
+
+if TYPE_CHECKING:
+    # Оркестратор тянет за собой Marker и модели — API-роли он не нужен
+    from .admission import Reservation
+    from .orchestrator import OrchestratorService
+
+
+HEAVY_LANE = "heavy"
+LIGHT_LANE = "light"
+
+# Форматы, которые всегда идут через тяжелую полосу (Marker, модели, OCR, архивы со смешанным содержимым)
+HEAVY_EXTENSIONS = {".pdf", ".pptx", ".zip", ".7z", ".tar", ".tgz", ".gz", ".bz2", ".xz"}
+
+# Грубая модель стоимости в «секундах работы»:
+#   per_page — для постраничных форматов, per_mb — для остальных
+_COST_PER_PAGE = {".pdf": 1.5, ".pptx": 2.0}
+_COST_PER_MB = {
+    ".docx": 0.5, ".xlsx": 2.0, ".xls": 2.0,
+    ".png": 0.2, ".jpg": 0.2, ".jpeg": 0.2, ".gif": 0.2,
+    # Архив: неизвестная смесь форматов, считаем как тяжелый офисный документ
+    ".zip": 5.0, ".7z": 5.0, ".tar": 5.0, ".tgz": 5.0, ".gz": 5.0, ".bz2": 5.0, ".xz": 5.0,
+}
+_DEFAULT_COST_PER_MB = 0.05  # txt, md, исходный код
+_BYTES_PER_PAGE_GUESS = 100 * 1024
+_BASE_COST = 0.5
+# Страница, требующая OCR, обходится в несколько раз дороже страницы с текстовым слоем
+_OCR_COST_FACTOR = 3.0
+
+
+def estimate_cost(
+    file_name: str,
+    file_size: int | None = None,
+    page_count: int | None = None,
+    scanned: bool = False,
+) -> float:
+    """Оценивает стоимость задачи по расширению, размеру файла, числу страниц и необходимости OCR."""
+    ext = Path(file_name).suffix.lower()
+    size_mb = (file_size or 0) / (1024 * 1024)
+
+    if ext in _COST_PER_PAGE:
+        if page_count is None:
+            # Без подсказки считаем страницы по размеру; без размера — одна страница
+            page_count = max(1, (file_size or 0) // _BYTES_PER_PAGE_GUESS)
+        per_page = _COST_PER_PAGE[ext] * (_OCR_COST_FACTOR if scanned else 1.0)
+        return _BASE_COST + per_page * page_count
+
+    return _BASE_COST + _COST_PER_MB.get(ext, _DEFAULT_COST_PER_MB) * size_mb
+
+
+def select_lane(file_name: str, cost: float, config: SchedulerSettings | None = None) -> str:
+    cfg = config or settings.scheduler
+    ext = Path(file_name).suffix.lower()
+    if ext in HEAVY_EXTENSIONS or cost >= cfg.heavy_cost_threshold:
+        return HEAVY_LANE
+    return LIGHT_LANE
+
+
+def estimate_job(
+    file_name: str,
+    file_size: int | None = None,
+    page_count: int | None = None,
+    probe: ProbeResult | None = None,
+    config: SchedulerSettings | None = None,
+) -> tuple[float, str]:
+    """
+    Стоимость и полоса задачи. Результат предварительной проверки (если есть) точнее
+    подсказок клиента: формат берется по содержимому, а не по расширению.
+    """
+    scanned = False
+    if probe is not None:
+        file_name = effective_file_name(file_name, probe.format)
+        file_size = probe.file_size
+        page_count = probe.page_count or page_count
+        scanned = probe.scanned_likely
+    cost = estimate_cost(file_name, file_size, page_count, scanned)
+    return cost, select_lane(file_name, cost, config)
+
+
+@dataclass
+class ParseJob:
+    doc_id: UUID
+    file_name: str
+    parse_images: bool = False
+    priority: int = 0
+    cost: float = 0.0
+    lane: str = LIGHT_LANE
+    seq: int = 0
+    timeout_s: float | None = None
+    # Размер файла, если известен до скачивания: по нему резервируется память
+    file_size: int | None = None
+    # Время постановки (time.time()); при передаче другому воркеру не меняется
+    submitted_at: float = 0.0
+
+    def due_at(self, config: SchedulerSettings | None = None) -> float:
+        """
+        Момент, с которого задачу не обгоняют новые задачи того же приоритета:
+        дешевые задачи идут раньше дорогих, но дорогая ждет не дольше starvation_s.
+        """
+        cfg = config or settings.scheduler
+        return self.submitted_at + min(self.cost * cfg.cost_wait_s, cfg.starvation_s)
+
+    def sort_key(self, config: SchedulerSettings | None = None) -> tuple:
+        # Больший priority раньше; при равном приоритете — по due_at, затем FIFO
+        return (-self.priority, self.due_at(config), self.seq)
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        data["doc_id"] = str(self.doc_id)
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ParseJob":
+        return cls(**{**data, "doc_id": UUID(data["doc_id"])})
+
+
+class JobScheduler:
+    """
+    Планировщик перед `OrchestratorService.process_document`.
+    Держит две полосы (тяжелую и легкую) с собственными очередями и воркерами,
+    чтобы большие PDF не задерживали мелкие текстовые файлы.
+    """
+
+    def __init__(self, orchestrator: OrchestratorService, config: SchedulerSettings | None = None):
+        self._orchestrator = orchestrator
+        self._cfg = config or settings.scheduler
+        self._seq = itertools.count()
+        self._queues: dict[str, asyncio.PriorityQueue] = {
+            HEAVY_LANE: asyncio.PriorityQueue(),
+            LIGHT_LANE: asyncio.PriorityQueue(),
+        }
+        self._workers: list[asyncio.Task] = []
+        # Актуальная запись в очереди для каждого документа: doc_id -> seq.
+        # Запись с другим seq устарела (задачу отменили или отправили заново) и пропускается
+        self._queued: dict[UUID, int] = {}
+        # Задачи, взятые из очереди и ждущие памяти: doc_id -> ожидание (отменяется через cancel)
+        self._reserving: dict[UUID, asyncio.Task] = {}
+
+    # -----------------------------------------------------------------
+    def start(self) -> None:
+        lanes = {HEAVY_LANE: self._cfg.heavy_workers, LIGHT_LANE: self._cfg.light_workers}
+        for lane, count in lanes.items():
+            slots = asyncio.Semaphore(max(1, count))
+            # Исполнителей вдвое больше слотов: пока одни выполняют задачи,
+            # другие ждут памяти под следующие, не занимая слот
+            for i in range(2 * max(1, count)):
+                self._workers.append(
+                    asyncio.create_task(self._worker(lane, slots), name=f"parse-{lane}-{i}")
+                )
+        print(f"[Scheduler] Started workers: {lanes}")
+
+    async def stop(self) -> None:
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+
+    # -----------------------------------------------------------------
+    async def submit(
+        self,
+        doc_id: UUID,
+        file_name: str,
+        parse_images: bool = False,
+        priority: int = 0,
+        file_size: int | None = None,
+        page_count: int | None = None,
+        timeout_s: float | None = None,
+        probe: ProbeResult | None = None,
+    ) -> ParseJob:
+        """Ставит задачу в очередь подходящей полосы."""
+        cost, lane = estimate_job(file_name, file_size, page_count, probe, self._cfg)
+        job = ParseJob(
+            doc_id=doc_id,
+            file_name=file_name,
+            parse_images=parse_images,
+            priority=priority,
+            cost=cost,
+            lane=lane,
+            seq=next(self._seq),
+            timeout_s=timeout_s,
+            file_size=probe.file_size if probe is not None else file_size,
+            submitted_at=time.time(),
+        )
+        # Повторная отправка заменяет задачу, еще ждущую в очереди: документ разберется один раз
+        self._queued[doc_id] = job.seq
+        await self._queues[job.lane].put((job.sort_key(self._cfg), job))
+        print(f"[Scheduler] Queued doc_id={doc_id} lane={job.lane} priority={priority} cost={cost:.1f}")
+        return job
+
+    async def cancel(self, doc_id: UUID) -> bool:
+        """
+        Отменяет задачу: выполняющуюся — останавливает, ожидающую — снимает с очереди.
+        Возвращает False, если задача неизвестна.
+        """
+        # Документ может одновременно выполняться и ждать повторного запуска — снимаем обе записи
+        running = self._orchestrator.cancel(doc_id)
+        queued = self._queued.pop(doc_id, None) is not None
+        waiter = self._reserving.pop(doc_id, None)
+        if waiter is not None:
+            waiter.cancel()
+        if queued and not running:
+            await self._orchestrator.fail_job(doc_id, JobCancelled("Cancelled before start"))
+        return running or queued
+
+    def queue_sizes(self) -> dict[str, int]:
+        return {lane: q.qsize() for lane, q in self._queues.items()}
+
+    # -----------------------------------------------------------------
+    async def _worker(self, lane: str, slots: asyncio.Semaphore) -> None:
+        queue = self._queues[lane]
+        while True:
+            # Задачу берем из очереди, только когда есть свободный слот:
+            # иначе она ждала бы памяти вперед более приоритетных задач
+            async with slots:
+                pass
+            _, job = await queue.get()
+            try:
+                if self._queued.get(job.doc_id) != job.seq:
+                    continue
+                # Память резервируется до слота: ждущая памяти задача не занимает слот полосы
+                reservation = await self._reserve(job)
+                if reservation is None:
+                    continue
+                try:
+                    async with slots:
+                        # Пока ждали памяти или слота, задачу могли отменить или отправить заново
+                        if self._queued.get(job.doc_id) != job.seq:
+                            continue
+                        del self._queued[job.doc_id]
+                        # process_document сам переводит задачу в FAILURE при ошибке
+                        await self._orchestrator.process_document(
+                            doc_id=job.doc_id, file_name=job.file_name, parse_images=job.parse_images,
+                            timeout_s=job.timeout_s, reservation=reservation,
+                        )
+                finally:
+                    await self._orchestrator.release_memory(reservation)
+            except Exception as e:
+                print(f"[Scheduler] Unexpected error for doc_id={job.doc_id}: {type(e).__name__}: {e}")
+            finally:
+                queue.task_done()
+
+    async def _reserve(self, job: ParseJob) -> Reservation | None:
+        """Ждет памяти под задачу. None — задачу отменили, пока она ждала."""
+        waiter = asyncio.create_task(
+            self._orchestrator.reserve_memory(job.doc_id, job.file_name, job.file_size)
+        )
+        self._reserving[job.doc_id] = waiter
+        try:
+            return await waiter
+        except asyncio.CancelledError:
+            # cancel() снимает ожидание с учета, прежде чем отменить его. Ожидание осталось
+            # на учете — значит, отменили сам исполнитель (остановка планировщика)
+            if self._reserving.get(job.doc_id) is waiter:
+                raise
+            return None
+        finally:
+            if self._reserving.get(job.doc_id) is waiter:
+                del self._reserving[job.doc_id]
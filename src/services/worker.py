@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import socket
+from typing import TYPE_CHECKING
+from uuid import UUID, uuid4
+
+from redis.asyncio import Redis
+
+from ..core.config import SchedulerSettings, WorkerSettings, settings
+from ..core.limits import JobCancelled
+from .job_queue import CANCEL_CHANNEL, RedisJobQueue
+from .scheduler import HEAVY_LANE, LIGHT_LANE, ParseJob
+
+if TYPE_CHECKING:
+    from .admission import Reservation
+    from .orchestrator import OrchestratorService
+
+
+class QueueWorker:
+    """
+    Роль воркера: забирает задачи из RedisJobQueue и выполняет их через оркестратор.
+    Память под задачу резервируется до того, как задача займет слот полосы.
+    По SIGTERM перестает брать новые задачи, дожидается текущих (drain_timeout_s)
+    и возвращает в очередь то, что не успело завершиться или еще ждет памяти.
+    """
+
+    def __init__(
+        self,
+        queue: RedisJobQueue,
+        orchestrator: OrchestratorService,
+        redis_client: Redis,
+        config: WorkerSettings | None = None,
+        lanes: SchedulerSettings | None = None,
+    ):
+        self._queue = queue
+        self._orchestrator = orchestrator
+        self._redis = redis_client
+        self._cfg = config or settings.worker
+        self._lanes = lanes or settings.scheduler
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid4().hex[:6]}"
+        self._stopping = asyncio.Event()
+        self._running: dict[UUID, tuple[asyncio.Task, ParseJob]] = {}
+        # Взятые задачи, ждущие памяти: doc_id -> ожидание (отменяется сообщением об отмене)
+        self._reserving: dict[UUID, asyncio.Task] = {}
+
+    def request_stop(self) -> None:
+        """Вызывается из обработчика SIGTERM/SIGINT."""
+        if not self._stopping.is_set():
+            print(f"[Worker {self.worker_id}] Stop requested, draining...")
+            self._stopping.set()
+            # Задачи, еще ждущие памяти или слота, не начаты — они вернутся в очередь
+            for doc_id in list(self._reserving):
+                self._reserving.pop(doc_id).cancel()
+
+    # -----------------------------------------------------------------
+    async def run(self) -> None:
+        await self._queue.heartbeat(self.worker_id, self._cfg.heartbeat_ttl_s)
+        recovered = await self._queue.recover_orphans()
+        if recovered:
+            print(f"[Worker {self.worker_id}] Requeued {recovered} job(s) of dead workers")
+
+        background = [
+            asyncio.create_task(self._heartbeat_loop()),
+            asyncio.create_task(self._cancel_listener()),
+        ]
+        runners: list[asyncio.Task] = []
+        for lane, count in ((HEAVY_LANE, self._lanes.heavy_workers), (LIGHT_LANE, self._lanes.light_workers)):
+            slots = asyncio.Semaphore(max(1, count))
+            # Исполнителей вдвое больше слотов: пока одни выполняют задачи,
+            # другие ждут памяти под следующие, не занимая слот
+            runners.extend(asyncio.create_task(self._runner(lane, slots)) for _ in range(2 * max(1, count)))
+        print(f"[Worker {self.worker_id}] Started: {len(runners) // 2} slot(s)")
+
+        await self._stopping.wait()
+        await self._drain(runners)
+
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+        # Heartbeat больше не нужен: inflight пуст, задачи вернулись в очередь
+        await self._redis.delete(f"parsing_worker:{self.worker_id}")
+        print(f"[Worker {self.worker_id}] Stopped")
+
+    async def _drain(self, runners: list[asyncio.Task]) -> None:
+        _, pending = await asyncio.wait(runners, timeout=self._cfg.drain_timeout_s)
+        if not pending:
+            return
+        print(f"[Worker {self.worker_id}] Drain timeout, handing off {len(self._running)} job(s)")
+        for task, _ in list(self._running.values()):
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    # -----------------------------------------------------------------
+    async def _runner(self, lane: str, slots: asyncio.Semaphore) -> None:
+        while not self._stopping.is_set():
+            # Задачу забираем, только когда есть свободный слот: иначе она ждала бы памяти
+            # у этого воркера, хотя ее мог бы взять другой
+            async with slots:
+                pass
+            if self._stopping.is_set():
+                break
+            job = await self._queue.claim(lane, self.worker_id)
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), self._cfg.poll_interval_s)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            reservation = await self._admit(job, slots)
+            if reservation is None:
+                if self._stopping.is_set():
+                    # Воркер останавливается, а задача так и не начата — ее возьмет другой воркер
+                    await self._queue.requeue(job, self.worker_id)
+                else:
+                    await self._orchestrator.fail_job(job.doc_id, JobCancelled("Cancelled before start"))
+                    await self._queue.ack(self.worker_id, job.doc_id)
+                continue
+            try:
+                await self._run(job, reservation)
+            finally:
+                slots.release()
+                await self._orchestrator.release_memory(reservation)
+
+    async def _admit(self, job: ParseJob, slots: asyncio.Semaphore) -> Reservation | None:
+        """
+        Резервирует память под задачу, затем занимает слот полосы: ждущая памяти задача слот не держит.
+        None — задачу отменили или воркер останавливается, пока она ждала.
+        """
+        if await self._queue.is_cancelled(job.doc_id):
+            return None
+
+        async def wait() -> Reservation:
+            reservation = await self._orchestrator.reserve_memory(job.doc_id, job.file_name, job.file_size)
+            try:
+                await slots.acquire()
+            except BaseException:
+                await self._orchestrator.release_memory(reservation)
+                raise
+            return reservation
+
+        waiter = asyncio.create_task(wait())
+        self._reserving[job.doc_id] = waiter
+        try:
+            return await waiter
+        except asyncio.CancelledError:
+            # Отменяя ожидание, воркер сначала снимает его с учета. Ожидание осталось
+            # на учете — значит, отменили сам исполнитель
+            if self._reserving.get(job.doc_id) is waiter:
+                raise
+            return None
+        finally:
+            if self._reserving.get(job.doc_id) is waiter:
+                del self._reserving[job.doc_id]
+
+    async def _run(self, job: ParseJob, reservation: Reservation) -> None:
+        task = asyncio.create_task(
+            self._orchestrator.process_document(
+                doc_id=job.doc_id, file_name=job.file_name,
+                parse_images=job.parse_images, timeout_s=job.timeout_s, reservation=reservation,
+            )
+        )
+        self._running[job.doc_id] = (task, job)
+        # Даем задаче зарегистрироваться в оркестраторе и проверяем отмену,
+        # пришедшую, пока задача лежала во inflight: сообщение из канала могло потеряться
+        await asyncio.sleep(0)
+        if await self._queue.is_cancelled(job.doc_id):
+            self._orchestrator.cancel(job.doc_id)
+        try:
+            # shield: отмена исполнителя при drain не должна сразу обрывать задачу
+            await asyncio.shield(task)
+            await self._queue.ack(self.worker_id, job.doc_id)
+        except asyncio.CancelledError:
+            # Задача прервана при остановке воркера — отдаем ее другому воркеру
+            await self._queue.requeue(job, self.worker_id)
+        except Exception as e:
+            print(f"[Worker {self.worker_id}] Unexpected error for doc_id={job.doc_id}: {type(e).__name__}: {e}")
+            await self._queue.ack(self.worker_id, job.doc_id)
+        finally:
+            self._running.pop(job.doc_id, None)
+
+    async def _heartbeat_loop(self) -> None:
+        while True:
+            try:
+                await self._queue.heartbeat(self.worker_id, self._cfg.heartbeat_ttl_s)
+                # Воркер мог погибнуть, пока мы работали: его задачи подбираем сразу, а не при следующем старте
+                recovered = await self._queue.recover_orphans()
+                if recovered:
+                    print(f"[Worker {self.worker_id}] Requeued {recovered} job(s) of dead workers")
+            except Exception as e:
+                print(f"[Worker {self.worker_id}] Heartbeat failed: {type(e).__name__}: {e}")
+            await asyncio.sleep(self._cfg.heartbeat_ttl_s / 3)
+
+    async def _cancel_listener(self) -> None:
+        pubsub = self._redis.pubsub()
+        await pubsub.subscribe(CANCEL_CHANNEL)
+        try:
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                try:
+                    doc_id = UUID(message["data"])
+                except ValueError:
+                    continue
+                # Задачу выполняет ровно один воркер, остальные сообщение игнорируют
+                if not self._orchestrator.cancel(doc_id) and doc_id in self._reserving:
+                    self._reserving.pop(doc_id).cancel()
+        finally:
+            await pubsub.unsubscribe(CANCEL_CHANNEL)
+            await pubsub.close()
@@ -0,0 +1,33 @@
+# src/worker.py
+"""
+Роль воркера: загружает модели и выполняет задачи из очереди Redis.
+Запуск: python -m src.worker
+"""
+import asyncio
+import signal
+
+from .core.config import settings
+from .core.lifespan import create_orchestrator, create_redis
+from .services.job_queue import RedisJobQueue
+from .services.worker import QueueWorker
+
+
+async def main() -> None:
+    redis_client = create_redis()
+    orchestrator = create_orchestrator(redis_client)
+    worker = QueueWorker(RedisJobQueue(redis_client), orchestrator, redis_client)
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, worker.request_stop)
+
+    try:
+        await worker.run()
+    finally:
+        await orchestrator.close()
+        await redis_client.close()
+
+
+if __name__ == "__main__":
+    print(f"Starting parser worker (drain timeout {settings.worker.drain_timeout_s} s)...")
+    asyncio.run(main())
@@ -0,0 +1,135 @@
+"""MemoryAdmission: бюджет, уточнение резерва после скачивания и общая модель памяти в Redis (fakeredis)."""
+import asyncio
+
+import fakeredis.aioredis
+
+from src.core.config import AdmissionSettings
+from src.services.admission import MEMORY_MODEL_KEY, MemoryAdmission
+
+MB = 1024 * 1024
+
+
+def _admission(redis=None, **overrides) -> MemoryAdmission:
+    return MemoryAdmission(redis, AdmissionSettings(**{"budget_mb": 1000, "model_reload_s": 0, **overrides}))
+
+
+async def _blocked(task: asyncio.Task) -> bool:
+    await asyncio.sleep(0.05)
+    return not task.done()
+
+
+def test_estimate_includes_file_size():
+    admission = _admission()
+    # (50 + 10 * 10) * 1.2 + 10 МБ самого файла
+    assert admission.estimate_mb(".docx", 10 * MB) == 190.0
+
+
+def test_job_waits_until_estimate_fits():
+    async def scenario():
+        admission = _admission()
+        first = await admission.acquire(".xlsx", 10 * MB)  # 790 МБ
+        second = asyncio.create_task(admission.acquire(".xlsx", 10 * MB))
+        assert await _blocked(second)
+        await admission.release(first)
+        await admission.release(await second)
+        assert admission.snapshot()["in_use_mb"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_single_job_is_admitted_even_over_budget():
+    async def scenario():
+        admission = _admission()
+        res = await admission.acquire(".pdf", 500 * MB)
+        assert res.estimate_mb > admission.budget_mb
+        await admission.release(res)
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_wakes_the_queue():
+    async def scenario():
+        admission = _admission(starvation_s=0)
+        running = await admission.acquire(".xlsx", 10 * MB)
+        starving = asyncio.create_task(admission.acquire(".xlsx", 10 * MB))
+        assert await _blocked(starving)
+        # Пока старейший ожидающий голодает, мелкая задача его не обгоняет
+        small = asyncio.create_task(admission.acquire(".txt", MB))
+        assert await _blocked(small)
+        starving.cancel()
+        await asyncio.sleep(0.05)
+        assert small.done()
+        assert admission.snapshot()["waiting"] == 0
+        await admission.release(running)
+        await admission.release(await small)
+
+    asyncio.run(scenario())
+
+
+def test_small_size_hint_does_not_bypass_budget():
+    async def scenario():
+        admission = _admission()
+        # Клиент не прислал размер: до скачивания резерв — только базовая стоимость формата
+        reservations = [await admission.acquire(".xlsx", 0) for _ in range(3)]
+        for res in reservations:
+            await admission.start(res)
+        resized = [
+            asyncio.create_task(admission.resize(res, ".xlsx", 200 * MB)) for res in reservations
+        ]
+        await asyncio.sleep(0.05)
+        # Настоящий файл — 200 МБ: в бюджет помещается только одна задача за раз
+        assert sum(t.done() for t in resized) == 1
+        assert admission.snapshot()["active"] == 1
+        for _ in reservations:
+            done = next(i for i, t in enumerate(resized) if t.done() and reservations[i] in admission._active)
+            await admission.release(reservations[done])
+            await asyncio.sleep(0.05)
+        assert all(t.done() for t in resized)
+        assert admission.snapshot()["in_use_mb"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_started_job_revokes_reservations_of_jobs_waiting_for_a_slot():
+    async def scenario():
+        admission = _admission()
+        running = await admission.acquire(".xlsx", 0)
+        await admission.start(running)
+        # Вторая задача зарезервировала память, но ждет слота, который держит первая
+        pending = await admission.acquire(".xlsx", 0)
+        await asyncio.wait_for(admission.resize(running, ".xlsx", 13 * MB), 1)
+        assert pending not in admission._active
+        await admission.release(running)
+        # Получив слот, вторая задача резервирует память заново
+        await asyncio.wait_for(admission.start(pending), 1)
+        assert pending in admission._active
+        await admission.release(pending)
+        assert admission.snapshot()["in_use_mb"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_model_learns_with_bounded_step_and_merges_across_workers():
+    async def scenario():
+        redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        first, second = _admission(redis), _admission(redis)
+        for admission in (first, second):
+            res = await admission.acquire(".docx", 10 * MB)
+            # Пик много меньше оценки: оценка падает не больше чем на max_step_down
+            res.observed_mb = 1.0
+            await admission.release(res)
+        assert await redis.hget(MEMORY_MODEL_KEY, ".docx") == "0.8100"
+        await first.acquire(".txt", 0)
+        assert first.snapshot()["multipliers"][".docx"] == 0.81
+
+    asyncio.run(scenario())
+
+
+def test_reservation_without_observation_does_not_learn():
+    async def scenario():
+        redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        admission = _admission(redis)
+        await admission.release(await admission.acquire(".pdf", 10 * MB))
+        assert await redis.hgetall(MEMORY_MODEL_KEY) == {}
+
+    asyncio.run(scenario())
@@ -0,0 +1,123 @@
+"""RedisJobQueue: одна задача на документ, отмена, подтверждение и возврат задач упавших воркеров (fakeredis)."""
+import asyncio
+import json
+from uuid import uuid4
+
+import fakeredis.aioredis
+
+from src.core.config import SchedulerSettings
+from src.services.job_queue import CANCEL_CHANNEL, JOB_KEY, RedisJobQueue
+from src.services.scheduler import LIGHT_LANE
+
+
+def _queue() -> tuple:
+    redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    return redis, RedisJobQueue(redis, SchedulerSettings())
+
+
+async def _status(redis, doc_id) -> dict | None:
+    raw = await redis.get(f"parsing_status:{doc_id}")
+    return json.loads(raw) if raw else None
+
+
+def test_resubmit_replaces_queued_job():
+    async def scenario():
+        redis, queue = _queue()
+        doc_id = uuid4()
+        await queue.submit(doc_id, "a.txt", priority=0)
+        await queue.submit(doc_id, "a.txt", priority=5)
+        assert await queue.sizes() == {"heavy": 0, "light": 1}
+        job = await queue.claim(LIGHT_LANE, "w1")
+        assert job.doc_id == doc_id and job.priority == 5
+        assert await queue.claim(LIGHT_LANE, "w1") is None
+
+    asyncio.run(scenario())
+
+
+def test_cancel_queued_job():
+    async def scenario():
+        redis, queue = _queue()
+        doc_id = uuid4()
+        await queue.submit(doc_id, "a.txt")
+        assert await queue.cancel(doc_id)
+        assert await queue.sizes() == {"heavy": 0, "light": 0}
+        assert (await _status(redis, doc_id))["status"] == "FAILURE"
+        assert not await queue.cancel(doc_id)
+        # Новая постановка снимает отмену
+        await queue.submit(doc_id, "a.txt")
+        assert not await queue.is_cancelled(doc_id)
+
+    asyncio.run(scenario())
+
+
+def test_cancel_running_job_signals_worker():
+    async def scenario():
+        redis, queue = _queue()
+        pubsub = redis.pubsub()
+        await pubsub.subscribe(CANCEL_CHANNEL)
+        doc_id = uuid4()
+        await queue.submit(doc_id, "a.txt")
+        await queue.claim(LIGHT_LANE, "w1")
+        assert await queue.cancel(doc_id)
+        assert await queue.is_cancelled(doc_id)
+        messages = [await pubsub.get_message(ignore_subscribe_messages=True, timeout=0.1) for _ in range(3)]
+        assert [m["data"] for m in messages if m] == [str(doc_id)]
+
+    asyncio.run(scenario())
+
+
+def test_cancel_stops_running_copy_of_resubmitted_document():
+    async def scenario():
+        redis, queue = _queue()
+        doc_id = uuid4()
+        await queue.submit(doc_id, "a.txt")
+        await queue.claim(LIGHT_LANE, "w1")
+        # Документ выполняется и одновременно снова стоит в очереди
+        await queue.submit(doc_id, "a.txt")
+        assert await queue.cancel(doc_id)
+        assert await queue.sizes() == {"heavy": 0, "light": 0}
+        # Воркер должен остановить и выполняющуюся копию
+        assert await queue.is_cancelled(doc_id)
+
+    asyncio.run(scenario())
+
+
+def test_ack_keeps_resubmitted_job_cancellable():
+    async def scenario():
+        redis, queue = _queue()
+        doc_id = uuid4()
+        await queue.submit(doc_id, "a.txt")
+        await queue.claim(LIGHT_LANE, "w1")
+        await queue.submit(doc_id, "a.txt")
+        await queue.ack("w1", doc_id)
+        assert await redis.get(JOB_KEY.format(doc_id=doc_id)) is not None
+        assert await queue.cancel(doc_id)
+        assert await queue.sizes() == {"heavy": 0, "light": 0}
+
+        other = uuid4()
+        await queue.submit(other, "b.txt")
+        await queue.claim(LIGHT_LANE, "w1")
+        await queue.ack("w1", other)
+        assert await redis.get(JOB_KEY.format(doc_id=other)) is None
+        assert not await queue.cancel(other)
+
+    asyncio.run(scenario())
+
+
+def test_recover_orphans_requeues_jobs_of_dead_workers():
+    async def scenario():
+        redis, queue = _queue()
+        alive, dead = uuid4(), uuid4()
+        await queue.submit(alive, "a.txt")
+        await queue.claim(LIGHT_LANE, "alive")
+        await queue.submit(dead, "b.txt")
+        await queue.claim(LIGHT_LANE, "dead")
+        await queue.heartbeat("alive", ttl=60)
+
+        assert await queue.recover_orphans() == 1
+        job = await queue.claim(LIGHT_LANE, "alive")
+        assert job.doc_id == dead
+        assert (await _status(redis, dead))["stage"] == "QUEUED"
+        assert await queue.recover_orphans() == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,164 @@
+"""BatchingPredictor на CPU: заглушка вместо модели surya, Marker и torch не нужны."""
+import threading
+import time
+from uuid import uuid4
+
+import pytest
+
+from src.core.config import InferenceSettings
+from src.core.limits import JobCancelled, JobContext, job_scope
+from src.parsers.marker_pool import BatchingPredictor, CheckedPredictor, wrap_models
+
+
+class StubPredictor:
+    """Записывает размеры батчей и возвращает по одному результату на элемент."""
+
+    def __init__(self, delay_s: float = 0.0, per_item: bool = True):
+        self.batches: list[int] = []
+        self.device = "cpu"
+        self._delay_s = delay_s
+        self._per_item = per_item
+
+    def __call__(self, images, languages=None, *, mode="full", batch_size=None):
+        self.batches.append(len(images))
+        time.sleep(self._delay_s)
+        if not self._per_item:
+            return {"count": len(images)}
+        langs = languages or [None] * len(images)
+        return [(image, lang, mode) for image, lang in zip(images, langs)]
+
+
+def _call_from_threads(predictor, calls):
+    """Запускает вызовы одновременно (как разные документы) и возвращает результаты по порядку вызовов."""
+    results: list = [None] * len(calls)
+    barrier = threading.Barrier(len(calls))
+
+    def run(idx, args, kwargs):
+        barrier.wait()
+        results[idx] = predictor(*args, **kwargs)
+
+    threads = [threading.Thread(target=run, args=(i, a, k)) for i, (a, k) in enumerate(calls)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=10)
+    return results
+
+
+def test_concurrent_calls_are_merged_into_full_batches():
+    stub = StubPredictor()
+    predictor = BatchingPredictor(stub, name="stub", batch_size=6, max_wait_s=1.0)
+    calls = [(([f"doc{d}-p{p}" for p in range(3)],), {}) for d in range(6)]
+
+    results = _call_from_threads(predictor, calls)
+
+    assert sorted(stub.batches) == [6, 6, 6]
+    for d, result in enumerate(results):
+        assert result == [(f"doc{d}-p{p}", None, "full") for p in range(3)]
+
+
+def test_uneven_calls_never_exceed_batch_size():
+    stub = StubPredictor()
+    predictor = BatchingPredictor(stub, name="stub", batch_size=6, max_wait_s=0.2)
+    sizes = [6, 3, 3, 2, 1]
+    calls = [(([f"doc{d}-p{p}" for p in range(n)],), {}) for d, n in enumerate(sizes)]
+
+    results = _call_from_threads(predictor, calls)
+
+    assert sum(stub.batches) == sum(sizes)
+    assert max(stub.batches) <= 6
+    for d, (n, result) in enumerate(zip(sizes, results)):
+        assert [item for item, _, _ in result] == [f"doc{d}-p{p}" for p in range(n)]
+
+
+def test_per_item_arguments_are_concatenated_with_items():
+    stub = StubPredictor()
+    predictor = BatchingPredictor(stub, name="stub", batch_size=4, max_wait_s=1.0)
+    calls = [
+        ((["a1", "a2"], ["ru", "ru"]), {}),
+        ((["b1", "b2"], ["en", "en"]), {}),
+    ]
+
+    results = _call_from_threads(predictor, calls)
+
+    assert stub.batches == [4]
+    assert results[0] == [("a1", "ru", "full"), ("a2", "ru", "full")]
+    assert results[1] == [("b1", "en", "full"), ("b2", "en", "full")]
+
+
+def test_calls_with_different_options_are_not_merged():
+    stub = StubPredictor()
+    predictor = BatchingPredictor(stub, name="stub", batch_size=8, max_wait_s=0.2)
+    calls = [
+        ((["a1", "a2"],), {"mode": "full"}),
+        ((["b1", "b2"],), {"mode": "fast"}),
+    ]
+
+    results = _call_from_threads(predictor, calls)
+
+    assert stub.batches == [2, 2]
+    assert results[0] == [("a1", None, "full"), ("a2", None, "full")]
+    assert results[1] == [("b1", None, "fast"), ("b2", None, "fast")]
+
+
+def test_non_per_item_result_falls_back_to_single_calls():
+    stub = StubPredictor(per_item=False)
+    predictor = BatchingPredictor(stub, name="stub", batch_size=4, max_wait_s=1.0)
+    calls = [((["a1", "a2"],), {}), ((["b1", "b2"],), {})]
+
+    results = _call_from_threads(predictor, calls)
+
+    # Один объединенный вызов, затем по вызову на документ
+    assert stub.batches == [4, 2, 2]
+    assert results == [{"count": 2}, {"count": 2}]
+
+
+def test_errors_reach_every_caller_of_the_batch():
+    class Failing(StubPredictor):
+        def __call__(self, images, *args, **kwargs):
+            raise RuntimeError("model failed")
+
+    predictor = BatchingPredictor(Failing(), name="stub", batch_size=4, max_wait_s=0.2)
+    with pytest.raises(RuntimeError, match="model failed"):
+        predictor(["a1"])
+
+
+def test_non_list_calls_and_attributes_pass_through():
+    stub = StubPredictor(per_item=False)
+    predictor = BatchingPredictor(stub, name="stub", batch_size=4, max_wait_s=0.2)
+
+    assert predictor.device == "cpu"
+    predictor.device = "cuda"
+    assert stub.device == "cuda"
+    # Вызов не со списком элементов идет в модель напрямую, без батчинга
+    assert predictor("abc") == {"count": 3}
+    assert stub.batches == [3]
+
+
+def test_wrap_models_wraps_only_configured_models():
+    models = {"layout_model": StubPredictor(), "texify_model": StubPredictor()}
+    config = InferenceSettings(batched_models=["layout_model"], batch_size=None)
+
+    wrapped = wrap_models(models, config, "cpu")
+
+    assert isinstance(wrapped["layout_model"], BatchingPredictor)
+    assert wrapped["layout_model"]._batch_size == 8
+    assert type(wrapped["texify_model"]) is CheckedPredictor
+    assert wrapped["texify_model"]._predictor is models["texify_model"]
+    unbatched = wrap_models(models, InferenceSettings(enabled=False), "cpu")
+    assert all(type(m) is CheckedPredictor for m in unbatched.values())
+
+
+def test_model_calls_stop_when_job_is_cancelled():
+    stub = StubPredictor()
+    predictor = BatchingPredictor(stub, name="stub", batch_size=4, max_wait_s=0.2)
+    ctx = JobContext(doc_id=uuid4())
+
+    with job_scope(ctx):
+        assert predictor(["a1"]) == [("a1", None, "full")]
+        ctx.cancelled.set()
+        with pytest.raises(JobCancelled):
+            predictor(["a2"])
+        with pytest.raises(JobCancelled):
+            CheckedPredictor(stub)(["a3"])
+    assert stub.batches == [1]
@@ -0,0 +1,37 @@
+"""Порядок задач внутри полосы: приоритет, стоимость и старение."""
+from uuid import uuid4
+
+from src.core.config import SchedulerSettings
+from src.services.scheduler import HEAVY_LANE, ParseJob
+
+CONFIG = SchedulerSettings(cost_wait_s=1.0, starvation_s=120.0)
+
+
+def _job(cost: float, submitted_at: float, priority: int = 0, seq: int = 0) -> ParseJob:
+    return ParseJob(
+        doc_id=uuid4(), file_name="a.pdf", priority=priority, cost=cost,
+        lane=HEAVY_LANE, seq=seq, submitted_at=submitted_at,
+    )
+
+
+def test_cheaper_job_goes_first_when_submitted_together():
+    big, small = _job(cost=450, submitted_at=1000), _job(cost=3, submitted_at=1000, seq=1)
+    assert small.sort_key(CONFIG) < big.sort_key(CONFIG)
+
+
+def test_big_job_is_not_overtaken_after_starvation_timeout():
+    big = _job(cost=450, submitted_at=1000)
+    # Через 60 с дешевая задача еще обгоняет крупную, через 121 с — уже нет
+    assert _job(cost=3, submitted_at=1060, seq=1).sort_key(CONFIG) < big.sort_key(CONFIG)
+    assert big.sort_key(CONFIG) < _job(cost=0.5, submitted_at=1121, seq=2).sort_key(CONFIG)
+
+
+def test_priority_outranks_aging():
+    old = _job(cost=450, submitted_at=0)
+    urgent = _job(cost=450, submitted_at=10_000, priority=1, seq=1)
+    assert urgent.sort_key(CONFIG) < old.sort_key(CONFIG)
+
+
+def test_submitted_at_survives_serialization():
+    job = _job(cost=5, submitted_at=1234.5)
+    assert ParseJob.from_dict(job.to_dict()).due_at(CONFIG) == job.due_at(CONFIG)
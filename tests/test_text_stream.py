@@ -0,0 +1,68 @@
+"""Определение кодировки и потоковое чтение текстовых файлов."""
+import asyncio
+from io import BytesIO
+from uuid import uuid4
+
+from src.core.config import TextSettings
+from src.models import ParseResult, TextLines
+from src.parsers.text_stream import iter_text_lines, sniff_encoding
+from src.parsers.txt_parser import TxtParser
+
+
+def test_utf8_and_bom():
+    assert sniff_encoding("Привет, мир".encode("utf-8"), final=True) == "utf-8"
+    assert sniff_encoding("﻿текст".encode("utf-8"), final=True) == "utf-8-sig"
+
+
+def test_csv_with_latin_header_and_cyrillic_values_is_cp1251():
+    data = "id;name;city\n1;Иванов Пётр;Москва\n2;Сидорова Анна;Казань\n".encode("cp1251")
+    assert sniff_encoding(data, final=True) == "cp1251"
+
+
+def test_short_cyrillic_words_are_cp1251():
+    assert sniff_encoding("ООО ТД РФ ИНН".encode("cp1251"), final=True) == "cp1251"
+
+
+def test_latin1_text_stays_latin1():
+    data = "Le café est très naïve, garçon. Über größer".encode("latin-1")
+    assert sniff_encoding(data, final=True) == "latin-1"
+
+
+def test_crlf_split_between_chunks_gives_no_empty_line():
+    data = b"first\r\nsecond\r\nthird"
+    # \r и \n попадают в разные куски при любом размере куска
+    for chunk_size in range(1, len(data) + 1):
+        lines = list(iter_text_lines(BytesIO(data), "utf-8", chunk_size=chunk_size))
+        assert lines == ["first", "second", "third"], chunk_size
+
+
+def test_multibyte_character_split_between_chunks():
+    data = "абв\nгде".encode("utf-8")
+    assert list(iter_text_lines(BytesIO(data), "utf-8", chunk_size=1)) == ["абв", "где"]
+
+
+def test_long_line_is_cut_by_max_line_length():
+    data = b"x" * 25 + b"\nshort\n"
+    lines = list(iter_text_lines(BytesIO(data), "utf-8", chunk_size=4, max_line_length=10))
+    assert lines == ["x" * 10, "x" * 10, "x" * 5, "short"]
+
+
+def test_blank_lines_are_collapsed():
+    data = b"a\n\n\n\nb\n"
+    assert list(iter_text_lines(BytesIO(data), "utf-8", collapse_blank_lines=True)) == ["a", "", "b"]
+
+
+def test_txt_parser_returns_compact_lines():
+    data = "\n".join(f"строка {i}" for i in range(TextLines.BLOCK * 2 + 5)).encode("cp1251")
+    parser = TxtParser(TextSettings(chunk_size=1000))
+
+    result = asyncio.run(parser.parse(doc_id=uuid4(), file_content=BytesIO(data)))
+
+    assert isinstance(result.lines, TextLines)
+    assert len(result.lines) == TextLines.BLOCK * 2 + 5
+    assert result.lines[-1].content == f"строка {TextLines.BLOCK * 2 + 4}"
+    assert [line.line_no for line in result.lines] == list(range(len(result.lines)))
+    assert result.warnings == ["Decoded as cp1251"]
+    # Контрольная точка сериализует и восстанавливает результат как обычный список строк
+    restored = ParseResult(**result.model_dump())
+    assert [l.content for l in restored.lines] == [l.content for l in result.lines]